@@ -0,0 +1,93 @@
+"""Compression ratio and CPU cost of compressed recordings and csv files, see `genki_wave.compression`
+
+Generates a session of motion data at 400 Hz like `genki_wave.emulator`, with sensor noise added so it doesn't compress
+unrealistically well, and reports for each codec and level:
+    ratio: Uncompressed size / compressed size
+    compress: CPU time to compress, in ms per second of recorded data, i.e. the load on the background thread
+    decompress: Decompression speed in MB/s of uncompressed data
+
+Run from the root of the repository with `python -m benchmarks.compression`
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from dataclasses import replace
+from typing import List
+
+from genki_wave.compression import _compress, _decompress
+from genki_wave.data import DataPackage, Point3d
+from genki_wave.data.enums import DatastreamType
+from genki_wave.data.writing import encode_package
+from genki_wave.emulator import _motion_sample
+from genki_wave.recording import _HEADER, _RECORD, FORMAT_VERSION, MAGIC
+
+CODECS = (("zlib", 1), ("zlib", 6), ("zlib", 9), ("lzma", 0), ("lzma", 6))
+CHUNK_SIZE = 1 << 20
+
+
+def _noisy(p: Point3d, rng: random.Random, scale: float) -> Point3d:
+    return Point3d(p.x + rng.gauss(0, scale), p.y + rng.gauss(0, scale), p.z + rng.gauss(0, scale))
+
+
+def _packages(seconds: float, rate_hz: float) -> List[DataPackage]:
+    rng = random.Random(0)
+    packages = []
+    for i in range(int(seconds * rate_hz)):
+        t = i / rate_hz
+        p = _motion_sample(t, int(t * 1e6), DatastreamType.MOTION_DATA)
+        packages.append(replace(p, gyro=_noisy(p.gyro, rng, 0.5), acc=_noisy(p.acc, rng, 0.01)))
+    return packages
+
+
+def _frame_log(packages: List[DataPackage], rate_hz: float) -> bytes:
+    """The packages as a frame recording, see `FrameRecorder`"""
+    log = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION))
+    for i, package in enumerate(packages):
+        frame = encode_package(package)[:-1]
+        log += _RECORD.pack(int(i / rate_hz * 1e9), len(frame)) + frame
+    return bytes(log)
+
+
+def _csv(packages: List[DataPackage]) -> bytes:
+    f = io.StringIO(newline="")
+    writer = csv.writer(f)
+    writer.writerow(DataPackage.flat_keys())
+    writer.writerows(p.as_flat_tuple() for p in packages)
+    return f.getvalue().encode()
+
+
+def run(name: str, data: bytes, seconds: float) -> None:
+    chunks = [data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    print(f"{name}: {len(data) / 1e6:.1f} MB uncompressed, {len(data) / seconds / 1e3:.1f} kB per second of data")
+    for codec, level in CODECS:
+        start = time.process_time()
+        compressed = [_compress(c, codec, level) for c in chunks]
+        compress_time = time.process_time() - start
+
+        start = time.process_time()
+        for c in compressed:
+            _decompress(c, codec)
+        decompress_time = time.process_time() - start
+
+        ratio = len(data) / sum(len(c) for c in compressed)
+        print(
+            f"    {codec:<5}{level:>3}: ratio {ratio:>5.1f}, compress {compress_time / seconds * 1e3:>6.2f} ms/s, "
+            f"decompress {len(data) / 1e6 / max(decompress_time, 1e-9):>6.0f} MB/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--rate", type=float, default=400.0)
+    args = parser.parse_args()
+
+    packages = _packages(args.seconds, args.rate)
+    run("frame log", _frame_log(packages, args.rate), args.seconds)
+    run("csv", _csv(packages), args.seconds)
+
+
+if __name__ == "__main__":
+    main()
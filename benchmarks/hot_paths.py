@@ -0,0 +1,248 @@
+"""Microbenchmarks for every stage a package passes through, from the raw bytes to a sink
+
+Reports ns/packet and packets/s for each stage, built on the frame fixtures in `tests/constants.py`. The results can
+be saved as JSON and compared against a stored baseline, a stage that got slower than the baseline by more than the
+tolerance is reported as a regression and makes the script exit with a non-zero status.
+
+Run from the root of the repository, e.g.
+    python -m benchmarks.hot_paths --baseline benchmarks/baseline.json
+    python -m benchmarks.hot_paths --output results.json
+    python -m benchmarks.hot_paths --output benchmarks/baseline.json  # Update the baseline
+
+Timings are only comparable between runs in the same environment, so the Python and numpy versions and the machine
+are stored with the results and a baseline from another environment is refused. Regenerate the baseline when moving
+to another one, e.g. with the versions pinned in `requirements.txt`.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import struct
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from cobs import cobs
+
+from genki_wave.callbacks import CsvOutput
+from genki_wave.data import DataPackage
+from genki_wave.data.enums import PackageId, PackageType
+from genki_wave.data.organization import (
+    PackageMetadata,
+    RawDataPackage,
+    SpectrogramDataPackage,
+    decode_data_packages,
+    process_byte_data,
+)
+from genki_wave.data.points import rotate_vector
+from genki_wave.data.writing import create_package_to_write
+from genki_wave.framing import FrameSplitter, cobs_decode_frames
+from genki_wave.protocols import ProtocolAsyncio
+from tests.constants import SERIAL_DATA
+
+CHUNK_SIZES = (16, 128, 1024, 8192)
+# Stream length the chunked stages are measured on, long enough that the setup per repetition doesn't matter
+NUM_STREAM_PACKAGES = 2000
+
+
+def _frames(stream: bytes) -> List[bytes]:
+    # The first and last frames of the fixture are cut off
+    return stream.split(b"\x00")[1:-1]
+
+
+def _synthetic_frame(package_id: PackageId, payload: bytes) -> bytes:
+    metadata = PackageMetadata(type=PackageType.STREAM, id=package_id, payload_size=len(payload))
+    return create_package_to_write(metadata, payload)
+
+
+def _fixtures() -> dict:
+    frames = _frames(b"".join(SERIAL_DATA))
+    decoded = [cobs.decode(frame) for frame in frames]
+    by_id = {}
+    for raw in decoded:
+        by_id.setdefault(PackageMetadata.from_raw_bytes(raw).id, raw)
+
+    # The fixtures only have data packages and button events, the other streamed types are synthesized
+    raw_payload = struct.pack("<6fQ", -4.5, 24.0, -12.25, 0.0, 0.5, 0.75, 10)
+    spectrogram_payload = np.arange(SpectrogramDataPackage._num_floats, dtype="<f4").tobytes() + struct.pack("<Q", 10)
+    by_id[PackageId.RAW_DATA] = cobs.decode(_synthetic_frame(PackageId.RAW_DATA, raw_payload)[:-1])
+    by_id[PackageId.SPECTROGRAM] = cobs.decode(_synthetic_frame(PackageId.SPECTROGRAM, spectrogram_payload)[:-1])
+    assert isinstance(process_byte_data(by_id[PackageId.RAW_DATA]), RawDataPackage)
+
+    data_frames = [f for f, d in zip(frames, decoded) if d[1] == PackageId.DATASTREAM]
+    stream = (b"\x00".join(data_frames) + b"\x00") * (NUM_STREAM_PACKAGES // len(data_frames))
+    return {"frames": frames, "decoded": by_id, "stream": stream, "num_stream_packages": stream.count(b"\x00")}
+
+
+def time_per_call(f: Callable[[], object], repeat: int = 5) -> float:
+    """Best time of `repeat` runs in seconds per call of `f`, with the number of calls per run picked by `timeit`"""
+    timer = timeit.Timer(f)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _result(seconds_per_call: float, packets_per_call: int) -> Dict[str, float]:
+    ns_per_packet = seconds_per_call / packets_per_call * 1e9
+    return {"ns_per_packet": ns_per_packet, "packets_per_s": 1e9 / ns_per_packet}
+
+
+def _bench_protocol(stream: bytes, chunk_size: int, num_packets: int) -> float:
+    chunks = [stream[i : i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+    async def feed_all() -> float:
+        protocol = ProtocolAsyncio()
+        start = time.perf_counter()
+        for chunk in chunks:
+            await protocol.data_received(chunk)
+        elapsed = time.perf_counter() - start
+        assert protocol.queue.qsize() == num_packets, "Expected every package to be decoded"
+        return elapsed
+
+    loop = asyncio.new_event_loop()
+    try:
+        return min(loop.run_until_complete(feed_all()) for _ in range(5))
+    finally:
+        loop.close()
+
+
+def _bench_csv(packages: List[DataPackage]) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        flush_len = 256
+        n = 0
+
+        def write_all():
+            nonlocal n
+            # A fresh file every time, so the file size doesn't grow with the number of repetitions
+            n += 1
+            csv_output = CsvOutput(Path(tmp) / f"bench_{n}.csv", flush_len=flush_len)
+            for package in packages:
+                csv_output._data_handler(package)
+            # Includes the writes on the background thread
+            csv_output.close()
+
+        return time_per_call(write_all, repeat=3)
+
+
+def run_benchmarks() -> Dict[str, Dict[str, float]]:
+    fixtures = _fixtures()
+    frames, decoded = fixtures["frames"], fixtures["decoded"]
+    data_package = process_byte_data(decoded[PackageId.DATASTREAM])
+
+    results = {}
+    results["cobs.decode"] = _result(time_per_call(lambda: [cobs.decode(f) for f in frames]), len(frames))
+
+    for package_id, raw in decoded.items():
+        name = PackageId(package_id).name.lower()
+        results[f"process_byte_data[{name}]"] = _result(time_per_call(lambda: process_byte_data(raw)), 1)
+    raw = decoded[PackageId.DATASTREAM]
+    results["process_byte_data[datastream, lazy]"] = _result(time_per_call(lambda: process_byte_data(raw, True)), 1)
+
+    results["DataPackage.as_flat_dict"] = _result(time_per_call(data_package.as_flat_dict), 1)
+    acc, pose = data_package.acc, data_package.current_pose
+    results["rotate_vector"] = _result(time_per_call(lambda: rotate_vector(acc, pose)), 1)
+
+    stream, num_packets = fixtures["stream"], fixtures["num_stream_packages"]
+    for chunk_size in CHUNK_SIZES:
+        results[f"ProtocolAsyncio.data_received[chunk={chunk_size}]"] = _result(
+            _bench_protocol(stream, chunk_size, num_packets), num_packets
+        )
+
+    results["FrameSplitter.feed"] = _result(time_per_call(lambda: FrameSplitter().feed(stream)), num_packets)
+    results["cobs_decode_frames"] = _result(time_per_call(lambda: cobs_decode_frames(stream)), num_packets)
+    # `decode_data_packages` only creates a view, so it's measured together with the steps leading up to it
+    results["batch decode pipeline"] = _result(
+        time_per_call(lambda: decode_data_packages(cobs_decode_frames(stream).payloads(PackageId.DATASTREAM))),
+        num_packets,
+    )
+
+    packages = [data_package] * 1024
+    results["CsvOutput"] = _result(_bench_csv(packages), len(packages))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns the names of the stages that are more than `tolerance` (relative) slower than in `baseline`"""
+    regressions = []
+    print(f"{'stage':<50}{'ns/packet':>12}{'packets/s':>14}{'baseline':>12}{'change':>9}")
+    for name, result in results.items():
+        ns = result["ns_per_packet"]
+        line = f"{name:<50}{ns:>12.0f}{result['packets_per_s']:>14.0f}"
+        if name in baseline:
+            base_ns = baseline[name]["ns_per_packet"]
+            change = ns / base_ns - 1
+            line += f"{base_ns:>12.0f}{change:>+9.0%}"
+            if change > tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+# The parts of the environment that have to match for timings to be comparable, the platform is only informative
+ENVIRONMENT_KEYS = ("python", "numpy", "machine")
+
+
+def environment() -> Dict[str, str]:
+    """The environment the benchmarks run in, stored with the results"""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def environment_mismatches(current: Dict[str, str], baseline: Dict[str, str]) -> List[str]:
+    """Describes how `baseline` was recorded in a different environment than `current`, empty if it wasn't
+
+    The Python versions only have to match up to the minor version.
+    """
+    mismatches = []
+    for key in ENVIRONMENT_KEYS:
+        value, base_value = current[key], baseline.get(key)
+        if key == "python" and base_value is not None:
+            value, base_value = value.rsplit(".", 1)[0], base_value.rsplit(".", 1)[0]
+        if value != base_value:
+            mismatches.append(f"{key} {base_value} in the baseline, {value} here")
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, default=None, help="Save the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Relative slowdown that counts as a regression, e.g. 0.25"
+    )
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline is not None:
+        report = json.loads(args.baseline.read_text())
+        mismatches = environment_mismatches(environment(), report.get("environment", {}))
+        if mismatches:
+            print(
+                f"Refusing to compare against {args.baseline}, it's from another environment: {'; '.join(mismatches)}"
+            )
+            return 2
+        baseline = report["results"]
+
+    results = run_benchmarks()
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.output is not None:
+        report = {"environment": environment(), "results": results}
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if regressions:
+        print(f"{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
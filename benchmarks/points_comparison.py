@@ -0,0 +1,89 @@
+"""Compares the memory use and construction time of the slotted geometry types against plain frozen dataclasses
+
+Run from the root of the repository with `python -m benchmarks.points_comparison`
+"""
+import math
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+
+from genki_wave.data.points import Point3d, Quaternion, rotate_vector
+
+
+@dataclass(frozen=True)
+class LegacyPoint3d:
+    x: float
+    y: float
+    z: float
+
+
+@dataclass(frozen=True)
+class LegacyQuaternion:
+    w: float
+    x: float
+    y: float
+    z: float
+
+    def __mul__(self, other):
+        w1, x1, y1, z1 = self.w, self.x, self.y, self.z
+        w2, x2, y2, z2 = other.w, other.x, other.y, other.z
+
+        w = w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2
+        x = w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2
+        y = w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2
+        z = w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2
+        return LegacyQuaternion(w, x, y, z)
+
+    def conjugate(self):
+        return LegacyQuaternion(self.w, -self.x, -self.y, -self.z)
+
+    def normalize(self):
+        norm = math.sqrt(sum([el**2 for el in [self.w, self.x, self.y, self.z]]))
+        return LegacyQuaternion(self.w / norm, self.x / norm, self.y / norm, self.z / norm)
+
+
+def legacy_rotate_vector(p: LegacyPoint3d, q: LegacyQuaternion) -> LegacyPoint3d:
+    q = q.normalize()
+    p_rot = q * LegacyQuaternion(0, p.x, p.y, p.z) * q.conjugate()
+    return LegacyPoint3d(p_rot.x, p_rot.y, p_rot.z)
+
+
+def bytes_per_instance(cls, num_values: int, n: int = 100_000) -> float:
+    values = [float(i) for i in range(num_values)]
+    tracemalloc.start()
+    instances = [cls(*values) for _ in range(n)]  # noqa: F841
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Subtract the list holding the instances
+    return (current - 8 * n) / n
+
+
+def ns_per_call(f, n: int = 200_000) -> float:
+    return min(timeit.repeat(f, number=n, repeat=5)) / n * 1e9
+
+
+def main():
+    rows = [
+        ("Point3d()", lambda: LegacyPoint3d(1.0, 2.0, 3.0), lambda: Point3d(1.0, 2.0, 3.0)),
+        ("Quaternion()", lambda: LegacyQuaternion(1.0, 2.0, 3.0, 4.0), lambda: Quaternion(1.0, 2.0, 3.0, 4.0)),
+        (
+            "rotate_vector()",
+            lambda: legacy_rotate_vector(LegacyPoint3d(0.1, 0.2, 0.9), LegacyQuaternion(0.9, 0.1, 0.2, 0.1)),
+            lambda: rotate_vector(Point3d(0.1, 0.2, 0.9), Quaternion(0.9, 0.1, 0.2, 0.1)),
+        ),
+    ]
+
+    print(f"{'':<16}{'legacy':>12}{'slotted':>12}")
+    for name, legacy, slotted in rows:
+        print(f"{name + ' ns':<16}{ns_per_call(legacy):>12.0f}{ns_per_call(slotted):>12.0f}")
+
+    for name, legacy, slotted, num_values in (
+        ("Point3d", LegacyPoint3d, Point3d, 3),
+        ("Quaternion", LegacyQuaternion, Quaternion, 4),
+    ):
+        legacy_bytes, slotted_bytes = bytes_per_instance(legacy, num_values), bytes_per_instance(slotted, num_values)
+        print(f"{name + ' bytes':<16}{legacy_bytes:>12.0f}{slotted_bytes:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
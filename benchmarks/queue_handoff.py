@@ -0,0 +1,94 @@
+"""Compares handing packages from a reader thread to a polling consumer, one at a time versus in bulk
+
+A producer thread puts packages on a schedule, `packages_per_read` at a time like a reader thread that gets several
+packages per read, while the consumer drains the queue every `poll_interval` seconds like `examples/run_threads.py`.
+Reports the time spent in the producer's puts and the consumer's drains per package, and the CPU time of the process.
+
+    legacy: `Queue.put` per package and a drain that calls `get` per package, what `QueueWithPop` used to do
+    bulk: `QueueWithPop.put_many` per read and `QueueWithPop.pop_all`, which swaps out the whole queue at once
+
+Run from the root of the repository with `python -m benchmarks.queue_handoff`
+"""
+import argparse
+import threading
+import time
+from queue import Queue
+from typing import Callable, List
+
+from genki_wave.data.structures import QueueWithPop
+from tests.constants import SERIAL_EXPECTED
+
+
+class _LegacyQueue(Queue):
+    def pop_all(self) -> list:
+        results = []
+        while self.qsize() > 0:
+            results.append(self.get())
+        return results
+
+
+def _legacy_put(q: _LegacyQueue) -> Callable[[list], None]:
+    def put(packages: list) -> None:
+        for package in packages:
+            q.put(package)
+
+    return put
+
+
+def run(name: str, rate_hz: float, seconds: float, packages_per_read: int, poll_interval: float) -> None:
+    q = _LegacyQueue() if name == "legacy" else QueueWithPop()
+    put = _legacy_put(q) if name == "legacy" else q.put_many
+    packages = (SERIAL_EXPECTED * packages_per_read)[:packages_per_read]
+    read_interval = packages_per_read / rate_hz
+
+    put_time, num_put = 0.0, 0
+    done = threading.Event()
+
+    def produce() -> None:
+        nonlocal put_time, num_put
+        next_read = time.perf_counter()
+        end = next_read + seconds
+        while next_read < end:
+            time.sleep(max(0.0, next_read - time.perf_counter()))
+            start = time.perf_counter()
+            put(packages)
+            put_time += time.perf_counter() - start
+            num_put += len(packages)
+            next_read += read_interval
+        done.set()
+
+    drain_time, num_drained = 0.0, 0
+    cpu_start = time.process_time()
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while not done.is_set() or q.qsize():
+        time.sleep(poll_interval)
+        start = time.perf_counter()
+        drained: List = q.pop_all()
+        drain_time += time.perf_counter() - start
+        num_drained += len(drained)
+    producer.join()
+    cpu_time = time.process_time() - cpu_start
+
+    assert num_drained == num_put, "Expected every package to be handed over"
+    print(
+        f"{name:<8}{rate_hz:>8.0f} Hz: put {put_time / num_put * 1e9:>6.0f} ns/package, "
+        f"drain {drain_time / num_drained * 1e9:>6.0f} ns/package, cpu {cpu_time / seconds:>6.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", type=float, nargs="+", default=[400.0, 2000.0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--packages-per-read", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    for rate_hz in args.rates:
+        for name in ("legacy", "bulk"):
+            run(name, rate_hz, args.seconds, args.packages_per_read, args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
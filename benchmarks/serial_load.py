@@ -0,0 +1,42 @@
+"""Load tests the serial path against the emulated device in `genki_wave.emulator`
+
+Streams for a few seconds at each rate and reports how many of the packages sent were received by `ReaderThreadSerial`.
+
+Run from the root of the repository with `python -m benchmarks.serial_load`
+"""
+import argparse
+import time
+
+from genki_wave.data import DataPackage
+from genki_wave.emulator import WaveEmulator
+from genki_wave.threading_runner import ReaderThreadSerial
+
+
+def run(rate_hz: float, seconds: float) -> None:
+    received = 0
+    with WaveEmulator(rate_hz=rate_hz) as emulator:
+        reader_thread = ReaderThreadSerial.from_port(emulator.port)
+        with reader_thread as protocol:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                time.sleep(0.05)
+                received += sum(isinstance(p, DataPackage) for p in protocol.queue.pop_all())
+
+    print(
+        f"{rate_hz:>8.0f} Hz: sent {emulator.num_samples:>7} received {received:>7} "
+        f"({received / max(emulator.num_samples, 1):.1%}), {emulator.num_dropped_bytes} bytes dropped by the pty"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", type=float, nargs="+", default=[400.0, 2000.0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for rate_hz in args.rates:
+        run(rate_hz, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,13 @@ import logging
 
 
 from genki_wave.callbacks import ButtonAndDataPrint, CsvOutput
-from genki_wave.asyncio_runner import run_asyncio_bluetooth, run_asyncio_serial
+from genki_wave.asyncio_runner import run_asyncio_bluetooth, run_asyncio_devices, run_asyncio_replay, run_asyncio_serial
 from genki_wave.discover import run_discover_bluetooth
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--ble-address", type=str)
+    parser.add_argument("--ble-address", type=str, nargs="+", help="One or more addresses to connect to")
     parser.add_argument("--use-serial", action="store_true")
     parser.add_argument("--button", action="store_true", help="Handler that prints the button and the action")
     parser.add_argument(
@@ -19,6 +19,10 @@ def main():
     parser.add_argument(
         "--csv", type=str, default=None, help="Path to the output csv. If none is given no csv is written"
     )
+    parser.add_argument("--replay", type=str, default=None, help="Replay a recording instead of connecting to a device")
+    parser.add_argument(
+        "--replay-speed", type=float, default=1.0, help="Replay speed relative to real time, 0 for as fast as possible"
+    )
     parser.add_argument("--log", type=str, default=None)
     args = parser.parse_args()
     log_level = getattr(logging, args.log.upper() if args.log else "WARNING", logging.WARNING)
@@ -33,7 +37,9 @@ def main():
     if not callbacks:
         print("Warning: no callbacks supplied, the data received won't be processed in any way")
 
-    if args.use_serial:
+    if args.replay is not None:
+        run_asyncio_replay(callbacks, Path(args.replay), args.replay_speed or None)
+    elif args.use_serial:
         run_asyncio_serial(callbacks)
     else:
         if args.ble_address is None:
@@ -41,7 +47,10 @@ def main():
             run_discover_bluetooth()
         else:
             print("Turn off by holding the `TOP` button")
-            run_asyncio_bluetooth(callbacks, args.ble_address, args.enable_spectrogram)
+            if len(args.ble_address) == 1:
+                run_asyncio_bluetooth(callbacks, args.ble_address[0], args.enable_spectrogram)
+            else:
+                run_asyncio_devices(callbacks, args.ble_address, enable_spectrogram=args.enable_spectrogram)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,9 @@
 import asyncio
 import logging
 import signal
-import sys
 from functools import partial
-from typing import Union, List, Callable, Tuple
+from pathlib import Path
+from typing import Awaitable, Union, List, Callable, Optional, Sequence, Tuple
 
 import serial
 from bleak import BleakClient
@@ -17,7 +17,10 @@ from genki_wave.data.writing import (
     get_start_spectrogram_package,
     get_default_api_config_package,
 )
-from genki_wave.protocols import ProtocolAsyncio, ProtocolThread, CommunicateCancel
+from genki_wave.data.enums import OverflowPolicy
+from genki_wave.data.structures import BoundedAsyncQueue
+from genki_wave.protocols import END_OF_STREAM, ProtocolAsyncio, ProtocolThread, CommunicateCancel, TaggedPackage
+from genki_wave.recording import FrameRecorder, ReplayClock, iter_chunks
 from genki_wave.utils import get_serial_port, get_or_create_event_loop
 
 logger = logging.getLogger(__name__)
@@ -55,11 +58,16 @@ def bleak_callback(protocol: ProtocolAsyncio) -> Callable:
     return callback
 
 
-def make_disconnect_callback(comm: CommunicateCancel):
+def make_disconnect_callback(comm: CommunicateCancel, disconnected: asyncio.Event):
+    """Wakes up the producer of a client that disconnects unexpectedly through `disconnected`, see `producer_bluetooth`
+
+    Only the producer of that client fails, so the sessions of other devices in the same event loop carry on.
+    """
+
     def cb(client):
         if not comm.cancel:
             print(f"Client {client.address} disconnected unexpectedly, exiting")
-            sys.exit(1)
+            disconnected.set()
 
     return cb
 
@@ -80,11 +88,13 @@ async def producer_bluetooth(
 
     Note:
         The producer doesn't return a value, but the data gets added to the `protocol` that can be accessed from other
-        parts of the program i.e. some `consumer`
+        parts of the program i.e. some `consumer`. If the device disconnects before the session is cancelled it raises
+        a `ConnectionError`
     """
     print(f"Connecting to wave at address {ble_address}")
     callback = bleak_callback(protocol)
-    async with BleakClient(ble_address, disconnected_callback=make_disconnect_callback(comm)) as client:
+    disconnected = asyncio.Event()
+    async with BleakClient(ble_address, disconnected_callback=make_disconnect_callback(comm, disconnected)) as client:
         await client.start_notify(API_CHAR_UUID, callback)
         await client.write_gatt_char(API_CHAR_UUID, get_device_info_request(), False)
         await client.write_gatt_char(API_CHAR_UUID, get_start_api_package(), False)
@@ -95,14 +105,15 @@ async def producer_bluetooth(
             await client.write_gatt_char(API_CHAR_UUID, get_default_api_config_package(), False)
 
         print("Connected to Wave")
-        while True:
-            # This `while` loop and `asyncio.sleep` statement is some magic that is required to continually fetch
-            # the data from the bluetooth device.
-            await asyncio.sleep(0.1)
-
-            if comm.cancel:
-                print("Recieved a cancel signal, stopping ble client")
-                break
+        # The data arrives through `callback` while the event loop runs, there's nothing to do until cancelled or the
+        # device disconnects
+        waiters = [asyncio.ensure_future(comm.wait()), asyncio.ensure_future(disconnected.wait())]
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+        if not comm.cancel:
+            raise ConnectionError(f"The wave at address {ble_address} disconnected unexpectedly")
+        print("Recieved a cancel signal, stopping ble client")
 
         await client.stop_notify(API_CHAR_UUID)
 
@@ -118,30 +129,126 @@ async def producer_serial(protocol: ProtocolAsyncio, comm: CommunicateCancel, se
 
     Note:
         The producer doesn't return a value, but the data gets added to the `protocol` that can be accessed from other
-        parts of the program i.e. some `consumer`
+        parts of the program i.e. some `consumer`. If nothing arrives for 10 seconds the session is cancelled, or with
+        a `protocol` for one of several devices it raises a `TimeoutError`
     """
     reader, writer = await open_serial_connection(url=serial_port, baudrate=BAUDRATE, parity=serial.PARITY_EVEN)
     writer.write(get_start_api_package())
+    if await _until_cancelled(comm, _read_serial(protocol, comm, reader)):
+        print("Recieved a cancel signal, stopping serial connection")
+
+
+async def _read_serial(protocol: ProtocolAsyncio, comm: CommunicateCancel, reader: asyncio.StreamReader) -> None:
     while True:
         # The number of bytes read here is an arbitrary power of 2 on the order of a size of a single package
         try:
             packet = await asyncio.wait_for(reader.read(n=128), timeout=10)
         except asyncio.TimeoutError:
+            if protocol.device is not None:
+                # One of several devices, only its stream ends, see `_isolated_producer`
+                raise TimeoutError(f"Failed to read any data from {protocol.device} for 10 seconds")
             print("Failed to read any data for 10 seconds, exiting producer")
             comm.cancel = True
             break
 
         await protocol.data_received(packet)
 
-        if comm.cancel:
-            print("Recieved a cancel signal, stopping serial connection")
+
+async def producer_replay(
+    protocol: ProtocolAsyncio, comm: CommunicateCancel, path: Path, speed: Optional[float] = 1.0
+) -> None:
+    """Replays a recording made with `FrameRecorder` and passes it to the `protocol`, like a live device would
+
+    Once the recording ends `END_OF_STREAM` is put on the queue of the protocol, which stops the `consumer`. The
+    packages get the host times of when they were recorded, not of when they are replayed.
+
+    Args:
+        protocol: An object that knows how to process the raw data sent from the Wave ring into a structured format
+                  and passes it along between `producer` and `consumer`.
+        comm: An object that allows `producer` and `consumer` to communicate when to cancel the process
+        path: The recording to replay
+        speed: How many times faster than real time to replay, using the recorded arrival times. `None` replays as
+               fast as possible
+    """
+    if await _until_cancelled(comm, _replay(protocol, path, speed)):
+        print("Recieved a cancel signal, stopping replay")
+
+
+async def _replay(protocol: ProtocolAsyncio, path: Path, speed: Optional[float]) -> None:
+    clock = ReplayClock(speed)
+    for time_ns, chunk in iter_chunks(path):
+        # Also lets the consumer run when replaying as fast as possible
+        await asyncio.sleep(clock.delay(time_ns))
+        await protocol.data_received(chunk, time_ns)
+
+    await protocol.queue.put(END_OF_STREAM)
+
+
+async def _until_cancelled(comm: CommunicateCancel, coro: Awaitable) -> bool:
+    """Runs `coro` until it's done or `comm` is cancelled, whichever comes first
+
+    `coro` runs as a separate task, so a cancel interrupts it right away wherever it's waiting, e.g. on a read, a sleep
+    or a full queue, without cancelling the caller.
+
+    Returns:
+        `True` if `coro` was interrupted by a cancel, `False` if it finished
+    """
+    task = asyncio.ensure_future(coro)
+    comm.on_cancel(task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        if not comm.cancel:
+            raise
+        return True
+    return False
+
+
+async def _get_batch(queue: asyncio.Queue, max_batch_size: int, max_wait: float) -> list:
+    """Waits for a package and returns it together with everything else available, up to `max_batch_size` packages
+
+    If the batch isn't full it waits up to `max_wait` seconds for more packages to arrive.
+    """
+    batch = [await asyncio.wait_for(queue.get(), timeout=10)]
+    deadline = asyncio.get_running_loop().time() + max_wait
+    while len(batch) < max_batch_size:
+        try:
+            batch.append(queue.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
             break
+    return batch
+
+
+def _deliver(callbacks: Union[List[WaveCallback], Tuple[WaveCallback]], packages: list, batched: bool) -> None:
+    if not batched:
+        for package in packages:
+            for callback in callbacks:
+                callback(package)
+    elif packages:
+        for callback in callbacks:
+            if isinstance(callback, WaveCallback):
+                callback(packages)
+            else:
+                for package in packages:
+                    callback(package)
 
 
 async def consumer(
     protocol: ProtocolAsyncio,
     comm: CommunicateCancel,
     callbacks: Union[List[WaveCallback], Tuple[WaveCallback]],
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
+    num_devices: int = 1,
 ) -> None:
     """Consumes the data from a producer via a protocol
 
@@ -150,22 +257,89 @@ async def consumer(
                   and passes it along between `producer` and `consumer`.
         comm: An object that allows `producer` and `consumer` to communicate when to cancel the process
         callbacks: A list/tuple of callbacks that handle the data passed from the wave ring when available
+        max_batch_size: If given, everything available on the queue, up to `max_batch_size` packages, is passed to a
+                        `WaveCallback` as a list, see `WaveCallback._batch_handler`. Otherwise, and for callbacks that
+                        aren't a `WaveCallback`, packages are passed one at a time
+        max_batch_wait: How long to wait for a batch to fill up in seconds. By default a batch is whatever is available
+                        once a package arrives
+        num_devices: How many devices share the queue. The stream of a single device ends with a `TaggedPackage` of
+                     `END_OF_STREAM`, the consumer stops once the streams of all devices ended
+
+    Note:
+        Cancelling via `comm` stops the consumer right away, also when it's waiting for a package
     """
+    coro = _consume(protocol, comm, callbacks, max_batch_size, max_batch_wait, num_devices)
+    if await _until_cancelled(comm, coro):
+        print("Got a cancel message. Exiting consumer loop...")
+
+
+async def _consume(
+    protocol: ProtocolAsyncio,
+    comm: CommunicateCancel,
+    callbacks: Union[List[WaveCallback], Tuple[WaveCallback]],
+    max_batch_size: Optional[int],
+    max_batch_wait: float,
+    num_devices: int,
+) -> None:
+    ended_devices = set()
     while True:
         try:
-            package = await asyncio.wait_for(protocol.queue.get(), timeout=10)
+            if max_batch_size is None:
+                packages = [await asyncio.wait_for(protocol.queue.get(), timeout=10)]
+            else:
+                packages = await _get_batch(protocol.queue, max_batch_size, max_batch_wait)
         except asyncio.TimeoutError:
             print("Failed to receive valid package in 10 seconds, exiting consumer")
             comm.cancel = True
             break
 
-        if comm.is_cancel(package) or comm.cancel:
+        packages = _end_devices(packages, ended_devices, num_devices)
+        # Packages after the end of the stream or a cancel message are not passed on
+        end = next((i for i, p in enumerate(packages) if p is END_OF_STREAM or comm.is_cancel(p)), len(packages))
+        if not comm.cancel:
+            _deliver(callbacks, packages[:end], batched=max_batch_size is not None)
+
+        if end < len(packages) and packages[end] is END_OF_STREAM:
+            print("Reached the end of the stream. Exiting consumer loop...")
+            comm.cancel = True
+            break
+
+        if end < len(packages) or comm.cancel:
             print("Got a cancel message. Exiting consumer loop...")
             comm.cancel = True
             break
 
-        for callback in callbacks:
-            callback(package)
+
+def _end_devices(packages: list, ended_devices: set, num_devices: int) -> list:
+    """Drops the end of stream markers of single devices, the marker of the last device becomes `END_OF_STREAM`"""
+    result = []
+    for package in packages:
+        if isinstance(package, TaggedPackage) and package.package is END_OF_STREAM:
+            ended_devices.add(package.device)
+            if len(ended_devices) < num_devices:
+                continue
+            package = END_OF_STREAM
+        result.append(package)
+    return result
+
+
+async def _isolated_producer(
+    producer: Union[producer_bluetooth, producer_serial, producer_replay],
+    protocol: ProtocolAsyncio,
+    comm: CommunicateCancel,
+) -> Optional[Exception]:
+    """Runs the producer of one of several devices, a failure ends the stream of that device instead of the session
+
+    Returns:
+        The exception the producer failed with, `None` if it didn't
+    """
+    try:
+        await producer(protocol, comm)
+    except Exception as e:
+        logger.exception(f"The producer of {protocol.device} failed, carrying on with the other devices")
+        await _until_cancelled(comm, protocol.queue.put(TaggedPackage(protocol.device, END_OF_STREAM)))
+        return e
+    return None
 
 
 def make_sigint_handler(comm: CommunicateCancel):
@@ -179,7 +353,11 @@ def make_sigint_handler(comm: CommunicateCancel):
 
 
 def _run_asyncio(
-    callbacks: List[WaveCallback], producer: Union[producer_bluetooth, producer_serial], protocol: ProtocolAsyncio
+    callbacks: List[WaveCallback],
+    producer: Union[producer_bluetooth, producer_serial, producer_replay],
+    protocol: ProtocolAsyncio,
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
 ) -> None:
     """Runs a producer and a consumer, hooking into the data using the supplied callbacks
 
@@ -188,40 +366,187 @@ def _run_asyncio(
         producer: A callable that takes 2 arguments, a protocol and a communication object
         protocol: An object that knows how to process the raw data sent from the Wave ring into a structured format
                   and passes it along between `producer` and `consumer`.
+        max_batch_size: See docs for `consumer`
+        max_batch_wait: See docs for `consumer`
+    """
+    _run_asyncio_many(callbacks, [(producer, protocol)], max_batch_size, max_batch_wait)
+
+
+def _run_asyncio_many(
+    callbacks: List[WaveCallback],
+    producers: Sequence[Tuple[Union[producer_bluetooth, producer_serial, producer_replay], ProtocolAsyncio]],
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
+) -> None:
+    """Runs any number of producers and a single consumer in one event loop, see `_run_asyncio`
+
+    Args:
+        callbacks: See docs for `consumer`
+        producers: Pairs of a producer and the protocol it passes the data to. The protocols must share a queue, which
+                   the consumer reads from. If they all tag the packages with a device, a producer that fails is
+                   logged and the session carries on with the other devices
+        max_batch_size: See docs for `consumer`
+        max_batch_wait: See docs for `consumer`
     """
+    protocol = producers[0][1]
+    if any(p.queue is not protocol.queue for _, p in producers):
+        raise ValueError("Expected the protocols of all producers to share a queue")
+
     # A singleton that sends messages about whether the data transfer has been canceled.
     comm = CommunicateCancel()
     loop = get_or_create_event_loop()
     loop.add_signal_handler(signal.SIGINT, make_sigint_handler(comm))
 
-    # Note: The consumer and the producer send the data via the instance of `protocol`
-    tasks = asyncio.gather(producer(protocol, comm), consumer(protocol, comm, callbacks))
-    loop.run_until_complete(tasks)
-
-
-def run_asyncio_bluetooth(callbacks: List[WaveCallback], ble_address, enable_spectrogram=False) -> None:
+    # Note: The consumer and the producers send the data via the queue of the protocols. When the packages are tagged
+    # with their device a producer that fails only ends the stream of its device
+    isolated = all(p.device is not None for _, p in producers)
+    tasks = asyncio.gather(
+        *(_isolated_producer(producer, p, comm) if isolated else producer(p, comm) for producer, p in producers),
+        consumer(protocol, comm, callbacks, max_batch_size, max_batch_wait, len(producers)),
+    )
+    try:
+        results = loop.run_until_complete(tasks)
+    finally:
+        for callback in callbacks:
+            if isinstance(callback, WaveCallback):
+                callback.close()
+
+    errors = [e for e in results[:-1] if isinstance(e, Exception)]
+    if errors and len(errors) == len(producers):
+        raise RuntimeError("The producers of all devices failed, see the log for why") from errors[-1]
+
+    num_dropped = getattr(protocol.queue, "num_dropped", 0)
+    if num_dropped:
+        logger.warning(f"Dropped {num_dropped} packages, the callbacks couldn't keep up with the devices")
+
+
+def run_asyncio_bluetooth(
+    callbacks: List[WaveCallback],
+    ble_address,
+    enable_spectrogram=False,
+    lazy: bool = False,
+    recorder: Optional[FrameRecorder] = None,
+    queue_maxsize: int = 0,
+    overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
+) -> None:
     """Runs an async `consumer-producer` loop using user supplied callbacks for a bluetooth device
 
     Args:
         callbacks: A list/tuple of callbacks that handle the data passed from the wave ring
         ble_address: Address of the bluetooth device to connect to. E.g. 'D5:73:DB:85:B4:A1'
         enable_spectrogram: Enable on-device FFT and spectrogram binning
+        lazy: Pass data packages to the callbacks as a `DataPackageView` that only decodes the fields accessed
+        recorder: Records the raw frames received from the device, see `FrameRecorder`
+        queue_maxsize: The most packages waiting for the consumer before `overflow_policy` applies, 0 for no limit
+        overflow_policy: What happens with new packages when the queue is full, see `OverflowPolicy`
+        max_batch_size: Pass up to this many packages at once to the callbacks, see `consumer`
+        max_batch_wait: How long to wait for a batch to fill up in seconds, see `consumer`
     """
     _run_asyncio(
         callbacks,
         partial(producer_bluetooth, ble_address=ble_address, enable_spectrogram=enable_spectrogram),
-        ProtocolAsyncio(),
+        ProtocolAsyncio(lazy, recorder, maxsize=queue_maxsize, policy=overflow_policy),
+        max_batch_size,
+        max_batch_wait,
     )
 
 
-def run_asyncio_serial(callbacks: List[WaveCallback], serial_port: str = None) -> None:
+def run_asyncio_serial(
+    callbacks: List[WaveCallback],
+    serial_port: str = None,
+    lazy: bool = False,
+    recorder: Optional[FrameRecorder] = None,
+    queue_maxsize: int = 0,
+    overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
+) -> None:
     """Runs an async `consumer-producer` loop using user supplied callbacks for a serial device
 
     Args:
         callbacks: A list/tuple of callbacks that handle the data passed from the wave ring
         serial_port: The serial port to read from. If `None` will try to determine it automatically based on the
                      operating system the script is running on
+        lazy: Pass data packages to the callbacks as a `DataPackageView` that only decodes the fields accessed
+        recorder: Records the raw frames received from the device, see `FrameRecorder`
+        queue_maxsize: The most packages waiting for the consumer before `overflow_policy` applies, 0 for no limit
+        overflow_policy: What happens with new packages when the queue is full, see `OverflowPolicy`
+        max_batch_size: Pass up to this many packages at once to the callbacks, see `consumer`
+        max_batch_wait: How long to wait for a batch to fill up in seconds, see `consumer`
     """
     serial_port = get_serial_port() if serial_port is None else serial_port
 
-    _run_asyncio(callbacks, partial(producer_serial, serial_port=serial_port), ProtocolAsyncio())
+    protocol = ProtocolAsyncio(lazy, recorder, maxsize=queue_maxsize, policy=overflow_policy)
+    _run_asyncio(callbacks, partial(producer_serial, serial_port=serial_port), protocol, max_batch_size, max_batch_wait)
+
+
+def run_asyncio_replay(
+    callbacks: List[WaveCallback],
+    path: Path,
+    speed: Optional[float] = 1.0,
+    lazy: bool = False,
+    queue_maxsize: int = 0,
+    overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
+) -> None:
+    """Runs an async `consumer-producer` loop using user supplied callbacks for a recording made with `FrameRecorder`
+
+    Args:
+        callbacks: A list/tuple of callbacks that handle the data passed from the wave ring
+        path: The recording to replay
+        speed: How many times faster than real time to replay, `None` replays as fast as possible
+        lazy: Pass data packages to the callbacks as a `DataPackageView` that only decodes the fields accessed
+        queue_maxsize: The most packages waiting for the consumer before `overflow_policy` applies, 0 for no limit
+        overflow_policy: What happens with new packages when the queue is full, see `OverflowPolicy`
+        max_batch_size: Pass up to this many packages at once to the callbacks, see `consumer`
+        max_batch_wait: How long to wait for a batch to fill up in seconds, see `consumer`
+    """
+    protocol = ProtocolAsyncio(lazy, maxsize=queue_maxsize, policy=overflow_policy)
+    producer = partial(producer_replay, path=path, speed=speed)
+    _run_asyncio(callbacks, producer, protocol, max_batch_size, max_batch_wait)
+
+
+def run_asyncio_devices(
+    callbacks: List[WaveCallback],
+    ble_addresses: Sequence[str] = (),
+    serial_ports: Sequence[str] = (),
+    enable_spectrogram: bool = False,
+    lazy: bool = False,
+    queue_maxsize: int = 0,
+    overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    max_batch_size: Optional[int] = None,
+    max_batch_wait: float = 0.0,
+) -> None:
+    """Runs a producer for each of several devices and a single consumer in one event loop
+
+    The packages of all devices are put on one queue as a `TaggedPackage` holding the address or port of the device,
+    see `WaveCallback._tagged_handler` for how callbacks receive them.
+
+    Args:
+        callbacks: A list/tuple of callbacks that handle the data passed from the wave rings
+        ble_addresses: Addresses of the bluetooth devices to connect to. E.g. ['D5:73:DB:85:B4:A1']
+        serial_ports: Serial ports to read from
+        enable_spectrogram: Enable on-device FFT and spectrogram binning on the bluetooth devices
+        lazy: Pass data packages to the callbacks as a `DataPackageView` that only decodes the fields accessed
+        queue_maxsize: The most packages, of all devices combined, waiting for the consumer before `overflow_policy`
+                       applies, 0 for no limit
+        overflow_policy: What happens with new packages when the queue is full, see `OverflowPolicy`
+        max_batch_size: Pass up to this many packages at once to the callbacks, see `consumer`
+        max_batch_wait: How long to wait for a batch to fill up in seconds, see `consumer`
+    """
+    if not ble_addresses and not serial_ports:
+        raise ValueError("Expected at least one bluetooth address or serial port")
+
+    queue = BoundedAsyncQueue(queue_maxsize, overflow_policy)
+    producers = []
+    for ble_address in ble_addresses:
+        producer = partial(producer_bluetooth, ble_address=ble_address, enable_spectrogram=enable_spectrogram)
+        producers.append((producer, ProtocolAsyncio(lazy, device=ble_address, queue=queue)))
+    for serial_port in serial_ports:
+        producer = partial(producer_serial, serial_port=serial_port)
+        producers.append((producer, ProtocolAsyncio(lazy, device=serial_port, queue=queue)))
+
+    _run_asyncio_many(callbacks, producers, max_batch_size, max_batch_wait)
@@ -1,10 +1,40 @@
 import abc
 import csv
+import io
+import logging
+import pickle
+import struct
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Union, Optional, TextIO
+from typing import Any, Callable, Dict, List, Union, Optional, TextIO
 
-from genki_wave.data import DeviceInfo, ButtonEvent, Package, DataPackage, RawDataPackage, SpectrogramDataPackage
+import numpy as np
+
+from genki_wave.data import (
+    DeviceInfo,
+    ButtonEvent,
+    Package,
+    DataPackage,
+    DataPackageView,
+    RawDataPackage,
+    SpectrogramDataPackage,
+)
+from genki_wave.compression import CompressedWriter, chunk_offsets, is_compressed
 from genki_wave.constants import FIRMWARE_VERSION
+from genki_wave.data.organization import (
+    RAW_DATA_PACKAGE_DTYPE,
+    batch_from_packages,
+    columnar_batch,
+    flat_columns,
+)
+from genki_wave.data.enums import ExecutionMode, OverflowPolicy
+from genki_wave.data.structures import END_OF_STREAM, QueueWithPop, Timestamped
+from genki_wave.protocols import TaggedPackage
+
+logger = logging.getLogger(__name__)
 
 
 class WaveCallback(abc.ABC):
@@ -16,10 +46,35 @@ class WaveCallback(abc.ABC):
     def _data_handler(self, data: Package) -> None:
         pass
 
-    def __call__(self, data: Union[ButtonEvent, Package]) -> None:
-        if isinstance(data, ButtonEvent):
+    def _tagged_handler(self, data: TaggedPackage) -> None:
+        """Handles a package from one of several devices. Override to use `data.device`, ignores it by default"""
+        self(data.package)
+
+    def _batch_handler(self, data: List[Union[ButtonEvent, Package, TaggedPackage]]) -> None:
+        """Handles a batch of packages, in the order they arrived, when the consumer runs with `max_batch_size`
+
+        Handles them one at a time by default. Override to process the whole batch at once, e.g. with `columnar_batch`
+        """
+        for package in data:
+            self(package)
+
+    def close(self) -> None:
+        """Called once the runner is done passing data to the callback, e.g. to flush what's left. Does nothing by
+        default
+        """
+        pass
+
+    def __call__(self, data: Union[ButtonEvent, Package, TaggedPackage, list]) -> None:
+        if isinstance(data, list):
+            self._batch_handler(data)
+        elif data is END_OF_STREAM:
+            # E.g. drained from the queue of a `ReaderThreadReplay`, there's nothing left to handle
+            pass
+        elif isinstance(data, TaggedPackage):
+            self._tagged_handler(data)
+        elif isinstance(data, ButtonEvent):
             self._button_handler(data)
-        elif isinstance(data, (DataPackage, RawDataPackage, SpectrogramDataPackage)):
+        elif isinstance(data, (DataPackage, DataPackageView, RawDataPackage, SpectrogramDataPackage)):
             self._data_handler(data)
         elif isinstance(data, DeviceInfo):
             if data.version != FIRMWARE_VERSION:
@@ -28,6 +83,221 @@ class WaveCallback(abc.ABC):
             raise ValueError(f"Got data of unexpected type {type(data)}")
 
 
+class CallbackLag:
+    """Statistics of how long it takes from passing data to a callback until the callback is done with it, in seconds
+
+    Includes the time the data waited in the queue of a `CallbackRunner`.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, lag: float) -> None:
+        self.count += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+        self.last = lag
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"CallbackLag(count={self.count}, mean={self.mean * 1e3:.3f}ms, max={self.max * 1e3:.3f}ms, "
+            f"last={self.last * 1e3:.3f}ms)"
+        )
+
+
+def _apply(callback: Callable, data: Any) -> None:
+    """Passes `data` to `callback`, a batch one package at a time unless the callback is a `WaveCallback`"""
+    if isinstance(data, list) and not isinstance(callback, WaveCallback):
+        for package in data:
+            callback(package)
+    else:
+        callback(data)
+
+
+def _picklable(data: Any) -> Any:
+    """`data` with every `DataPackageView` decoded into a `DataPackage`, the views hold a memoryview of the payload"""
+    if isinstance(data, list):
+        return [_picklable(d) for d in data]
+    if isinstance(data, TaggedPackage):
+        return TaggedPackage(data.device, _picklable(data.package))
+    if isinstance(data, DataPackageView):
+        return data.to_package()
+    return data
+
+
+# The callback of a worker process of a `CallbackRunner`, set once when the process starts
+_process_callback = None
+
+
+def _init_process(callback: Callable) -> None:
+    global _process_callback
+    _process_callback = callback
+
+
+def _call_in_process(items: list) -> List[str]:
+    """Runs the callback on every item, returns the tracebacks of the items it failed on to be logged by the runner"""
+    failures = []
+    for item in items:
+        try:
+            _apply(_process_callback, item)
+        except Exception:
+            failures.append(traceback.format_exc())
+    return failures
+
+
+def _close_in_process() -> None:
+    if isinstance(_process_callback, WaveCallback):
+        _process_callback.close()
+
+
+class CallbackRunner(WaveCallback):
+    """Runs a callback inline, in a dedicated worker thread or in a dedicated worker process, see `ExecutionMode`
+
+    A slow callback, e.g. one writing to a file or running a model, holds up the consumer and every other callback
+    when it runs inline. Wrapped in a `CallbackRunner` with `ExecutionMode.THREAD` or `ExecutionMode.PROCESS` the
+    consumer only puts the data on a bounded queue, that the worker works through in order. What happens when the worker
+    falls behind and the queue fills up is decided by `policy`, with `OverflowPolicy.BLOCK` the consumer waits for it.
+
+    The lag of the callback is tracked in `lag`. The worker is stopped by `close`, after it has worked through the
+    queue, which the runners in `genki_wave.asyncio_runner` call when they are done.
+
+    Batches from a consumer with `max_batch_size` are passed on as they are to a `WaveCallback`, and one package at a
+    time to any other function.
+
+    With `ExecutionMode.PROCESS` the callback and everything passed to it is pickled. A callback that can't be pickled,
+    e.g. one holding an open file or a thread like `CsvOutput`, raises a `ValueError` right away, and a
+    `DataPackageView` is decoded into a `DataPackage` before it's sent. If the worker process can't be reached, e.g.
+    because it crashed, the next call and `close` raise.
+
+    Args:
+        callback: The callback to run, a `WaveCallback` or any function that takes a package
+        mode: Where to run the callback
+        maxsize: The most packages waiting for the worker before `policy` applies, 0 for no limit
+        policy: What happens with new packages when the queue is full, see `OverflowPolicy`
+
+    Example:
+        >>> csv_output = CallbackRunner(CsvOutput(Path("data.csv")), ExecutionMode.THREAD)  # doctest: +SKIP
+        >>> run_asyncio_bluetooth([midi_output, csv_output], ble_address)  # doctest: +SKIP
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[Any], None],
+        mode: ExecutionMode = ExecutionMode.THREAD,
+        maxsize: int = 1024,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    ):
+        self.callback = callback
+        self.mode = mode
+        self.lag = CallbackLag()
+
+        self._queue = None
+        self._thread = None
+        self._executor = None
+        self._error: Optional[BaseException] = None
+        if mode == ExecutionMode.PROCESS:
+            try:
+                pickle.dumps(callback)
+            except Exception as e:
+                raise ValueError(
+                    f"Can't run {callback!r} in a worker process, it can't be pickled. Use ExecutionMode.THREAD"
+                ) from e
+            self._executor = ProcessPoolExecutor(max_workers=1, initializer=_init_process, initargs=(callback,))
+        if mode != ExecutionMode.INLINE:
+            self._queue = QueueWithPop(maxsize, policy)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    @property
+    def num_dropped(self) -> int:
+        return 0 if self._queue is None else self._queue.num_dropped
+
+    def _button_handler(self, data: ButtonEvent) -> None:
+        self(data)
+
+    def _data_handler(self, data: Package) -> None:
+        self(data)
+
+    def __call__(self, data: Union[ButtonEvent, Package, TaggedPackage, list]) -> None:
+        self._raise_error()
+        if self._queue is None:
+            start = time.perf_counter()
+            _apply(self.callback, data)
+            self.lag.add(time.perf_counter() - start)
+        else:
+            self._queue.put(Timestamped(time.perf_counter(), data))
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"The worker process of {self.callback!r} failed") from self._error
+
+    def _run(self) -> None:
+        """The worker thread, in `ExecutionMode.PROCESS` it passes the data on to the worker process"""
+        while True:
+            items = [self._queue.get()] + self._queue.pop_all()
+            stop = END_OF_STREAM in items
+            items = [i for i in items if i is not END_OF_STREAM]
+            if self._error is not None:
+                # Keeps draining the queue, so a consumer waiting for room doesn't hang
+                pass
+            elif self._executor is not None:
+                self._call_process(items)
+            else:
+                for i in items:
+                    self._call(i.item)
+                    self.lag.add(time.perf_counter() - i.time)
+
+            if stop:
+                break
+
+    def _call(self, data: Any) -> None:
+        try:
+            _apply(self.callback, data)
+        except Exception:
+            # There's no one to raise to in the worker thread, the other callbacks keep running regardless
+            logger.exception(f"Callback {self.callback!r} failed, continuing with the next package")
+
+    def _call_process(self, items: List[Timestamped]) -> None:
+        """One round trip to the worker process for everything that was queued"""
+        try:
+            failures = self._executor.submit(_call_in_process, [_picklable(i.item) for i in items]).result()
+        except BaseException as e:
+            # The callback's own errors come back in `failures`, so this is the data or the process itself. Raised
+            # from the next call and `close`
+            self._error = e
+            return
+
+        now = time.perf_counter()
+        for i in items:
+            self.lag.add(now - i.time)
+        for failure in failures:
+            logger.error(f"Callback {self.callback!r} failed, continuing with the next package\n{failure}")
+
+    def close(self) -> None:
+        """Waits for the worker to finish everything queued, stops it and closes the callback"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(END_OF_STREAM)
+            self._thread.join()
+        if self._executor is not None:
+            try:
+                if self._error is None:
+                    # The state of the callback lives in the worker process, so that's where it's closed
+                    self._executor.submit(_close_in_process).result()
+            finally:
+                self._executor.shutdown()
+        elif isinstance(self.callback, WaveCallback):
+            self.callback.close()
+        logger.info(f"{self.callback!r} ran in mode {self.mode.value}: {self.lag}, {self.num_dropped} dropped")
+        self._raise_error()
+
+
 class ButtonAndDataPrint(WaveCallback):
     """
     Callback that prints out all button presses received and prints a data package every `print_data_every_n_seconds`
@@ -58,54 +328,403 @@ class ButtonAndDataPrint(WaveCallback):
             self._last_time = data.timestamp_us
 
 
+# What is added to the name of the output file for each package type, e.g. `data.csv` and `data_raw.csv`
+_PATH_SUFFIXES = {DataPackage: "", RawDataPackage: "_raw", SpectrogramDataPackage: "_spectrogram"}
+
+
+def _package_type(data: Package) -> type:
+    """The type a package is written out as, a `DataPackageView` is written like a `DataPackage`"""
+    return DataPackage if isinstance(data, DataPackageView) else type(data)
+
+
+def _path_for(filename: Path, package_type: type) -> Path:
+    return filename.with_name(f"{filename.stem}{_PATH_SUFFIXES[package_type]}{filename.suffix}")
+
+
+class _CsvSink:
+    """A csv file of `CsvOutput` for a single package type, opened when the first rows are written"""
+
+    def __init__(self, path: Path, fieldnames: tuple, compression: Optional[str] = None, level: Optional[int] = None):
+        if path.exists() and path.stat().st_size > 0 and is_compressed(path) != (compression is not None):
+            raise ValueError(f"Can't append to {path}, compression={compression} doesn't match the file")
+        self.path = path
+        self.fieldnames = fieldnames
+        self.packages = []
+        self._compression = compression
+        self._level = level
+        self._file: Optional[TextIO] = None
+        self._writer = None
+
+    def write(self, packages: list) -> None:
+        if self._file is None:
+            if self._compression is None:
+                is_new = not self.path.exists() or self.path.stat().st_size == 0
+                self._file = open(self.path, "a", newline="")
+            else:
+                # A compressed file that was cut off before its first chunk doesn't have the csv header yet
+                is_new = not self.path.exists() or self.path.stat().st_size == 0 or not chunk_offsets(self.path)
+                compressed = CompressedWriter(self.path, self._compression, self._level)
+                self._file = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            if is_new:
+                self._writer.writerow(self.fieldnames)
+
+        self._writer.writerows([p.as_flat_tuple() for p in packages])
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
 class CsvOutput(WaveCallback):
     """
-    Exports the streaming data to a csv file, flushing it to the file every `flush_len` elements
+    Exports the streaming data to csv files, one per package type, writing them out on a background thread
+
+    Data packages go to `filename`, raw data and spectrogram packages to files next to it with `_raw` and
+    `_spectrogram` added to the name, e.g. `data.csv`, `data_raw.csv` and `data_spectrogram.csv`. A file is only created
+    once a package of its type arrives. The columns are the `flat_keys` of the package type.
+
+    The callback itself only buffers the packages. They are written out every `flush_len` packages of a type or every
+    `flush_interval` seconds, whichever comes first, and on `close`.
+
+    If writing fails on the background thread, e.g. because the disk is full, the error is raised from the next call
+    and from `close`, instead of buffering packages that are never written.
 
     Default behaviour is to append the data if a file already exists
 
+    With `compression` the files are compressed in chunks on a background thread, see `genki_wave.compression`. Read
+    them back with `read_compressed`.
+
     Args:
         filename: The file the data will be exported to
         flush_len: How many samples to buffer before writing to a file
+        flush_interval: The longest time in seconds samples are buffered for, `None` to only write every `flush_len`
+        compression: "zlib" or "lzma" to compress the files, `None` to write plain csv files
+        level: The compression level, see `CompressedWriter`
     """
 
-    def __init__(self, filename: Path, flush_len: int = 256):
-
-        self._events = []
-        self._filename = filename
-        self._fieldnames = DataPackage.flat_keys()
+    def __init__(
+        self,
+        filename: Path,
+        flush_len: int = 256,
+        flush_interval: Optional[float] = 1.0,
+        compression: Optional[str] = None,
+        level: Optional[int] = None,
+    ):
+        self._filename = Path(filename)
+        self._compression = compression
+        self._level = level
         self._flush_len = flush_len
+        self._flush_interval = flush_interval
+        self._sinks = {}
+
+        # `_lock` guards the buffers, `_write_lock` makes sure buffers are written in the order they were taken
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def path(self, package_type: type) -> Path:
+        """The file packages of `package_type` are written to"""
+        return _path_for(self._filename, package_type)
+
+    def _button_handler(self, data: ButtonEvent) -> None:
+        pass
+
+    def _data_handler(self, data: Package) -> None:
+        """Buffers the data and wakes up the writer if enough data points have been collected"""
+        self._raise_error()
+        package_type = _package_type(data)
+        with self._lock:
+            sink = self._sinks.get(package_type)
+            if sink is None:
+                path, fieldnames = self.path(package_type), package_type.flat_keys()
+                sink = self._sinks[package_type] = _CsvSink(path, fieldnames, self._compression, self._level)
+            sink.packages.append(data)
+            is_full = len(sink.packages) >= self._flush_len
+
+        if is_full:
+            self._flush_requested.set()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Writing the csv files of {self._filename} failed") from self._error
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._flush_requested.wait(self._flush_interval)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except BaseException as e:
+                # Raised from the next call and `close`, there's no one to raise to here
+                self._error = e
+                break
+
+    def flush(self) -> None:
+        """Writes out everything buffered so far"""
+        with self._write_lock:
+            with self._lock:
+                taken = []
+                for sink in self._sinks.values():
+                    if sink.packages:
+                        taken.append((sink, sink.packages))
+                        sink.packages = []
+
+            for sink, packages in taken:
+                sink.write(packages)
 
-        if not self._filename.exists():
-            with open(self._filename, "w") as f:
-                writer = self._get_writer(f)
-                writer.writeheader()
+    def close(self) -> None:
+        """Writes out what's left and closes the files"""
+        self._closed = True
+        self._flush_requested.set()
+        self._thread.join()
+        try:
+            if self._error is None:
+                self.flush()
+        finally:
+            for sink in self._sinks.values():
+                sink.close()
+        self._raise_error()
 
-    def _get_writer(self, f: TextIO) -> csv.DictWriter:
-        return csv.DictWriter(f, fieldnames=self._fieldnames)
 
-    def _reset_state(self) -> None:
-        self._events = []
+def _columns(package_type: type, packages: list) -> Dict[str, np.ndarray]:
+    """The packages of `package_type` as flat columns, keyed and ordered like `package_type.flat_keys()`"""
+    if package_type is DataPackage:
+        return columnar_batch(packages)
+    if package_type is RawDataPackage:
+        return flat_columns(batch_from_packages(packages, RAW_DATA_PACKAGE_DTYPE))
+
+    bins = np.stack([p.data for p in packages]).reshape(len(packages), -1)
+    columns = dict(zip(package_type.flat_keys()[:-1], bins.T))
+    columns["timestamp_us"] = np.array([p.timestamp_us for p in packages], dtype=np.uint64)
+    return columns
+
+
+class ArrowOutput(WaveCallback):
+    """
+    Exports the streaming data to columnar Parquet files or Arrow IPC streams, one per package type
+
+    The files are named like the ones of `CsvOutput`. Every `row_group_size` packages of a type are written as one
+    Parquet row group (or Arrow record batch), with a column per `flat_keys` of the package type. The columns keep the
+    types of the wire format, float32 for the measurements and uint64 for `timestamp_us`, so the files are a fraction of
+    the size of the csv files and load straight into pandas, polars, DuckDB etc. without parsing.
+
+    Writing a row group is done in the callback. To keep it off the event loop wrap it in a `CallbackRunner` with
+    `ExecutionMode.THREAD`. Needs `pyarrow`, e.g. `pip install genki-wave[arrow]`.
+
+    Args:
+        filename: The file the data will be exported to, e.g. `data.parquet`. An existing file is overwritten
+        row_group_size: How many packages of a type to buffer before writing them out as a row group
+        file_format: Either "parquet" or "arrow" for the Arrow IPC streaming format
+        compression: The compression codec, e.g. "zstd", "lz4" or `None`
+    """
+
+    def __init__(
+        self,
+        filename: Path,
+        row_group_size: int = 4096,
+        file_format: str = "parquet",
+        compression: Optional[str] = "zstd",
+    ):
+        if file_format not in ("parquet", "arrow"):
+            raise ValueError(f"Expected file_format to be 'parquet' or 'arrow', got {file_format!r}")
+        # Imported here so `pyarrow` is only needed when this callback is used
+        import pyarrow
+
+        self._pa = pyarrow
+        self._filename = Path(filename)
+        self._row_group_size = row_group_size
+        self._file_format = file_format
+        self._compression = compression
+        self._packages = {}
+        self._writers = {}
+
+    def path(self, package_type: type) -> Path:
+        """The file packages of `package_type` are written to"""
+        return _path_for(self._filename, package_type)
 
     def _button_handler(self, data: ButtonEvent) -> None:
         pass
 
     def _data_handler(self, data: Package) -> None:
-        if not isinstance(data, DataPackage):
+        package_type = _package_type(data)
+        packages = self._packages.setdefault(package_type, [])
+        packages.append(data)
+        if len(packages) >= self._row_group_size:
+            self._write(package_type)
+
+    def _write(self, package_type: type) -> None:
+        packages, self._packages[package_type] = self._packages[package_type], []
+        if not packages:
             return
 
-        """Receives the data and writes it out if enough data points have been collected"""
-        self._events.append(data)
+        pa = self._pa
+        columns = _columns(package_type, packages)
+        batch = pa.RecordBatch.from_arrays([pa.array(c) for c in columns.values()], names=list(columns))
+
+        writer = self._writers.get(package_type)
+        if writer is None:
+            writer = self._writers[package_type] = self._open(self.path(package_type), batch.schema)
+        if self._file_format == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]), row_group_size=len(packages))
+        else:
+            writer.write_batch(batch)
+
+    def _open(self, path: Path, schema):
+        if self._file_format == "parquet":
+            import pyarrow.parquet
+
+            return pyarrow.parquet.ParquetWriter(str(path), schema, compression=self._compression or "none")
+
+        import pyarrow.ipc
+
+        options = pyarrow.ipc.IpcWriteOptions(compression=self._compression)
+        return pyarrow.ipc.new_stream(str(path), schema, options=options)
+
+    def flush(self) -> None:
+        """Writes out everything buffered so far, as a (smaller) row group per package type"""
+        for package_type in list(self._packages):
+            self._write(package_type)
+
+    def close(self) -> None:
+        """Writes out what's left and closes the files"""
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+class _NpyAppender:
+    """Appends rows of a structured dtype to a memory-mapped `.npy` file, growing it `extent_rows` at a time
+
+    The header always describes the rows written so far, the space preallocated after them is ignored by readers. The
+    shape in the header is padded so the header keeps its size and can be rewritten in place as the file grows.
+    """
+
+    def __init__(self, path: Path, dtype: np.dtype, extent_rows: int):
+        self.path = path
+        self.dtype = dtype
+        self.num_rows = 0
+        self._extent_rows = extent_rows
+        self._header_len = len(self._header(0))
+        self._capacity = 0
+        self._map = None
+        self._file = open(path, "w+b")
+        self._write_header()
+
+    def _header(self, num_rows: int) -> bytes:
+        widest_shape = f"({2 ** 64},)"
+        shape = f"({num_rows},)".ljust(len(widest_shape))
+        descr = np.lib.format.dtype_to_descr(self.dtype)
+        header = f"{{'descr': {descr!r}, 'fortran_order': False, 'shape': {shape}, }}"
+
+        for version, length_format in (((1, 0), "<H"), ((2, 0), "<I")):
+            prefix_len = len(np.lib.format.MAGIC_PREFIX) + 2 + struct.calcsize(length_format)
+            # The data has to start at a multiple of 64 bytes, the header is padded with spaces and ends with a newline
+            padding = -(prefix_len + len(header) + 1) % 64
+            header_bytes = (header + " " * padding + "\n").encode("latin1")
+            if len(header_bytes) < 2 ** (8 * struct.calcsize(length_format)):
+                break
+        return np.lib.format.magic(*version) + struct.pack(length_format, len(header_bytes)) + header_bytes
+
+    def _write_header(self) -> None:
+        self._file.seek(0)
+        self._file.write(self._header(self.num_rows))
+        self._file.flush()
+
+    def _grow(self, num_rows: int) -> None:
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        self._capacity = max(self._capacity + self._extent_rows, num_rows)
+        self._file.truncate(self._header_len + self._capacity * self.dtype.itemsize)
+        self._map = np.memmap(self._file, dtype=self.dtype, mode="r+", offset=self._header_len, shape=self._capacity)
+
+    def append(self, columns: Dict[str, np.ndarray]) -> None:
+        n = len(next(iter(columns.values())))
+        if self.num_rows + n > self._capacity:
+            self._grow(self.num_rows + n)
+
+        rows = self._map[self.num_rows : self.num_rows + n]
+        for k, values in columns.items():
+            rows[k] = values
+        self._map.flush()
+        self.num_rows += n
+        # Only now readers see the new rows
+        self._write_header()
+
+    def close(self) -> None:
+        """Drops the preallocated space that wasn't used and closes the file"""
+        self._map = None
+        self._file.truncate(self._header_len + self.num_rows * self.dtype.itemsize)
+        self._write_header()
+        self._file.close()
+
+
+class NpyOutput(WaveCallback):
+    """
+    Exports the streaming data to memory-mapped `.npy` files, one per package type
+
+    The files are named like the ones of `CsvOutput`. Each holds a 1d structured array with a field per `flat_keys` of
+    the package type, float32 for the measurements and uint64 for `timestamp_us`, so they open instantly with
+    `np.load(path, mmap_mode="r")` no matter how long the session was, e.g. `np.load(path, mmap_mode="r")["gyro_x"]`.
+
+    Every `flush_len` packages of a type are written straight into the mapped file, and the header is updated to
+    include them, so a file can also be opened while it's still being written. The files grow `extent_rows` rows at a
+    time, the space that isn't used is dropped on `close`.
+
+    Args:
+        filename: The file the data will be exported to, e.g. `data.npy`. An existing file is overwritten
+        flush_len: How many packages of a type to buffer before writing them to the file
+        extent_rows: How many rows to grow the files by when they are full
+    """
+
+    def __init__(self, filename: Path, flush_len: int = 256, extent_rows: int = 1 << 16):
+        self._filename = Path(filename)
+        self._flush_len = flush_len
+        self._extent_rows = extent_rows
+        self._packages = {}
+        self._files = {}
+
+    def path(self, package_type: type) -> Path:
+        """The file packages of `package_type` are written to"""
+        return _path_for(self._filename, package_type)
+
+    def _button_handler(self, data: ButtonEvent) -> None:
+        pass
+
+    def _data_handler(self, data: Package) -> None:
+        package_type = _package_type(data)
+        packages = self._packages.setdefault(package_type, [])
+        packages.append(data)
+        if len(packages) >= self._flush_len:
+            self._write(package_type)
 
-        if len(self._events) < self._flush_len:
+    def _write(self, package_type: type) -> None:
+        packages, self._packages[package_type] = self._packages[package_type], []
+        if not packages:
             return
 
-        with open(self._filename, "a") as f:
-            writer = self._get_writer(f)
+        columns = _columns(package_type, packages)
+        appender = self._files.get(package_type)
+        if appender is None:
+            dtype = np.dtype([(k, v.dtype) for k, v in columns.items()])
+            appender = self._files[package_type] = _NpyAppender(self.path(package_type), dtype, self._extent_rows)
+        appender.append(columns)
 
-            for event in self._events:
-                d = event.as_flat_dict()
-                assert set(d.keys()) == set(writer.fieldnames), "Expected event.fieldnames == writer.fieldnames"
-                writer.writerow(d)
+    def flush(self) -> None:
+        """Writes out everything buffered so far"""
+        for package_type in list(self._packages):
+            self._write(package_type)
 
-        self._reset_state()
+    def close(self) -> None:
+        """Writes out what's left and finalizes the files"""
+        self.flush()
+        for appender in self._files.values():
+            appender.close()
+        self._files = {}
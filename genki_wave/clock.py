@@ -0,0 +1,156 @@
+"""Maps the device clock (`timestamp_us`) onto the host clock
+
+A package arrives at the host some time after the device sampled it. That delay is never negative and is close to its
+minimum for most packages, but now and then a package is held up, e.g. by a bluetooth retransmission or a busy host.
+So for every block of device time the package with the smallest `arrival time - device time` is the one that was
+delayed the least, and a straight line fitted through those block minima gives the offset and the drift of the device
+clock. An estimate of the host time of a sample is the line evaluated at its device time. It includes the minimum
+transport delay, which can't be told apart from the clock offset without a round trip to the device.
+
+`ClockSync` fits the line online over a sliding window of blocks, for live streams. `fit_host_time` fits it over a
+whole recording at once.
+
+A device timestamp that jumps back by more than a block means the device restarted, the fit starts over from there.
+"""
+from collections import deque
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def _fit_line(xs: np.ndarray, ys: np.ndarray) -> Tuple[float, float, float]:
+    """Least squares fit of `y = y0 + slope * (x - x0)`, returns `(x0, y0, slope)` with `x0` the mean of `xs`"""
+    x0, y0 = float(np.mean(xs)), float(np.mean(ys))
+    dx = xs - x0
+    denominator = float(np.dot(dx, dx))
+    slope = float(np.dot(dx, ys - y0)) / denominator if denominator > 0 else 0.0
+    return x0, y0, slope
+
+
+class ClockSync:
+    """Estimates the host time of device timestamps from when the packages arrived, a package at a time
+
+    Every update is O(1), except for the one that closes a block which refits the line through the `num_blocks` block
+    minima in the window.
+
+    Args:
+        block_us: Device time per block in microseconds. Longer blocks are more likely to hold a package that wasn't
+                  delayed, shorter blocks adapt quicker at the start of a stream
+        num_blocks: Number of blocks in the sliding window the line is fitted over
+
+    Example:
+        >>> clock = ClockSync()
+        >>> clock.update(1_000_000, 1_700_000_000_000_000_000)
+        >>> clock.host_time_ns(1_000_500)
+        1700000000000500000
+    """
+
+    def __init__(self, block_us: int = 1_000_000, num_blocks: int = 60):
+        if block_us <= 0 or num_blocks < 2:
+            raise ValueError(f"Expected block_us > 0 and num_blocks >= 2, got {block_us} and {num_blocks}")
+        self.block_us = block_us
+        self.num_blocks = num_blocks
+        self.num_resets = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        # Everything is relative to the first sample, so the fit works on small numbers and keeps its precision
+        self._ref: Optional[Tuple[int, int]] = None
+        self._last_device_us = 0
+        self._block = -1
+        self._block_min: Tuple[int, int] = (0, 0)
+        self._minima: deque = deque(maxlen=self.num_blocks)
+        self._fit: Optional[Tuple[float, float, float]] = None
+
+    def update(self, device_us: int, host_ns: int) -> None:
+        """Adds a package with device time `device_us` that arrived at host time `host_ns`, e.g. `time.time_ns()`"""
+        if self._ref is None or device_us + self.block_us < self._last_device_us:
+            if self._ref is not None:
+                self.num_resets += 1
+            self._reset()
+            self._ref = (device_us, host_ns)
+        self._last_device_us = device_us
+
+        x = device_us - self._ref[0]
+        y = host_ns - self._ref[1] - x * 1000
+        block = x // self.block_us
+        if block > self._block:
+            if self._block >= 0:
+                self._minima.append(self._block_min)
+                if len(self._minima) >= 2:
+                    self._fit = _fit_line(*np.array(self._minima, dtype=np.float64).T)
+            self._block = block
+            self._block_min = (x, y)
+        elif y < self._block_min[1]:
+            # A package from an earlier block that arrived late, e.g. a spectrogram, counts towards the current one
+            self._block_min = (x, y)
+
+    def host_time_ns(self, device_us: int) -> Optional[int]:
+        """The estimated host time in nanoseconds since the epoch of `device_us`. `None` before the first update"""
+        if self._ref is None:
+            return None
+        x = device_us - self._ref[0]
+        if self._fit is None:
+            # Not enough blocks for a line yet, assume the clocks run at the same rate
+            y = min([y for _, y in self._minima] + [self._block_min[1]])
+        else:
+            x0, y0, slope = self._fit
+            y = y0 + slope * (x - x0)
+        return self._ref[1] + x * 1000 + round(y)
+
+    def stamp(self, device_us: int, host_ns: int) -> int:
+        """`update` followed by `host_time_ns`, for a package as it arrives"""
+        self.update(device_us, host_ns)
+        return self.host_time_ns(device_us)
+
+    @property
+    def drift_ppm(self) -> float:
+        """How much faster the device clock runs than the host clock, in parts per million"""
+        if self._fit is None:
+            return 0.0
+        # The slope is in ns of offset per us of device time, i.e. in thousandths
+        return -self._fit[2] * 1000
+
+
+def fit_host_time(device_us: np.ndarray, host_ns: np.ndarray, block_us: int = 1_000_000) -> np.ndarray:
+    """Estimates the host time of every device timestamp in a recording, see `ClockSync`
+
+    Unlike `ClockSync` the line is fitted over the whole recording, or over each part of it between device restarts.
+
+    Args:
+        device_us: Device time of every package, `timestamp_us`
+        host_ns: Host arrival time of every package in nanoseconds since the epoch, e.g. from `Recording.time_ns`
+        block_us: Device time per block in microseconds
+
+    Returns:
+        The estimated host time of every package in nanoseconds since the epoch
+    """
+    device_us = np.asarray(device_us).astype(np.int64)
+    host_ns = np.asarray(host_ns).astype(np.int64)
+    if device_us.shape != host_ns.shape:
+        raise ValueError(f"Expected as many device as host times, got {device_us.shape} and {host_ns.shape}")
+
+    result = np.empty_like(host_ns)
+    restarts = np.flatnonzero(device_us[1:] + block_us < device_us[:-1]) + 1
+    for start, stop in zip(np.r_[0, restarts], np.r_[restarts, len(device_us)]):
+        if start == stop:
+            continue
+        x = device_us[start:stop] - device_us[start]
+        y = host_ns[start:stop] - host_ns[start] - x * 1000
+
+        # Sorted by block and then by `y`, the first package of every block is its minimum
+        blocks = x // block_us
+        order = np.lexsort((y, blocks))
+        is_first = np.r_[True, blocks[order][1:] != blocks[order][:-1]]
+        minima = order[is_first]
+        if len(minima) > 2:
+            # Like `ClockSync` the last block, which is usually cut short and delayed more, is left out of the fit
+            minima = minima[:-1]
+
+        if len(minima) < 2:
+            fitted = np.full(len(x), float(y[minima].min()))
+        else:
+            x0, y0, slope = _fit_line(x[minima].astype(np.float64), y[minima].astype(np.float64))
+            fitted = y0 + slope * (x - x0)
+        result[start:stop] = host_ns[start] + x * 1000 + np.round(fitted).astype(np.int64)
+    return result
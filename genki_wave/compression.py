@@ -0,0 +1,268 @@
+"""Compressed files made of independently compressed chunks, for long recordings
+
+A compressed file is a header followed by chunks. Every chunk is compressed on its own with `zlib` or `lzma` and has a
+small header of its own, so decompression can start at any chunk and a file that was cut off, e.g. by a crash, can be
+read up to the last complete chunk.
+
+    header: magic (8 bytes), format version (uint16), codec (uint8)
+    chunk:  sync marker (4 bytes), compressed size (uint32), uncompressed size (uint32), crc32 of the uncompressed data
+            (uint32), followed by the compressed data
+
+Explanation for the formats: https://docs.python.org/3/library/struct.html
+
+As a rule of thumb `zlib` at level 1 roughly halves a frame recording and compresses a csv file 2-3x for about 1-3 ms of
+CPU time per second of 400 Hz data, while `lzma` compresses 4x at a much higher CPU cost. Measure it on your own
+machine with `benchmarks/compression.py`.
+"""
+import bisect
+import io
+import logging
+import lzma
+import os
+import queue
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GENKIZCH"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHB")
+_CHUNK_MARKER = b"GWCK"
+_CHUNK_HEADER = struct.Struct("<4sIII")
+
+_CODECS = {"zlib": 1, "lzma": 2}
+_CODEC_NAMES = {v: k for k, v in _CODECS.items()}
+
+
+def _compress(data: bytes, codec: str, level: Optional[int]) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(data, -1 if level is None else level)
+    return lzma.compress(data, preset=level)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return lzma.decompress(data)
+
+
+def is_compressed(path: Path) -> bool:
+    """Whether `path` is a chunked compressed file"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _read_header(f: BinaryIO, path: Path) -> str:
+    """Reads and checks the header of the file at `path`, returns the codec"""
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError(f"{path} is too short to be a compressed file")
+    magic, version, codec = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a compressed file, expected it to start with {MAGIC!r}, got {magic!r}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compressed format version {version} in {path}, expected {FORMAT_VERSION}")
+    if codec not in _CODEC_NAMES:
+        raise ValueError(f"Unknown codec {codec} in {path}")
+    return _CODEC_NAMES[codec]
+
+
+class CompressedWriter(io.BufferedIOBase):
+    """A binary file that compresses what is written to it in chunks of `chunk_size` bytes on a background thread
+
+    Writing only appends to a buffer, a full chunk is handed over to the background thread, so `write` never waits for
+    the compression or the disk. The last, partial chunk is written on `close`, or earlier with `end_chunk`. `flush`
+    doesn't end the chunk, so wrapping the writer in e.g. a `TextIOWrapper` that flushes often doesn't hurt the
+    compression ratio.
+
+    If `path` is an existing compressed file, the chunks are appended to it. A chunk that was cut off at the end of the
+    file, e.g. by a crash, is removed first, otherwise it would make the chunks after it unreadable.
+
+    Args:
+        path: The file to write to
+        codec: "zlib" or "lzma"
+        level: The compression level, 0-9 for both. `None` for the default of the codec
+        chunk_size: Size of the uncompressed chunks in bytes. A larger chunk compresses better, a smaller chunk loses
+                    less data if the program is killed and is quicker to seek to
+    """
+
+    def __init__(self, path: Path, codec: str = "zlib", level: Optional[int] = None, chunk_size: int = 1 << 20):
+        super().__init__()
+        if codec not in _CODECS:
+            raise ValueError(f"Expected codec to be one of {list(_CODECS)}, got {codec!r}")
+        self.path = Path(path)
+        self.codec = codec
+        self.level = level
+        self.chunk_size = chunk_size
+        self.num_chunks = 0
+
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        if not is_new:
+            with open(self.path, "rb") as f:
+                existing_codec = _read_header(f, self.path)
+            if existing_codec != codec:
+                raise ValueError(
+                    f"Can't append {codec} chunks to {self.path}, which is compressed with {existing_codec}"
+                )
+            _, end = _scan_chunks(self.path)
+            if end < self.path.stat().st_size:
+                logger.warning(f"Removing a truncated chunk at the end of {self.path} before appending to it")
+                os.truncate(self.path, end)
+
+        self._file = open(self.path, "ab")
+        if is_new:
+            self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, _CODECS[codec]))
+
+        self._buffer = bytearray()
+        self._chunks = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        if self.closed:
+            raise ValueError("Write to a closed file")
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self.end_chunk()
+        return len(data)
+
+    def end_chunk(self) -> None:
+        """Hands everything written so far over to be compressed as a chunk"""
+        if self._buffer:
+            self._chunks.put(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def _run(self) -> None:
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                compressed = _compress(chunk, self.codec, self.level)
+                header = _CHUNK_HEADER.pack(_CHUNK_MARKER, len(compressed), len(chunk), zlib.crc32(chunk))
+                self._file.write(header + compressed)
+                self._file.flush()
+                self.num_chunks += 1
+            except BaseException as e:
+                # Raised from `close`, there's no one to raise to here
+                self._error = e
+
+    def close(self) -> None:
+        """Compresses what's left, waits for the background thread to finish and closes the file"""
+        if self.closed:
+            return
+        self.end_chunk()
+        self._chunks.put(None)
+        self._thread.join()
+        self._file.close()
+        super().close()
+        if self._error is not None:
+            raise self._error
+
+
+def iter_compressed_chunks(path: Path, offset: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yields `(offset, data)` with the file offset and the decompressed data of every chunk in the file at `path`
+
+    Args:
+        path: A file written with `CompressedWriter`
+        offset: The offset of the chunk to start at, e.g. from `chunk_offsets`. The first chunk by default
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        codec = _read_header(f, path)
+        if offset is not None:
+            f.seek(offset)
+
+        while True:
+            pos = f.tell()
+            header = f.read(_CHUNK_HEADER.size)
+            if not header:
+                break
+            if len(header) < _CHUNK_HEADER.size:
+                logger.warning(f"Ignoring a truncated chunk at the end of {path}")
+                break
+            marker, compressed_size, size, crc = _CHUNK_HEADER.unpack(header)
+            if marker != _CHUNK_MARKER:
+                raise ValueError(f"Expected a chunk at offset {pos} in {path}")
+            compressed = f.read(compressed_size)
+            if len(compressed) < compressed_size:
+                logger.warning(f"Ignoring a truncated chunk at the end of {path}")
+                break
+
+            data = _decompress(compressed, codec)
+            if len(data) != size or zlib.crc32(data) != crc:
+                raise ValueError(f"The chunk at offset {pos} in {path} is corrupt")
+            yield pos, data
+
+
+def _scan_chunks(path: Path) -> Tuple[List[Tuple[int, int, int]], int]:
+    """`chunk_table` of the file at `path` together with the offset where the last complete chunk ends"""
+    table = []
+    size = path.stat().st_size
+    uncompressed_offset = 0
+    with open(path, "rb") as f:
+        _read_header(f, path)
+        pos = f.tell()
+        while pos + _CHUNK_HEADER.size <= size:
+            marker, compressed_size, chunk_size, _ = _CHUNK_HEADER.unpack(f.read(_CHUNK_HEADER.size))
+            if marker != _CHUNK_MARKER:
+                raise ValueError(f"Expected a chunk at offset {pos} in {path}")
+            if pos + _CHUNK_HEADER.size + compressed_size > size:
+                break
+            table.append((pos, uncompressed_offset, chunk_size))
+            uncompressed_offset += chunk_size
+            pos += _CHUNK_HEADER.size + compressed_size
+            f.seek(pos)
+    return table, pos
+
+
+def chunk_table(path: Path) -> List[Tuple[int, int, int]]:
+    """`(offset, uncompressed_offset, uncompressed_size)` of all complete chunks in the file at `path`
+
+    `uncompressed_offset` is where the data of the chunk starts in the decompressed file. Found from the chunk headers
+    alone, without decompressing anything.
+    """
+    return _scan_chunks(Path(path))[0]
+
+
+def chunk_offsets(path: Path) -> List[int]:
+    """The file offsets of all complete chunks in the file at `path`, found without decompressing anything"""
+    return [offset for offset, _, _ in chunk_table(path)]
+
+
+def uncompressed_size(path: Path) -> int:
+    """The size of the file at `path` once decompressed, without decompressing it"""
+    table = chunk_table(path)
+    return table[-1][1] + table[-1][2] if table else 0
+
+
+def read_compressed_from(path: Path, uncompressed_offset: int) -> Iterator[bytes]:
+    """Yields the decompressed data of the file at `path` from `uncompressed_offset` on, a chunk at a time
+
+    Only the chunks from the one `uncompressed_offset` falls in are decompressed.
+    """
+    table = chunk_table(path)
+    starts = [start for _, start, _ in table]
+    i = bisect.bisect_right(starts, uncompressed_offset) - 1
+    if i < 0 or uncompressed_offset >= starts[i] + table[i][2]:
+        return
+
+    skip = uncompressed_offset - starts[i]
+    for _, data in iter_compressed_chunks(path, table[i][0]):
+        yield data[skip:]
+        skip = 0
+
+
+def read_compressed(path: Path) -> bytes:
+    """Decompresses the whole file at `path`"""
+    return b"".join(data for _, data in iter_compressed_chunks(path))
@@ -1,3 +1,6 @@
 FIRMWARE_VERSION = "1.7.4"
 API_CHAR_UUID = "65e92bb1-8dfb-11ea-bc55-0242ac130003"
 BAUDRATE = 921600
+# The largest package is a spectrogram (104 + 4 bytes), a couple of bytes longer once COBS encoded. Anything much longer
+# than that without a terminator is garbage
+MAX_FRAME_SIZE = 512
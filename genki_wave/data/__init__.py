@@ -3,6 +3,7 @@ from .organization import (  # noqa: F401
     ButtonEvent,
     Package,
     DataPackage,
+    DataPackageView,
     RawDataPackage,
     SpectrogramDataPackage,
 )
@@ -1,4 +1,4 @@
-from enum import IntEnum
+from enum import Enum, IntEnum
 
 
 class PackageId(IntEnum):
@@ -64,3 +64,32 @@ class ButtonAction(IntEnum):
     EXTRALONGUP = 5
     CLICK = 6
     DOUBLECLICK = 7
+
+
+class OverflowPolicy(Enum):
+    """What a bounded queue does with a new item when it's full
+
+    Block: wait until there is room, nothing is lost but the producer stalls
+    DropOldest: drop the oldest item to make room, keeps the freshest data
+    DropNewest: drop the new item, keeps the data that is already queued
+    KeepLatestPerType: drop the oldest item of the same type as the new one (e.g. an older `DataPackage`), so rare
+                       packages like button events survive. Falls back to dropping the oldest item
+    """
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    KEEP_LATEST_PER_TYPE = "keep_latest_per_type"
+
+
+class ExecutionMode(Enum):
+    """Where a callback runs, see `genki_wave.callbacks.CallbackRunner`
+
+    Inline: in the consumer, e.g. on the event loop. Anything slow in the callback delays every other callback
+    Thread: in a dedicated worker thread that is fed through a bounded queue
+    Process: in a dedicated worker process, for CPU heavy callbacks. The callback has to be picklable
+    """
+
+    INLINE = "inline"
+    THREAD = "thread"
+    PROCESS = "process"
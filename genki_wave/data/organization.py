@@ -2,11 +2,16 @@ from __future__ import annotations
 
 import struct
 from dataclasses import Field, dataclass, field
+from functools import cached_property
 from struct import unpack_from
-from typing import Optional, Union
+from typing import Dict, Iterable, Optional, Sequence, Union, get_type_hints
+
+import numpy as np
 
 from genki_wave.data.enums import ButtonAction, ButtonId, PackageId, PackageType
 from genki_wave.data.points import Euler3d, Point3d, Quaternion, rotate_vector
+from genki_wave.data.rotations import derived_motion
+from genki_wave.data.schema import PackageSchema, SchemaField
 
 
 @dataclass(frozen=True)
@@ -50,6 +55,20 @@ class PackageMetadata:
         return self.id == PackageId.SPECTROGRAM
 
 
+def _host_time_field() -> Field:
+    """A field for a host time of a package, in nanoseconds since the epoch
+
+    Every package type has two:
+        arrival_time_ns: When the read the package was in arrived
+        host_time_ns: When the device sampled the package, estimated from `timestamp_us` with a
+                      `genki_wave.clock.ClockSync`. The arrival time for packages without a `timestamp_us`
+
+    They are set by the protocol that received the package and are `None` for packages created otherwise. The device
+    doesn't send them, so they aren't decoded by the schemas and take no part in comparisons or the flat conversions.
+    """
+    return field(default=None, compare=False, repr=False, metadata={"flat": False})
+
+
 @dataclass(frozen=True)
 class DataPackage:
     """Represents a data package sent from wave
@@ -74,6 +93,8 @@ class DataPackage:
     grav: Point3d = field(init=False)
     acc_glob: Point3d = field(init=False)
     linacc_glob: Point3d = field(init=False)
+    arrival_time_ns: Optional[int] = _host_time_field()
+    host_time_ns: Optional[int] = _host_time_field()
 
     def __post_init__(self):
         # A way to initialize a derived field in a frozen dataclass
@@ -83,25 +104,11 @@ class DataPackage:
 
     @classmethod
     def from_raw_bytes(cls, data: Union[bytearray, bytes]) -> "DataPackage":
-        # Explanation for the byte structure: https://docs.python.org/3/library/struct.html
-        assert len(data) == cls._raw_len, f"Expected the raw data to have len={cls._raw_len}, got len={len(data)}"
-        # These parameters encode how to read the bytes from the stream
-        return cls(
-            gyro=Point3d(*unpack_from("<3f", data, 0)),
-            acc=Point3d(*unpack_from("<3f", data, 12)),
-            mag=Point3d(*unpack_from("<3f", data, 24)),
-            raw_pose=Quaternion(*unpack_from("<4f", data, 36)),
-            current_pose=Quaternion(*unpack_from("<4f", data, 52)),
-            euler=Euler3d(*unpack_from("<3f", data, 68)),
-            linacc=Point3d(*unpack_from("<3f", data, 80)),
-            peak=unpack_from("?", data, 92)[0],
-            peak_norm_velocity=unpack_from("<f", data, 93)[0],
-            timestamp_us=unpack_from("<Q", data, 97)[0],
-        )
+        return DATA_PACKAGE_SCHEMA.from_payload(data)
 
     def as_dict(self) -> dict:
-        # This is (and should be) equivalent to `asdict(self)`, but is about 20-30x faster since it doesn't have
-        # to recursively expand all dataclass fields
+        # This is (and should be) equivalent to `asdict(self)` without the host times, but is about 20-30x faster
+        # since it doesn't have to recursively expand all dataclass fields
         return {
             "gyro": self.gyro.as_dict(),
             "acc": self.acc.as_dict(),
@@ -119,8 +126,8 @@ class DataPackage:
         }
 
     def as_flat_dict(self) -> dict:
-        # This is (and should be) equivalent to `flatten_nested_dicts(asdict(self))`, but is about 20-30x faster since
-        # it doesn't have to recursively expand all dataclass fields
+        # This is (and should be) equivalent to `flatten_nested_dicts(asdict(self))` without the host times, but is
+        # about 20-30x faster since it doesn't have to recursively expand all dataclass fields
         return {
             **self.gyro.as_dict("gyro_"),
             **self.acc.as_dict("acc_"),
@@ -137,6 +144,24 @@ class DataPackage:
             **self.linacc_glob.as_dict("linacc_glob_"),
         }
 
+    def as_flat_tuple(self) -> tuple:
+        """The values of `as_flat_dict` in the order of `flat_keys`, without building a dict, e.g. for a csv row"""
+        return (
+            *self.gyro.as_tuple(),
+            *self.acc.as_tuple(),
+            *self.mag.as_tuple(),
+            *self.raw_pose.as_tuple(),
+            *self.current_pose.as_tuple(),
+            *self.euler.as_tuple(),
+            *self.linacc.as_tuple(),
+            self.peak,
+            self.peak_norm_velocity,
+            self.timestamp_us,
+            *self.grav.as_tuple(),
+            *self.acc_glob.as_tuple(),
+            *self.linacc_glob.as_tuple(),
+        )
+
     @classmethod
     def flat_keys(cls) -> tuple:
         return tuple(flatten_nested_dataclass_fields(cls, None))
@@ -151,30 +176,27 @@ class RawDataPackage:
     gyro: Point3d
     acc: Point3d
     timestamp_us: int
+    arrival_time_ns: Optional[int] = _host_time_field()
+    host_time_ns: Optional[int] = _host_time_field()
 
     @classmethod
     def from_raw_bytes(cls, data: Union[bytearray, bytes]) -> "RawDataPackage":
-        # Explanation for the byte structure: https://docs.python.org/3/library/struct.html
-        if len(data) != cls._raw_len:
-            raise ValueError(f"Expected the raw gyro/accel data to have len={cls._raw_len}, got len={len(data)}", data)
-
-        # These parameters encode how to read the bytes from the stream
-        return cls(
-            gyro=Point3d(*unpack_from("<3f", data, 0)),
-            acc=Point3d(*unpack_from("<3f", data, 12)),
-            timestamp_us=unpack_from("<Q", data, 24)[0],
-        )
+        return RAW_DATA_PACKAGE_SCHEMA.from_payload(data)
 
     def as_dict(self) -> dict:
-        # This is (and should be) equivalent to `asdict(self)`, but is about 20-30x faster since it doesn't have
-        # to recursively expand all dataclass fields
+        # This is (and should be) equivalent to `asdict(self)` without the host times, but is about 20-30x faster
+        # since it doesn't have to recursively expand all dataclass fields
         return {"gyro": self.gyro.as_dict(), "acc": self.acc.as_dict(), "timestamp_us": self.timestamp_us}
 
     def as_flat_dict(self) -> dict:
-        # This is (and should be) equivalent to `flatten_nested_dicts(asdict(self))`, but is about 20-30x faster since
-        # it doesn't have to recursively expand all dataclass fields
+        # This is (and should be) equivalent to `flatten_nested_dicts(asdict(self))` without the host times, but is
+        # about 20-30x faster since it doesn't have to recursively expand all dataclass fields
         return {**self.gyro.as_dict("gyro_"), **self.acc.as_dict("acc_"), "timestamp_us": self.timestamp_us}
 
+    def as_flat_tuple(self) -> tuple:
+        """See `DataPackage.as_flat_tuple`"""
+        return (*self.gyro.as_tuple(), *self.acc.as_tuple(), self.timestamp_us)
+
     @classmethod
     def flat_keys(cls) -> tuple:
         return tuple(flatten_nested_dataclass_fields(cls, None))
@@ -189,13 +211,13 @@ class ButtonEvent:
 
     button_id: ButtonId
     action: ButtonAction
+    arrival_time_ns: Optional[int] = _host_time_field()
+    host_time_ns: Optional[int] = _host_time_field()
 
     @classmethod
     def from_raw_bytes(cls, data: Union[bytearray, bytes]) -> "ButtonEvent":
         """Decomposes raw bytes into its components and returns them as a :class:`ButtonEvent`"""
-        assert len(data) == cls._raw_len, f"Expected to get {cls._raw_len} bytes, got {len(data)}"
-        button_id, action = unpack_from("<BB", data, 0)
-        return cls(button_id=ButtonId(button_id), action=ButtonAction(action))
+        return BUTTON_EVENT_SCHEMA.from_payload(data)
 
 
 @dataclass(frozen=True)
@@ -208,28 +230,23 @@ class DeviceInfo:
     board_version: str
     mac_address: str
     serial_number: str
+    arrival_time_ns: Optional[int] = _host_time_field()
+    host_time_ns: Optional[int] = _host_time_field()
 
     @classmethod
     def from_raw_bytes(cls, data: Union[bytearray, bytes]) -> "DeviceInfo":
-        """Decomposes raw bytes into its components and returns them as a :class:`ButtonEvent`"""
-        assert len(data) == cls._raw_len, f"Expected to get {cls._raw_len} bytes, got {len(data)}"
-
-        version = unpack_from("<3B", data[0:3])
-        board_version = unpack_from("9s", data[3:12])
-        mac_address = unpack_from("<6B", data[12:18])
-        serial_number = unpack_from("17s", data[18:35])
-
-        return cls(
-            version=".".join(f"{x}" for x in version),
-            board_version=board_version[0].decode("utf-8").rstrip("\x00"),
-            mac_address=":".join(f"{b:02x}" for b in mac_address).strip().upper(),
-            serial_number=serial_number[0].decode("utf-8").rstrip("\x00"),
-        )
+        """Decomposes raw bytes into its components and returns them as a :class:`DeviceInfo`"""
+        return DEVICE_INFO_SCHEMA.from_payload(data)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class SpectrogramDataPackage:
-    """Represents a column in a spectrogram sent from wave"""
+    """Represents a column in a spectrogram sent from wave
+
+    `data` is a read-only float32 array of shape (num_channels, num_bins_per_channel) that shares memory with the
+    decoded payload, one row per channel in the order of `channel_names`. Use `channel` to get the bins of a single
+    channel as a view into `data`.
+    """
 
     _num_bins_per_channel = 16
     _num_channels = 6
@@ -239,38 +256,42 @@ class SpectrogramDataPackage:
     _timestamp_bytes = 8
     _raw_len = _data_len + _timestamp_bytes
 
-    _data_format_str = f"<{_num_floats}f"
+    channel_names = ("acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z")
+    _channel_index = {name: i for i, name in enumerate(channel_names)}
 
-    data: list[float]
+    data: np.ndarray
     timestamp_us: int
+    arrival_time_ns: Optional[int] = _host_time_field()
+    host_time_ns: Optional[int] = _host_time_field()
 
     @classmethod
     def from_raw_bytes(cls, data: Union[bytearray, bytes]) -> "SpectrogramDataPackage":
-        if len(data) != cls._raw_len:
-            raise ValueError(f"Expected spectrogram data to have len={cls._raw_len}, got len={len(data)}", data)
+        return SPECTROGRAM_DATA_PACKAGE_SCHEMA.from_payload(data)
 
-        return cls(
-            data=[x for x in unpack_from(cls._data_format_str, data, 0)],
-            timestamp_us=unpack_from("<Q", data, cls._data_len)[0],
-        )
+    def channel(self, name: str) -> np.ndarray:
+        """The bins of channel `name`, e.g. "acc_x", as a view into `data`"""
+        return self.data[self._channel_index[name]]
 
-    def _channel_slice(self, index) -> list:
-        start = index * self._num_bins_per_channel
-        s = slice(start, start + self._num_bins_per_channel, None)
-        return self.data[s]
+    def __eq__(self, other) -> bool:
+        # The generated `__eq__` compares `data` with `==`, which is elementwise for arrays
+        if not isinstance(other, SpectrogramDataPackage):
+            return NotImplemented
+        return self.timestamp_us == other.timestamp_us and np.array_equal(self.data, other.data)
 
     def as_dict(self) -> dict:
-        # This is (and should be) equivalent to `asdict(self)`, but is about 20-30x faster since it doesn't have
-        # to recursively expand all dataclass fields
-        return {
-            "acc_x": self._channel_slice(0),
-            "acc_y": self._channel_slice(1),
-            "acc_z": self._channel_slice(2),
-            "gyro_x": self._channel_slice(3),
-            "gyro_y": self._channel_slice(4),
-            "gyro_z": self._channel_slice(5),
-            "timestamp_us": self.timestamp_us,
-        }
+        # The channels are views into `data`, nothing is copied
+        d = dict(zip(self.channel_names, self.data))
+        d["timestamp_us"] = self.timestamp_us
+        return d
+
+    def as_flat_tuple(self) -> tuple:
+        """Every bin of every channel followed by the timestamp, in the order of `flat_keys`"""
+        return (*self.data.ravel().tolist(), self.timestamp_us)
+
+    @classmethod
+    def flat_keys(cls) -> tuple:
+        bins = (f"{name}_{i}" for name in cls.channel_names for i in range(cls._num_bins_per_channel))
+        return (*bins, "timestamp_us")
 
 
 def flatten_nested_dataclass_fields(d: Union[Field, type], name: Optional[str]) -> list:
@@ -300,9 +321,13 @@ def flatten_nested_dataclass_fields(d: Union[Field, type], name: Optional[str])
     """
     results = []
     if hasattr(d, "__dataclass_fields__"):
-        for k, v in d.__dataclass_fields__.items():
+        # `from __future__ import annotations` turns `Field.type` into a string, so resolve the annotations first
+        type_hints = get_type_hints(d)
+        for k, f in d.__dataclass_fields__.items():
+            if not f.metadata.get("flat", True):
+                continue
             curr_name = f"{name}_{k}" if name is not None else k
-            curr_val = flatten_nested_dataclass_fields(v, curr_name)
+            curr_val = flatten_nested_dataclass_fields(type_hints[k], curr_name)
             results.extend(curr_val)
     elif isinstance(d, Field):
         curr_val = flatten_nested_dataclass_fields(d.type, name)
@@ -313,32 +338,311 @@ def flatten_nested_dataclass_fields(d: Union[Field, type], name: Optional[str])
     return results
 
 
-def process_byte_data(raw_bytes: Union[bytearray, bytes]) -> Union[ButtonEvent, DataPackage, RawDataPackage]:
+def _format_version(*version: int) -> str:
+    return ".".join(f"{x}" for x in version)
+
+
+def _format_mac_address(*mac_address: int) -> str:
+    return ":".join(f"{b:02x}" for b in mac_address).strip().upper()
+
+
+def _decode_str(b: bytes) -> str:
+    return b.decode("utf-8").rstrip("\x00")
+
+
+def _parse_version(version: str) -> tuple:
+    return tuple(int(x) for x in version.split("."))
+
+
+def _parse_mac_address(mac_address: str) -> tuple:
+    return tuple(int(b, 16) for b in mac_address.split(":"))
+
+
+def _encode_str(s: str) -> tuple:
+    return (s.encode("utf-8"),)
+
+
+def _spectrogram_bins(data: bytes) -> np.ndarray:
+    # The floats are read as a single bytes object and wrapped in an array, instead of creating a Python float for
+    # every bin. Arrays over `bytes` are read-only, which keeps the package immutable
+    shape = (SpectrogramDataPackage._num_channels, SpectrogramDataPackage._num_bins_per_channel)
+    return np.frombuffer(data, dtype="<f4").reshape(shape)
+
+
+def _spectrogram_bytes(data: np.ndarray) -> tuple:
+    return (np.ascontiguousarray(data, dtype="<f4").tobytes(),)
+
+
+# The wire layout of every package the device streams. Explanation for the formats:
+# https://docs.python.org/3/library/struct.html
+DATA_PACKAGE_SCHEMA = PackageSchema(
+    DataPackage,
+    (
+        SchemaField("gyro", "3f", Point3d),
+        SchemaField("acc", "3f", Point3d),
+        SchemaField("mag", "3f", Point3d),
+        SchemaField("raw_pose", "4f", Quaternion),
+        SchemaField("current_pose", "4f", Quaternion),
+        SchemaField("euler", "3f", Euler3d),
+        SchemaField("linacc", "3f", Point3d),
+        SchemaField("peak", "?"),
+        SchemaField("peak_norm_velocity", "f"),
+        SchemaField("timestamp_us", "Q"),
+    ),
+)
+RAW_DATA_PACKAGE_SCHEMA = PackageSchema(
+    RawDataPackage,
+    (SchemaField("gyro", "3f", Point3d), SchemaField("acc", "3f", Point3d), SchemaField("timestamp_us", "Q")),
+)
+BUTTON_EVENT_SCHEMA = PackageSchema(
+    ButtonEvent,
+    (SchemaField("button_id", "B", ButtonId), SchemaField("action", "B", ButtonAction), SchemaField(None, "6x")),
+)
+DEVICE_INFO_SCHEMA = PackageSchema(
+    DeviceInfo,
+    (
+        SchemaField("version", "3B", _format_version, encode=_parse_version),
+        SchemaField("board_version", "9s", _decode_str, encode=_encode_str),
+        SchemaField("mac_address", "6B", _format_mac_address, encode=_parse_mac_address),
+        SchemaField("serial_number", "17s", _decode_str, encode=_encode_str),
+    ),
+)
+SPECTROGRAM_DATA_PACKAGE_SCHEMA = PackageSchema(
+    SpectrogramDataPackage,
+    (
+        SchemaField(
+            "data",
+            f"{SpectrogramDataPackage._data_len}s",
+            _spectrogram_bins,
+            dtype=("<f4", (SpectrogramDataPackage._num_channels, SpectrogramDataPackage._num_bins_per_channel)),
+            encode=_spectrogram_bytes,
+        ),
+        SchemaField("timestamp_us", "Q"),
+    ),
+)
+
+# New package types only need a schema and an entry here to be decoded by `process_byte_data`
+PACKAGE_SCHEMAS: Dict[PackageId, PackageSchema] = {
+    PackageId.DATASTREAM: DATA_PACKAGE_SCHEMA,
+    PackageId.BUTTON_EVENT: BUTTON_EVENT_SCHEMA,
+    PackageId.DEVICE_INFO: DEVICE_INFO_SCHEMA,
+    PackageId.RAW_DATA: RAW_DATA_PACKAGE_SCHEMA,
+    PackageId.SPECTROGRAM: SPECTROGRAM_DATA_PACKAGE_SCHEMA,
+}
+
+
+class DataPackageView:
+    """A lazy, read-only stand-in for `DataPackage` backed by the raw payload
+
+    Nothing is decoded up front. Each field is decoded from the payload on first access and memoized, and the derived
+    fields (`grav`, `acc_glob`, `linacc_glob`) are only computed when they are read. Callbacks that only look at a few
+    fields skip the quaternion rotations and most of the object allocations of a `DataPackage`.
+
+    Note: The view keeps a reference to the payload, so the underlying buffer must not be modified afterwards
+
+    Args:
+        payload: The package data without the metadata, see `DataPackage.from_raw_bytes`
+        arrival_time_ns: See `DataPackage.arrival_time_ns`
+        host_time_ns: See `DataPackage.host_time_ns`
+    """
+
+    gyro = DATA_PACKAGE_SCHEMA.lazy_field("gyro")
+    acc = DATA_PACKAGE_SCHEMA.lazy_field("acc")
+    mag = DATA_PACKAGE_SCHEMA.lazy_field("mag")
+    raw_pose = DATA_PACKAGE_SCHEMA.lazy_field("raw_pose")
+    current_pose = DATA_PACKAGE_SCHEMA.lazy_field("current_pose")
+    euler = DATA_PACKAGE_SCHEMA.lazy_field("euler")
+    linacc = DATA_PACKAGE_SCHEMA.lazy_field("linacc")
+    peak = DATA_PACKAGE_SCHEMA.lazy_field("peak")
+    peak_norm_velocity = DATA_PACKAGE_SCHEMA.lazy_field("peak_norm_velocity")
+    timestamp_us = DATA_PACKAGE_SCHEMA.lazy_field("timestamp_us")
+
+    def __init__(
+        self,
+        payload: Union[bytearray, bytes, memoryview],
+        arrival_time_ns: Optional[int] = None,
+        host_time_ns: Optional[int] = None,
+    ):
+        if len(payload) != DATA_PACKAGE_SCHEMA.size:
+            raise ValueError(f"Expected the raw data to have len={DATA_PACKAGE_SCHEMA.size}, got len={len(payload)}")
+        self._payload = payload
+        self.arrival_time_ns = arrival_time_ns
+        self.host_time_ns = host_time_ns
+
+    @cached_property
+    def grav(self) -> Point3d:
+        return self.acc - self.linacc
+
+    @cached_property
+    def acc_glob(self) -> Point3d:
+        return rotate_vector(self.acc, self.current_pose)
+
+    @cached_property
+    def linacc_glob(self) -> Point3d:
+        return rotate_vector(self.linacc, self.current_pose)
+
+    # The dict conversions only use attribute access, so they are shared with `DataPackage`
+    as_dict = DataPackage.as_dict
+    as_flat_dict = DataPackage.as_flat_dict
+    as_flat_tuple = DataPackage.as_flat_tuple
+    flat_keys = DataPackage.flat_keys
+
+    def to_package(self) -> DataPackage:
+        """Decodes everything into a regular `DataPackage`"""
+        return DATA_PACKAGE_SCHEMA.decode(
+            self._payload, arrival_time_ns=self.arrival_time_ns, host_time_ns=self.host_time_ns
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (DataPackage, DataPackageView)):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_package()})"
+
+
+_METADATA_STRUCT = struct.Struct(PackageMetadata._fmt)
+
+
+# Where `timestamp_us` is in the raw bytes of the package types that have one, by package id
+_TIMESTAMP_OFFSETS = {
+    package_id: _METADATA_STRUCT.size + schema.offsets()["timestamp_us"]
+    for package_id, schema in PACKAGE_SCHEMAS.items()
+    if "timestamp_us" in schema.offsets()
+}
+_TIMESTAMP_STRUCT = struct.Struct("<Q")
+
+
+def peek_timestamp_us(raw_bytes: Union[bytearray, bytes, memoryview]) -> Optional[int]:
+    """The `timestamp_us` of the package in `raw_bytes` without decoding it, `None` if it has none or is invalid"""
+    if len(raw_bytes) < _METADATA_STRUCT.size:
+        return None
+    _, q_id, _ = _METADATA_STRUCT.unpack_from(raw_bytes, 0)
+    offset = _TIMESTAMP_OFFSETS.get(q_id)
+    if offset is None or len(raw_bytes) != _METADATA_STRUCT.size + PACKAGE_SCHEMAS[q_id].size:
+        return None
+    return _TIMESTAMP_STRUCT.unpack_from(raw_bytes, offset)[0]
+
+
+def process_byte_data(
+    raw_bytes: Union[bytearray, bytes],
+    lazy: bool = False,
+    arrival_time_ns: Optional[int] = None,
+    host_time_ns: Optional[int] = None,
+) -> Union[ButtonEvent, DataPackage, DataPackageView, RawDataPackage]:
     """Factory function that takes raw bytes and translates into a button event or data
 
     Args:
         raw_bytes: The input raw bytes
+        lazy: If `True` data packages are returned as a `DataPackageView` that decodes on access
+        arrival_time_ns: The arrival time of the package, see `DataPackage.arrival_time_ns`
+        host_time_ns: The estimated host time of the package, see `DataPackage.host_time_ns`
 
     Returns:
         The resulting button event or data
     """
-    q = PackageMetadata.from_raw_bytes(raw_bytes)
-    raw_bytes_data = PackageMetadata.split_out_data_from_metadata(raw_bytes)
-
-    if q.is_data():
-        package = DataPackage.from_raw_bytes(raw_bytes_data)
-    elif q.is_button():
-        package = ButtonEvent.from_raw_bytes(raw_bytes_data)
-    elif q.is_device_info():
-        package = DeviceInfo.from_raw_bytes(raw_bytes_data)
-    elif q.is_raw_gyro_accel():
-        package = RawDataPackage.from_raw_bytes(raw_bytes_data)
-    elif q.is_spectrogram():
-        package = SpectrogramDataPackage.from_raw_bytes(raw_bytes_data)
-    else:
-        raise ValueError(f"Unknown value for q.id={q.id}")
+    _, q_id, _ = _METADATA_STRUCT.unpack_from(raw_bytes, 0)
+
+    schema = PACKAGE_SCHEMAS.get(q_id)
+    if schema is None:
+        raise ValueError(f"Unknown value for q.id={q_id}")
+
+    payload_len = len(raw_bytes) - _METADATA_STRUCT.size
+    if payload_len != schema.size:
+        raise ValueError(f"Expected {schema.cls.__name__} data to have len={schema.size}, got len={payload_len}")
+
+    if lazy and schema is DATA_PACKAGE_SCHEMA:
+        return DataPackageView(memoryview(raw_bytes)[_METADATA_STRUCT.size :], arrival_time_ns, host_time_ns)
+
+    return schema.decode(raw_bytes, _METADATA_STRUCT.size, arrival_time_ns=arrival_time_ns, host_time_ns=host_time_ns)
+
+
+Package = Union[DataPackage, DataPackageView, RawDataPackage, SpectrogramDataPackage]
+
+
+# Structured dtypes that mirror the wire layout of the packages byte for byte (packed, little-endian). Decoding a batch
+# of payloads is then a single `np.frombuffer` call instead of a `struct` call and dataclasses per frame
+DATA_PACKAGE_DTYPE = DATA_PACKAGE_SCHEMA.dtype
+RAW_DATA_PACKAGE_DTYPE = RAW_DATA_PACKAGE_SCHEMA.dtype
+
+
+def _decode_batch(payloads: Union[bytes, bytearray, memoryview, Iterable[bytes]], dtype: np.dtype) -> np.ndarray:
+    if isinstance(payloads, np.ndarray):
+        # E.g. the (n, payload_size) arrays from `DecodedFrames.payloads`
+        return np.ascontiguousarray(payloads, dtype=np.uint8).reshape(-1).view(dtype)
+    if not isinstance(payloads, (bytes, bytearray, memoryview)):
+        payloads = b"".join(payloads)
+
+    if len(payloads) % dtype.itemsize != 0:
+        raise ValueError(f"Expected the raw data to be a multiple of len={dtype.itemsize}, got len={len(payloads)}")
+
+    return np.frombuffer(payloads, dtype=dtype)
 
-    return package
 
+def decode_data_packages(payloads: Union[bytes, bytearray, memoryview, Iterable[bytes]]) -> np.ndarray:
+    """Decodes many `DataPackage` payloads in one pass into a structured array of `DATA_PACKAGE_DTYPE`
 
-Package = Union[DataPackage, RawDataPackage, SpectrogramDataPackage]
+    The payloads are the de-framed package data, i.e. what `DataPackage.from_raw_bytes` takes, without the metadata.
+
+    Args:
+        payloads: Either one contiguous buffer of back-to-back payloads, a uint8 array with one payload per row or an
+                  iterable of single payloads
+
+    Returns:
+        A structured array with one row per package, e.g. `batch["gyro"]["x"]` or `batch["timestamp_us"]`. Derived
+        fields (`grav`, `acc_glob`, `linacc_glob`) are not included. When `payloads` is a single buffer the result is a
+        view into it, not a copy
+    """
+    return _decode_batch(payloads, DATA_PACKAGE_DTYPE)
+
+
+def decode_raw_data_packages(payloads: Union[bytes, bytearray, memoryview, Iterable[bytes]]) -> np.ndarray:
+    """Same as `decode_data_packages`, but for `RawDataPackage` payloads, see `RAW_DATA_PACKAGE_DTYPE`"""
+    return _decode_batch(payloads, RAW_DATA_PACKAGE_DTYPE)
+
+
+def flat_columns(batch: np.ndarray) -> dict:
+    """Splits a structured batch into flat, named columns, keyed like `as_flat_dict`. The columns are views"""
+    columns = {}
+    for k in batch.dtype.names:
+        sub = batch[k]
+        if sub.dtype.names is None:
+            columns[k] = sub
+        else:
+            columns.update({f"{k}_{name}": col for name, col in flat_columns(sub).items()})
+    return columns
+
+
+def batch_from_packages(packages: Sequence[Package], dtype: np.dtype) -> np.ndarray:
+    """Copies decoded packages into a structured array of `dtype`, e.g. `RAW_DATA_PACKAGE_DTYPE`, without encoding them
+
+    The fields are copied a column at a time. `zip` leaves out the derived fields at the end of `as_flat_tuple`, since
+    the batch only has columns for the fields that are sent.
+    """
+    batch = np.empty(len(packages), dtype=dtype)
+    for column, values in zip(flat_columns(batch).values(), zip(*(p.as_flat_tuple() for p in packages))):
+        column[:] = values
+    return batch
+
+
+def columnar_batch(packages: Iterable[Package]) -> Dict[str, np.ndarray]:
+    """Turns the `DataPackage`s (and `DataPackageView`s) in `packages` into flat columns, keyed like `as_flat_dict`
+
+    Other package types are skipped. Includes the derived fields, computed for the whole batch at once, so the columns
+    are in the order of `DataPackage.flat_keys`. Useful for callbacks that get their packages in batches, see
+    `WaveCallback._batch_handler`.
+    """
+    packages = [p for p in packages if isinstance(p, (DataPackage, DataPackageView))]
+    is_view = np.array([isinstance(p, DataPackageView) for p in packages], dtype=bool)
+    batch = np.empty(len(packages), dtype=DATA_PACKAGE_DTYPE)
+    if is_view.any():
+        # The views still have their payloads, which decode in one pass
+        batch[is_view] = decode_data_packages([p._payload for p, view in zip(packages, is_view) if view])
+    if not is_view.all():
+        decoded = [p for p, view in zip(packages, is_view) if not view]
+        batch[~is_view] = batch_from_packages(decoded, DATA_PACKAGE_DTYPE)
+    columns = flat_columns(batch)
+    for name, values in derived_motion(batch).items():
+        columns.update({f"{name}_{axis}": values[:, i] for i, axis in enumerate("xyz")})
+    return columns
@@ -0,0 +1,97 @@
+"""Vectorized quaternion math on arrays of samples
+
+The batch counterparts of `Quaternion` and `rotate_vector` in `genki_wave.data.points`. Quaternions are (N, 4) arrays
+ordered (w, x, y, z) and vectors are (N, 3) arrays ordered (x, y, z). Single samples of shape (4,) and (3,) broadcast
+as usual. The results keep the floating point type of the inputs.
+"""
+import numpy as np
+from numpy.lib import recfunctions
+
+
+def normalize(q: np.ndarray) -> np.ndarray:
+    """Scales every quaternion to unit length"""
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def conjugate(q: np.ndarray) -> np.ndarray:
+    return q * np.array([1, -1, -1, -1], dtype=q.dtype)
+
+
+def multiply(q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    """The Hamilton product `q1 * q2`, see `Quaternion.__mul__`"""
+    w1, x1, y1, z1 = np.moveaxis(q1, -1, 0)
+    w2, x2, y2, z2 = np.moveaxis(q2, -1, 0)
+
+    w = w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2
+    x = w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2
+    y = w1 * y2 + y1 * w2 + z1 * x2 - x1 * z2
+    z = w1 * z2 + z1 * w2 + x1 * y2 - y1 * x2
+    return np.stack([w, x, y, z], axis=-1)
+
+
+def rotate_vectors(v: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """Rotates every vector by the matching quaternion, equivalent to `rotate_vector` but for arrays
+
+    Uses `v' = v + 2w(u x v) + 2u x (u x v)` for a unit quaternion `(w, u)`, which is the same as `q * v * q^-1` without
+    the intermediate quaternions.
+    """
+    q = normalize(q)
+    w, u = q[..., :1], q[..., 1:]
+    t = 2 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def to_euler(q: np.ndarray) -> np.ndarray:
+    """Converts quaternions to (roll, pitch, yaw) in radians
+
+    Uses the same convention and the same formulas as the device, so `to_euler` of `DataPackage.current_pose` matches
+    `DataPackage.euler`. Like on the device the quaternions aren't normalized first.
+    """
+    w, x, y, z = np.moveaxis(q, -1, 0)
+
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (x * z - w * y), -1, 1))
+    yaw = -np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return np.stack([roll, pitch, yaw], axis=-1)
+
+
+def slerp(q0: np.ndarray, q1: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Spherical linear interpolation from `q0` (t=0) to `q1` (t=1), along the shortest path"""
+    q0, q1 = normalize(q0), normalize(q1)
+    t = np.asarray(t, dtype=q0.dtype)[..., None]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    # `q` and `-q` are the same rotation, flip one of them to take the short way around
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.clip(np.abs(dot), 0, 1)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    # Fall back to linear interpolation when the quaternions are (nearly) the same, to avoid dividing by ~0
+    close = sin_theta < 1e-6
+    safe_sin_theta = np.where(close, 1, sin_theta)
+    s0 = np.where(close, 1 - t, np.sin((1 - t) * theta) / safe_sin_theta)
+    s1 = np.where(close, t, np.sin(t * theta) / safe_sin_theta)
+    return normalize(s0 * q0 + s1 * q1)
+
+
+def as_array(columns: np.ndarray) -> np.ndarray:
+    """Turns a structured column, e.g. `batch["acc"]` or `batch["current_pose"]`, into a plain (N, k) array"""
+    return recfunctions.structured_to_unstructured(columns)
+
+
+def derived_motion(batch: np.ndarray) -> dict:
+    """Computes the derived fields of `DataPackage` for a whole batch at once
+
+    Args:
+        batch: A structured array of `DATA_PACKAGE_DTYPE`, e.g. from `decode_data_packages`
+
+    Returns:
+        (N, 3) arrays of `grav`, `acc_glob` and `linacc_glob`
+    """
+    acc, linacc, pose = as_array(batch["acc"]), as_array(batch["linacc"]), as_array(batch["current_pose"])
+    return {
+        "grav": acc - linacc,
+        "acc_glob": rotate_vectors(acc, pose),
+        "linacc_glob": rotate_vectors(linacc, pose),
+    }
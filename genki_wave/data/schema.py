@@ -0,0 +1,176 @@
+import struct
+from dataclasses import MISSING, dataclass, fields, is_dataclass
+from typing import Any, Callable, Optional, Tuple, Union
+
+import numpy as np
+
+# Maps `struct` format characters to the equivalent little-endian numpy types, used to derive structured dtypes
+_STRUCT_TO_NUMPY = {"?": "?", "B": "<u1", "H": "<u2", "I": "<u4", "Q": "<u8", "f": "<f4", "d": "<f8"}
+
+
+@dataclass(frozen=True)
+class SchemaField:
+    """A single field of a package as it is laid out on the wire
+
+    Args:
+        name: Name of the argument of the package class this field is passed to, `None` for padding
+        fmt: `struct` format of the field without the byte order, e.g. "3f" or "9s"
+        convert: Called with the unpacked values of the field to create the value passed to the package class,
+                 e.g. `Point3d`. If `None` the field must unpack to a single value which is passed on as is
+        dtype: The numpy type of the field in `PackageSchema.dtype`. Only needed when it can't be derived from `fmt`,
+               e.g. a block of floats that is read as bytes ("384s") and converted straight into an array
+        encode: The inverse of `convert`, called with the value of the field and returns the values to pack. Only needed
+                if the value isn't a dataclass (packed field by field) or a single value that is packed as is
+    """
+
+    name: Optional[str]
+    fmt: str
+    convert: Optional[Callable] = None
+    dtype: Any = None
+    encode: Optional[Callable] = None
+
+
+class PackageSchema:
+    """A declarative description of a package that compiles into a single `struct.Struct`
+
+    The fields must be listed in wire order and the named fields must match the `__init__` arguments of `cls`, in the
+    same order. Decoding a payload is then one `unpack_from` call followed by constructing `cls`.
+
+    Args:
+        cls: The package class that is created, e.g. `DataPackage`
+        schema_fields: The fields of the package, see `SchemaField`
+    """
+
+    def __init__(self, cls: type, schema_fields: Tuple[SchemaField, ...]):
+        self.cls = cls
+        self.fields = schema_fields
+        self.struct = struct.Struct("<" + "".join(f.fmt for f in schema_fields))
+
+        # Fields with a default aren't sent by the device, e.g. the host times of the packages
+        init_names = [f.name for f in fields(cls) if f.init and f.default is MISSING and f.default_factory is MISSING]
+        schema_names = [f.name for f in schema_fields if f.name is not None]
+        if init_names != schema_names:
+            raise ValueError(f"Expected the schema fields {schema_names} to match the fields of {cls} {init_names}")
+
+        raw_len = getattr(cls, "_raw_len", self.struct.size)
+        if raw_len != self.struct.size:
+            raise ValueError(f"Expected the schema of {cls} to have size={raw_len}, got size={self.struct.size}")
+
+        # (name, convert, start, stop, offset) for every named field. `start` and `stop` index the values returned by
+        # `struct.unpack` and `offset` is the byte offset of the field in the payload
+        layout = []
+        start, offset = 0, 0
+        for f in schema_fields:
+            num_values = len(struct.unpack("<" + f.fmt, bytes(struct.calcsize("<" + f.fmt))))
+            if f.name is not None:
+                if f.convert is None and num_values != 1:
+                    raise ValueError(f"Field {f.name} unpacks to {num_values} values and needs a `convert`")
+                layout.append((f.name, f.convert, start, start + num_values, offset))
+            start += num_values
+            offset += struct.calcsize("<" + f.fmt)
+        self._layout = tuple(layout)
+
+    @property
+    def size(self) -> int:
+        return self.struct.size
+
+    def offsets(self) -> dict:
+        """Byte offset of every named field in the payload"""
+        return {name: offset for name, _, _, _, offset in self._layout}
+
+    def lazy_field(self, name: str) -> "LazyField":
+        """A descriptor that decodes the field `name` on first access, see `LazyField`"""
+        for field_name, convert, _, _, offset in self._layout:
+            if field_name == name:
+                fmt = next(f.fmt for f in self.fields if f.name == name)
+                return LazyField(fmt, convert, offset)
+        raise ValueError(f"Unknown field {name} for {self.cls}")
+
+    def decode(self, data: Union[bytearray, bytes, memoryview], offset: int = 0, **kwargs: Any) -> Any:
+        """Decodes a payload starting at `offset` in `data`. Assumes the length has already been checked
+
+        `kwargs` are passed on to the package class, for the fields that aren't in the payload
+        """
+        values = self.struct.unpack_from(data, offset)
+        return self.cls(
+            *[
+                values[start] if convert is None else convert(*values[start:stop])
+                for _, convert, start, stop, _ in self._layout
+            ],
+            **kwargs,
+        )
+
+    def from_payload(self, data: Union[bytearray, bytes, memoryview]) -> Any:
+        """Same as `decode`, but checks that `data` is exactly one payload long"""
+        if len(data) != self.struct.size:
+            raise ValueError(f"Expected {self.cls.__name__} data to have len={self.struct.size}, got len={len(data)}")
+        return self.decode(data)
+
+    def encode(self, package: Any) -> bytes:
+        """The inverse of `decode`, packs `package` into a payload"""
+        values = []
+        for f in self.fields:
+            if f.name is None:
+                continue
+            value = getattr(package, f.name)
+            if f.encode is not None:
+                values.extend(f.encode(value))
+            elif is_dataclass(value):
+                values.extend(getattr(value, sub.name) for sub in fields(value))
+            else:
+                values.append(value)
+        return self.struct.pack(*values)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """A structured numpy dtype with the same memory layout as the payload
+
+        Fields that are converted into a dataclass become nested fields named after the dataclass fields
+        """
+        names, formats, offsets = [], [], []
+        named_fields = (f for f in self.fields if f.name is not None)
+        for f, (name, _, start, stop, offset) in zip(named_fields, self._layout):
+            names.append(name)
+            offsets.append(offset)
+            formats.append(_field_dtype(f, stop - start))
+
+        return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": self.struct.size})
+
+
+def _field_dtype(f: SchemaField, num_values: int) -> Union[np.dtype, str, tuple]:
+    if f.dtype is not None:
+        return f.dtype
+    if f.fmt.endswith("s"):
+        return f"S{f.fmt[:-1] or 1}"
+
+    base = _STRUCT_TO_NUMPY[f.fmt[-1]]
+    if num_values == 1:
+        return base
+    if is_dataclass(f.convert):
+        return np.dtype([(sub.name, base) for sub in fields(f.convert)])
+    return base, (num_values,)
+
+
+class LazyField:
+    """Decodes a single field from the `_payload` of the instance on first access and memoizes it
+
+    The decoded value is stored in the instance `__dict__` under the same name, and since this is a non-data descriptor
+    every later access is a plain attribute lookup.
+    """
+
+    def __init__(self, fmt: str, convert: Optional[Callable], offset: int):
+        self._struct = struct.Struct("<" + fmt)
+        self._convert = convert
+        self._offset = offset
+        self._name = None
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._name = name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is None:
+            return self
+        values = self._struct.unpack_from(instance._payload, self._offset)
+        value = values[0] if self._convert is None else self._convert(*values)
+        instance.__dict__[self._name] = value
+        return value
@@ -1,12 +1,133 @@
+import asyncio
+from collections import deque
 from queue import Queue
-from typing import Optional, Any
+from typing import NamedTuple, Optional, Any, Sequence, Union
+
+import numpy as np
+
+from genki_wave.data.enums import OverflowPolicy
+from genki_wave.data.organization import (
+    DATA_PACKAGE_DTYPE,
+    ButtonEvent,
+    DataPackage,
+    DeviceInfo,
+    Package,
+    RawDataPackage,
+    flat_columns,
+)
+
+
+class _EndOfStream:
+    def __repr__(self) -> str:
+        return "END_OF_STREAM"
+
+
+# Put on the queue of a protocol after the last package of a finite stream, e.g. a replayed recording, so consumers
+# know to stop instead of waiting for more data
+END_OF_STREAM = _EndOfStream()
+
+
+class TaggedPackage(NamedTuple):
+    """A package together with the device it came from, used when several devices share a queue
+
+    Args:
+        device: The bluetooth address or serial port of the device
+        package: The decoded package
+    """
+
+    device: str
+    package: Union[ButtonEvent, DeviceInfo, Package]
+
+
+class Timestamped(NamedTuple):
+    """An item together with the time it was queued at, from `time.perf_counter`"""
+
+    time: float
+    item: Any
+
+
+def _type_key(item: Any) -> Any:
+    """The 'type' of an item for `OverflowPolicy.KEEP_LATEST_PER_TYPE`, tagged packages are also keyed by device"""
+    if isinstance(item, Timestamped):
+        return _type_key(item.item)
+    if isinstance(item, TaggedPackage):
+        return item.device, type(item.package)
+    return type(item)
+
+
+def _make_room(items: deque, item: Any, policy: OverflowPolicy) -> bool:
+    """Applies a non-blocking `policy` to the full `items` before `item` is added
+
+    Returns:
+        `True` if an old item was removed to make room for `item`, `False` if `item` should be dropped instead
+    """
+    if policy == OverflowPolicy.DROP_NEWEST:
+        # `END_OF_STREAM` is never dropped, consumers rely on seeing it
+        if item is not END_OF_STREAM:
+            return False
+    elif policy == OverflowPolicy.KEEP_LATEST_PER_TYPE:
+        key = _type_key(item)
+        for i, queued in enumerate(items):
+            if _type_key(queued) == key:
+                del items[i]
+                return True
+
+    items.popleft()
+    return True
 
 
 class QueueWithPop(Queue):
-    """A Queue that implements convenience methods"""
+    """A Queue that implements convenience methods
+
+    The queue can be bounded with `maxsize`, in which case `policy` decides what happens when it's full, see
+    `OverflowPolicy`. The number of items dropped is counted in `num_dropped` and the largest size the queue reached
+    in `high_water_mark`.
+
+    Besides the regular `Queue` interface it has bulk methods for handing data over between threads, `put_many` and
+    `pop_all` each take the lock of the queue once, no matter how many items they move.
+    """
 
-    def __init__(self, maxsize=0):
+    def __init__(self, maxsize=0, policy: OverflowPolicy = OverflowPolicy.BLOCK):
         super().__init__(maxsize=maxsize)
+        self.policy = policy
+        self.num_dropped = 0
+        self.high_water_mark = 0
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        if self.policy == OverflowPolicy.BLOCK:
+            super().put(item, block, timeout)
+            # Only an approximation under contention, which is good enough for a statistic
+            self.high_water_mark = max(self.high_water_mark, self.qsize())
+        else:
+            self.put_many((item,))
+
+    def put_many(self, items: Sequence[Any]) -> None:
+        """Puts all `items` on the queue in order, e.g. all packages decoded from one read
+
+        With `OverflowPolicy.BLOCK` and a full queue it waits for room, like `put`.
+        """
+        if not items:
+            return
+
+        with self.not_full:
+            for item in items:
+                if 0 < self.maxsize <= self._qsize():
+                    if self.policy == OverflowPolicy.BLOCK:
+                        # Let the consumer know about what was put so far before waiting for it to make room
+                        self.high_water_mark = max(self.high_water_mark, self._qsize())
+                        self.not_empty.notify()
+                        while self._qsize() >= self.maxsize:
+                            self.not_full.wait()
+                    else:
+                        self.num_dropped += 1
+                        if not _make_room(self.queue, item, self.policy):
+                            continue
+                        # The removed item will never be marked as done
+                        self.unfinished_tasks -= 1
+                self._put(item)
+                self.unfinished_tasks += 1
+            self.high_water_mark = max(self.high_water_mark, self._qsize())
+            self.not_empty.notify()
 
     def pop(self) -> Optional[Any]:
         """'safe' `pop`. Returns `None` if the queue is empty"""
@@ -17,9 +138,125 @@ class QueueWithPop(Queue):
 
         return val
 
-    def pop_all(self):
-        """Fetches everything on the Queue"""
-        results = []
-        while self.qsize() > 0:
-            results.append(self.pop())
-        return results
+    def pop_all(self) -> list:
+        """Fetches everything on the Queue and marks it as done, so `join` doesn't wait for `task_done` calls
+
+        Swaps out the underlying deque under the lock instead of getting the items one by one.
+        """
+        with self.mutex:
+            items, self.queue = self.queue, deque()
+            if items:
+                self.unfinished_tasks -= len(items)
+                if self.unfinished_tasks <= 0:
+                    self.all_tasks_done.notify_all()
+                self.not_full.notify_all()
+        return list(items)
+
+
+class BoundedAsyncQueue(asyncio.Queue):
+    """An `asyncio.Queue` with the overflow policies and statistics of `QueueWithPop`
+
+    With any policy other than `OverflowPolicy.BLOCK`, `put` never waits and `put_nowait` never raises `QueueFull`.
+    """
+
+    def __init__(self, maxsize: int = 0, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        super().__init__(maxsize=maxsize)
+        self.policy = policy
+        self.num_dropped = 0
+        self.high_water_mark = 0
+
+    async def put(self, item: Any) -> None:
+        if self.policy == OverflowPolicy.BLOCK:
+            await super().put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item: Any) -> None:
+        if self.policy != OverflowPolicy.BLOCK and self.full():
+            self.num_dropped += 1
+            if not _make_room(self._queue, item, self.policy):
+                return
+            # The removed item will never be marked as done
+            self._unfinished_tasks -= 1
+        super().put_nowait(item)
+        self.high_water_mark = max(self.high_water_mark, self.qsize())
+
+
+class ColumnarRingBuffer:
+    """A fixed-capacity ring buffer that stores packages column by column (struct-of-arrays)
+
+    Every channel, e.g. `gyro_x`, is a `float32` array and the timestamps are a `uint64` array. Each column is twice as
+    long as `capacity` and every sample is written to both halves, so any window of the most recent samples is a
+    contiguous slice and all queries return views instead of copies. The views are only valid until the samples they
+    cover are overwritten, copy them if they need to outlive that.
+
+    Args:
+        capacity: The maximum number of samples that are kept
+        dtype: The structured dtype of the packages stored, see `DATA_PACKAGE_DTYPE` and `RAW_DATA_PACKAGE_DTYPE`
+    """
+
+    _timestamp_key = "timestamp_us"
+
+    def __init__(self, capacity: int, dtype: np.dtype = DATA_PACKAGE_DTYPE):
+        if capacity <= 0:
+            raise ValueError(f"Expected a positive capacity, got {capacity}")
+
+        self._capacity = capacity
+        self._head = 0
+        self._size = 0
+        self._channels = tuple(k for k in flat_columns(np.zeros(0, dtype=dtype)) if k != self._timestamp_key)
+        self._columns = {k: np.zeros(2 * capacity, dtype=np.float32) for k in self._channels}
+        self._columns[self._timestamp_key] = np.zeros(2 * capacity, dtype=np.uint64)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def channels(self) -> tuple:
+        return self._channels
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _write(self, column: np.ndarray, values: np.ndarray) -> None:
+        n, head, capacity = len(values), self._head, self._capacity
+        first = min(n, capacity - head)
+        for offset in (0, capacity):
+            column[offset + head : offset + head + first] = values[:first]
+            column[offset : offset + n - first] = values[first:]
+
+    def extend(self, batch: np.ndarray) -> None:
+        """Appends a structured batch, e.g. from `decode_data_packages`, only the last `capacity` samples are kept"""
+        batch = batch[-self._capacity :]
+        for k, values in flat_columns(batch).items():
+            self._write(self._columns[k], values)
+
+        self._head = (self._head + len(batch)) % self._capacity
+        self._size = min(self._size + len(batch), self._capacity)
+
+    def append(self, package: Union[DataPackage, RawDataPackage]) -> None:
+        """Appends a single decoded package"""
+        head, capacity = self._head, self._capacity
+        for k, v in package.as_flat_dict().items():
+            column = self._columns.get(k)
+            if column is not None:
+                column[head] = column[head + capacity] = v
+
+        self._head = (head + 1) % capacity
+        self._size = min(self._size + 1, capacity)
+
+    def last(self, n: int) -> dict:
+        """Views of the `n` most recent samples (or fewer if fewer are stored), oldest first"""
+        n = max(0, min(n, self._size))
+        end = self._head + self._capacity
+        return {k: v[end - n : end] for k, v in self._columns.items()}
+
+    def since(self, timestamp_us: int) -> dict:
+        """Views of all stored samples with a timestamp at or after `timestamp_us`, oldest first
+
+        Assumes the timestamps were appended in increasing order
+        """
+        window = self.last(self._size)
+        start = int(np.searchsorted(window[self._timestamp_key], np.uint64(timestamp_us), side="left"))
+        return {k: v[start:] for k, v in window.items()}
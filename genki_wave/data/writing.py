@@ -2,7 +2,7 @@ import struct
 
 from cobs import cobs
 
-from genki_wave.data.organization import PackageMetadata
+from genki_wave.data.organization import PACKAGE_SCHEMAS, PackageMetadata
 from genki_wave.data.enums import DeviceMode, PackageId, PackageType, DatastreamType
 
 
@@ -23,6 +23,19 @@ def create_package_to_write(p: PackageMetadata, data: bytes = bytearray()) -> by
     return b_buffer
 
 
+# The inverse of `PACKAGE_SCHEMAS`, which package id each package class is sent with
+_PACKAGE_IDS = {schema.cls: package_id for package_id, schema in PACKAGE_SCHEMAS.items()}
+
+
+def encode_package(package, package_type: PackageType = PackageType.STREAM) -> bytes:
+    """Encodes a package, e.g. a `DataPackage`, into a frame as the device sends it. Mostly useful for testing"""
+    package_id = _PACKAGE_IDS[type(package)]
+    payload = PACKAGE_SCHEMAS[package_id].encode(package)
+    return create_package_to_write(
+        PackageMetadata(type=package_type, id=package_id, payload_size=len(payload)), payload
+    )
+
+
 def get_start_api_package():
     """Get the package that puts the Wave ring into 'API mode' when it's sent to the device"""
     return create_package_to_write(
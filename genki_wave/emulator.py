@@ -0,0 +1,276 @@
+"""A simulated Wave ring on a pseudo-terminal, for testing and load testing the serial path without hardware
+
+The emulator opens a pty pair and acts as the ring on one end, the other end (`port`) is opened like any serial port:
+
+    >>> with WaveEmulator(rate_hz=2000) as emulator:  # doctest: +SKIP
+    ...     run_asyncio_serial(callbacks, emulator.port)
+
+Only works on systems with ptys, i.e. Linux and macOS.
+"""
+import logging
+import math
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from typing import List, Optional
+
+import numpy as np
+from cobs import cobs
+
+from genki_wave.constants import FIRMWARE_VERSION
+from genki_wave.data.enums import ButtonAction, ButtonId, DatastreamType, DeviceMode, PackageId, PackageType
+from genki_wave.data.organization import (
+    ButtonEvent,
+    DataPackage,
+    DeviceInfo,
+    PackageMetadata,
+    RawDataPackage,
+    SpectrogramDataPackage,
+)
+from genki_wave.data.points import Euler3d, Point3d, Quaternion
+from genki_wave.data.writing import encode_package
+from genki_wave.framing import FrameSplitter
+
+logger = logging.getLogger(__name__)
+
+# The payload of a `MODIFY_API_CONFIG` request, see `genki_wave.data.writing`
+_API_CONFIG_STRUCT = struct.Struct("<BBxxf")
+
+
+def _motion_sample(t: float, timestamp_us: int, datastream_type: DatastreamType):
+    """A ring that slowly turns around the z-axis and shakes a little, at time `t` in seconds"""
+    angle = math.pi * t
+    shake = 0.1 * math.sin(2 * math.pi * 5 * t)
+    gyro = Point3d(0.0, 0.0, 180.0)
+    acc = Point3d(shake, 0.0, 1.0)
+    if datastream_type == DatastreamType.RAW_DATA:
+        return RawDataPackage(gyro=gyro, acc=acc, timestamp_us=timestamp_us)
+
+    pose = Quaternion(math.cos(angle / 2), 0.0, 0.0, math.sin(angle / 2))
+    return DataPackage(
+        gyro=gyro,
+        acc=acc,
+        mag=Point3d(math.cos(angle), -math.sin(angle), 0.0),
+        raw_pose=pose,
+        current_pose=pose,
+        euler=Euler3d(0.0, 0.0, math.remainder(angle, 2 * math.pi)),
+        linacc=Point3d(shake, 0.0, 0.0),
+        peak=False,
+        peak_norm_velocity=0.0,
+        timestamp_us=timestamp_us,
+    )
+
+
+class WaveEmulator(threading.Thread):
+    """Emulates a Wave ring connected over serial
+
+    Answers the requests created in `genki_wave.data.writing`: a device info request is answered with a `DeviceInfo`,
+    putting the device into API mode starts the stream and `MODIFY_API_CONFIG` changes what is streamed and how fast.
+    Packages are streamed on a fixed schedule, and packages that fall behind it are sent as soon as possible, like a
+    device that buffers while the host is busy.
+
+    Faults can be injected at any time from another thread, see `corrupt`, `burst` and `stall`. Bytes that don't fit in
+    the pty buffer because the other end isn't reading are dropped and counted in `num_dropped_bytes`.
+
+    Args:
+        rate_hz: Packages per second of the motion stream, e.g. 400 or 2000
+        datastream_type: What is streamed, motion data (`DataPackage`), raw data (`RawDataPackage`) or nothing
+        enable_spectrogram: Also stream a `SpectrogramDataPackage` every `spectrogram_interval` samples
+        spectrogram_interval: Number of samples per spectrogram column
+        stream_on_start: Start streaming right away instead of waiting for a request to enter API mode
+        seed: Seed for the random corruption
+    """
+
+    def __init__(
+        self,
+        rate_hz: float = 400.0,
+        datastream_type: DatastreamType = DatastreamType.MOTION_DATA,
+        enable_spectrogram: bool = False,
+        spectrogram_interval: int = 16,
+        stream_on_start: bool = False,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(daemon=True)
+        self.rate_hz = rate_hz
+        self.datastream_type = datastream_type
+        self.enable_spectrogram = enable_spectrogram
+        self.spectrogram_interval = spectrogram_interval
+        self.streaming = stream_on_start
+        self.device_info = DeviceInfo(
+            version=FIRMWARE_VERSION,
+            board_version="emulator",
+            mac_address="02:00:00:00:00:01",
+            serial_number="EMU-0001",
+        )
+
+        self.num_samples = 0
+        self.num_frames_sent = 0
+        self.num_dropped_bytes = 0
+
+        self._master, self._slave = os.openpty()
+        # No echo or line processing, the bytes go through untouched in both directions
+        tty.setraw(self._slave)
+        tty.setraw(self._master)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+
+        self._alive = True
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._framer = FrameSplitter()
+        self._next_sample_time = None
+        self._pending: List[bytes] = []
+        self._num_corrupt = 0
+        self._num_burst = 0
+        self._stall_until = 0.0
+        self._drop_stalled = False
+
+    # Fault injection, safe to call from any thread
+
+    def corrupt(self, num_frames: int = 1) -> None:
+        """Replaces a random byte with a zero byte in each of the next `num_frames` frames, splitting it in two"""
+        with self._lock:
+            self._num_corrupt += num_frames
+
+    def burst(self, num_samples: int) -> None:
+        """Sends the next `num_samples` samples at once in a single write, followed by a gap until the schedule catches
+        up
+        """
+        with self._lock:
+            self._num_burst += num_samples
+
+    def stall(self, seconds: float, drop: bool = False) -> None:
+        """Stops sending for `seconds`. The samples due in the meantime are sent in a burst afterwards, or dropped"""
+        with self._lock:
+            self._stall_until = time.perf_counter() + seconds
+            self._drop_stalled = drop
+
+    def press(self, button_id: ButtonId, action: ButtonAction = ButtonAction.CLICK) -> None:
+        """Sends a button event"""
+        with self._lock:
+            self._pending.append(encode_package(ButtonEvent(button_id=button_id, action=action)))
+
+    # Thread
+
+    def run(self) -> None:
+        while self._alive:
+            timeout = 0.1
+            if self.streaming:
+                now = time.perf_counter()
+                if self._next_sample_time is None:
+                    self._next_sample_time = now
+                wake_time = self._stream(now)
+                timeout = max(0.0, min(timeout, wake_time - time.perf_counter()))
+
+            with self._lock:
+                pending, self._pending = self._pending, []
+            self._send(pending)
+
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                self._read_requests()
+
+    def stop(self) -> None:
+        """Stops the emulator and closes the pty"""
+        self._alive = False
+        if self.is_alive():
+            self.join(2)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self) -> "WaveEmulator":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def _stream(self, now: float) -> float:
+        """Sends all samples that are due at `now` and returns when the next one is"""
+        with self._lock:
+            if now < self._stall_until:
+                if self._drop_stalled:
+                    # Keep the schedule moving without sending anything
+                    self._next_sample_time = self._stall_until
+                return self._stall_until
+            num_burst, self._num_burst = self._num_burst, 0
+
+        frames = []
+        period = 1 / self.rate_hz
+        while self._next_sample_time <= now or num_burst > 0:
+            frames.extend(self._sample_frames())
+            self._next_sample_time += period
+            num_burst = max(0, num_burst - 1)
+        self._send(frames)
+        return self._next_sample_time
+
+    def _sample_frames(self) -> List[bytes]:
+        i = self.num_samples
+        self.num_samples += 1
+        t = i / self.rate_hz
+        timestamp_us = int(t * 1e6)
+
+        frames = []
+        if self.datastream_type != DatastreamType.NONE:
+            frames.append(encode_package(_motion_sample(t, timestamp_us, self.datastream_type)))
+        if self.enable_spectrogram and i % self.spectrogram_interval == 0:
+            bins = np.abs(np.sin(np.arange(SpectrogramDataPackage._num_floats, dtype=np.float32) + t))
+            data = bins.reshape(SpectrogramDataPackage._num_channels, SpectrogramDataPackage._num_bins_per_channel)
+            frames.append(encode_package(SpectrogramDataPackage(data=data, timestamp_us=timestamp_us)))
+        return frames
+
+    def _send(self, frames: List[bytes]) -> None:
+        if not frames:
+            return
+
+        with self._lock:
+            num_corrupt = min(self._num_corrupt, len(frames))
+            self._num_corrupt -= num_corrupt
+        for i in range(num_corrupt):
+            frame = bytearray(frames[i])
+            frame[self._random.randrange(len(frame) - 1)] = 0
+            frames[i] = bytes(frame)
+
+        data = b"".join(frames)
+        try:
+            num_written = os.write(self._master, data)
+        except BlockingIOError:
+            num_written = 0
+        except OSError:
+            # The pty was closed
+            return
+        self.num_frames_sent += len(frames)
+        self.num_dropped_bytes += len(data) - num_written
+
+    def _read_requests(self) -> None:
+        try:
+            data = os.read(self._master, 4096)
+        except (BlockingIOError, OSError):
+            return
+
+        for frame in self._framer.feed(data):
+            try:
+                request = cobs.decode(frame.tobytes())
+                metadata = PackageMetadata.from_raw_bytes(request)
+            except (cobs.DecodeError, struct.error, ValueError):
+                logger.debug("Emulator got an invalid request", exc_info=True)
+                continue
+            self._handle_request(metadata, PackageMetadata.split_out_data_from_metadata(request))
+
+    def _handle_request(self, metadata: PackageMetadata, payload: bytes) -> None:
+        if metadata.id == PackageId.DEVICE_INFO:
+            self._send([encode_package(self.device_info, PackageType.RESPONSE)])
+        elif metadata.id == PackageId.DEVICE_MODE:
+            self.streaming = payload[0] == DeviceMode.API
+            self._next_sample_time = None
+        elif metadata.id == PackageId.MODIFY_API_CONFIG:
+            datastream_type, enable_spectrogram, rate_hz = _API_CONFIG_STRUCT.unpack(payload)
+            self.datastream_type = DatastreamType(datastream_type)
+            self.enable_spectrogram = enable_spectrogram
+            self.rate_hz = rate_hz
+        else:
+            logger.debug(f"Emulator ignoring a request with id={metadata.id}")
@@ -0,0 +1,162 @@
+import logging
+import struct
+from dataclasses import dataclass
+from typing import List, Union
+
+import numpy as np
+from cobs import cobs
+
+from genki_wave.constants import MAX_FRAME_SIZE
+from genki_wave.data.enums import PackageId
+from genki_wave.data.organization import PACKAGE_SCHEMAS, PackageMetadata
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSplitter:
+    """Splits a byte stream into frames separated by a zero byte
+
+    Incoming data is appended to a buffer and only the newly received bytes are scanned for terminators. All complete
+    frames of a chunk are returned as `memoryview` slices of the buffer they arrived in, so no frame is copied, and the
+    incomplete tail is moved to a fresh buffer once per chunk. Splitting a chunk holding `n` frames is therefore linear
+    in its size, not quadratic.
+
+    Frames longer than `max_frame_size` are dropped, and so is a tail that grows beyond it without a terminator, so a
+    stream of garbage can't grow the buffer without bound.
+
+    Args:
+        max_frame_size: The longest frame (without the terminator) that is accepted
+    """
+
+    TERMINATOR = 0
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+        self.num_dropped_bytes = 0
+
+    def feed(self, data: Union[bytearray, bytes]) -> List[memoryview]:
+        """Buffers `data` and returns all frames completed by it, without the terminators"""
+        scan_from = len(self.buffer)
+        self.buffer.extend(data)
+
+        end = self.buffer.rfind(self.TERMINATOR, scan_from)
+        if end < 0:
+            self._drop_oversized_tail()
+            return []
+
+        # The frames stay in the current buffer, which is never written to again, so the views remain valid
+        chunk, self.buffer = self.buffer, self.buffer[end + 1 :]
+        self._drop_oversized_tail()
+
+        view = memoryview(chunk)
+        frames = []
+        start = 0
+        while start <= end:
+            stop = chunk.find(self.TERMINATOR, start, end + 1)
+            if stop - start > self.max_frame_size:
+                self._drop(stop - start)
+            elif stop > start:
+                frames.append(view[start:stop])
+            start = stop + 1
+
+        return frames
+
+    def _drop_oversized_tail(self) -> None:
+        if len(self.buffer) > self.max_frame_size:
+            self._drop(len(self.buffer))
+            self.buffer = bytearray()
+
+    def _drop(self, num_bytes: int) -> None:
+        logger.debug(f"Dropping {num_bytes} bytes, longer than the max frame size of {self.max_frame_size}")
+        self.num_dropped_bytes += num_bytes
+
+
+_METADATA_SIZE = struct.calcsize(PackageMetadata._fmt)
+
+
+@dataclass(frozen=True, eq=False)
+class DecodedFrames:
+    """The result of `cobs_decode_frames`, every successfully decoded frame back to back in a single buffer
+
+    Frame `i` is `data[offsets[i]:offsets[i + 1]]`, metadata included.
+    """
+
+    data: np.ndarray
+    offsets: np.ndarray
+    num_invalid: int
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.offsets) - 1
+
+    def frame(self, i: int) -> memoryview:
+        return memoryview(self.data)[self.offsets[i] : self.offsets[i + 1]]
+
+    def _selected(self, package_id: PackageId) -> np.ndarray:
+        """Mask of the frames of type `package_id` whose length matches it"""
+        starts, lengths = self.offsets[:-1], np.diff(self.offsets)
+        # Frames too short to have an id, e.g. empty ones, can't be of any type. Clipping keeps the lookup in bounds
+        has_id = lengths >= _METADATA_SIZE
+        if not has_id.any():
+            return np.zeros(len(starts), dtype=bool)
+        ids = self.data[np.minimum(starts + 1, len(self.data) - 1)]
+        return has_id & (lengths == _METADATA_SIZE + PACKAGE_SCHEMAS[package_id].size) & (ids == package_id)
+
+    def indices(self, package_id: PackageId) -> np.ndarray:
+        """The indices of the frames whose payloads `payloads` returns, in the same order"""
+        return np.flatnonzero(self._selected(package_id))
+
+    def payloads(self, package_id: PackageId) -> np.ndarray:
+        """The payloads of all frames of type `package_id` as one (n, payload_size) array, ready for batch decoding
+
+        Frames whose length doesn't match the package type are skipped.
+        """
+        payload_size = PACKAGE_SCHEMAS[package_id].size
+        starts, lengths = self.offsets[:-1], np.diff(self.offsets)
+        selected = self._selected(package_id)
+        if not selected.any():
+            return np.zeros((0, payload_size), dtype=np.uint8)
+
+        # A byte mask of the selected frames without their metadata, compressing with it is a single copy
+        mask = np.repeat(selected, lengths)
+        mask[(starts[selected, None] + np.arange(_METADATA_SIZE)).ravel()] = False
+        return self.data[mask].reshape(-1, payload_size)
+
+
+def _decode_valid(frames: List[bytes]) -> List[bytes]:
+    decoded = []
+    for frame in frames:
+        try:
+            decoded.append(cobs.decode(frame))
+        except cobs.DecodeError:
+            logger.debug("Got an exception decoding a frame", exc_info=True)
+    return decoded
+
+
+def cobs_decode_frames(chunk: Union[bytearray, bytes, memoryview]) -> DecodedFrames:
+    """COBS decodes every zero-terminated frame in `chunk` into a single output buffer
+
+    The frames are split by `bytes.split` and decoded by `cobs.decode`, driven by `filter` and `map` so no Python
+    bytecode runs per frame, but `cobs` can't decode into an existing buffer, so every frame is decoded into a `bytes`
+    object of its own first and then copied into the output buffer by a single `join`. Selecting and batch decoding the
+    payloads from there (see `DecodedFrames.payloads`) doesn't create any more per-frame objects.
+
+    Args:
+        chunk: Bytes holding any number of frames, each followed by a zero byte. Bytes after the last terminator are
+               ignored, empty frames are skipped
+
+    Returns:
+        The decoded frames. Frames that aren't valid COBS are dropped and counted in `num_invalid`
+    """
+    frames = list(filter(None, bytes(chunk).split(b"\x00")[:-1]))
+    try:
+        decoded = list(map(cobs.decode, frames))
+    except cobs.DecodeError:
+        # Invalid frames are rare, so only then pay for decoding them one at a time
+        decoded = _decode_valid(frames)
+
+    offsets = np.zeros(len(decoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, decoded), dtype=np.int64, count=len(decoded)), out=offsets[1:])
+    data = np.frombuffer(b"".join(decoded), dtype=np.uint8)
+    return DecodedFrames(data=data, offsets=offsets, num_invalid=len(frames) - len(decoded))
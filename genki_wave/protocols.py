@@ -2,6 +2,8 @@ import abc
 import asyncio
 import logging
 import struct
+import threading
+import time
 from queue import Queue
 from typing import Callable, List, Optional, Union
 
@@ -9,11 +11,20 @@ from bleak import BleakClient
 from cobs import cobs
 from serial.threaded import Packetizer
 
+from genki_wave.clock import ClockSync
 from genki_wave.constants import API_CHAR_UUID
 from genki_wave.data import ButtonAction, ButtonEvent, ButtonId, DataPackage
-from genki_wave.data.organization import process_byte_data
-from genki_wave.data.structures import QueueWithPop
+from genki_wave.data.enums import OverflowPolicy
+from genki_wave.data.organization import peek_timestamp_us, process_byte_data
+from genki_wave.data.structures import (  # noqa: F401
+    END_OF_STREAM,
+    BoundedAsyncQueue,
+    QueueWithPop,
+    TaggedPackage,
+)
 from genki_wave.data.writing import get_start_api_package, get_start_spectrogram_package, get_default_api_config_package
+from genki_wave.framing import FrameSplitter
+from genki_wave.recording import FrameRecorder
 from genki_wave.utils import get_or_create_event_loop
 
 logger = logging.getLogger(__name__)
@@ -21,16 +32,59 @@ logger = logging.getLogger(__name__)
 
 class CommunicateCancel:
     """
-    Class that handles how to cancel asyncio loops with a button press and how to communicate it. Usually defined as
-    a global and sends messages to each part of the script
+    Class that handles how to cancel asyncio loops with a button press and how to communicate it. One instance is
+    shared by the parts of a single session, separate sessions each have their own.
+
+    Setting `cancel` can be done from any thread and wakes up everything waiting on it right away, see `wait` and
+    `on_cancel`, so nothing needs to poll it.
     """
 
-    cancel = False
-    is_connected = False
+    def __init__(self):
+        self.is_connected = False
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[tuple] = []
+
+    @property
+    def cancel(self) -> bool:
+        return self._cancelled.is_set()
+
+    @cancel.setter
+    def cancel(self, value: bool) -> None:
+        if not value:
+            self._cancelled.clear()
+            return
+
+        with self._lock:
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for loop, callback in callbacks:
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError:
+                # The event loop the callback was registered from has been closed
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Calls `callback` in the running event loop once cancelled, or right away if it already is"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append((loop, callback))
+                return
+        loop.call_soon(callback)
+
+    async def wait(self) -> None:
+        """Waits until cancelled"""
+        future = asyncio.get_running_loop().create_future()
+        self.on_cancel(lambda: future.done() or future.set_result(None))
+        await future
 
     @staticmethod
-    def is_cancel(button_event: Union[ButtonEvent, DataPackage]) -> bool:
+    def is_cancel(button_event: Union[ButtonEvent, DataPackage, TaggedPackage]) -> bool:
         """Checks for a hard coded cancel event"""
+        if isinstance(button_event, TaggedPackage):
+            button_event = button_event.package
         return (
             isinstance(button_event, ButtonEvent)
             and button_event.button_id == ButtonId.TOP  # noqa: W503
@@ -69,10 +123,21 @@ class ProtocolAbc(abc.ABC):
         pass
 
 
-def _handle_packet(packet: Union[bytearray, bytes]) -> Optional[Union[ButtonEvent, DataPackage]]:
+def _handle_packet(
+    packet: Union[bytearray, bytes, memoryview],
+    lazy: bool = False,
+    arrival_ns: Optional[int] = None,
+    clock: Optional[ClockSync] = None,
+) -> Optional[Union[ButtonEvent, DataPackage]]:
     try:
-        data = cobs.decode(packet)
-        data = process_byte_data(data)
+        # `cobs.decode` doesn't accept memoryviews
+        data = cobs.decode(packet.tobytes() if isinstance(packet, memoryview) else packet)
+        # The packages are frozen, so the host time is estimated from the raw bytes before they are decoded
+        host_ns = arrival_ns
+        timestamp_us = None if clock is None or arrival_ns is None else peek_timestamp_us(data)
+        if timestamp_us is not None:
+            host_ns = clock.stamp(timestamp_us, arrival_ns)
+        data = process_byte_data(data, lazy, arrival_ns, host_ns)
     except cobs.DecodeError:
         logger.debug("Got an exception decoding serial packet", exc_info=True)
         return None
@@ -88,25 +153,60 @@ class ProtocolAsyncio(ProtocolAbc, Packetizer):
     """Defines how to handle the bytes from the serial connection
 
     Note: This is a slight abuse of subclassing since we are pulling in more functionality than is needed
+
+    Args:
+        lazy: If `True` data packages are put on the queue as a `DataPackageView` that only decodes the fields that
+              are accessed
+        recorder: If given, every frame is recorded with its arrival time before it is decoded
+        device: If given, packages are put on the queue as a `TaggedPackage` with this device
+        queue: The queue to put packages on, e.g. a queue shared by the protocols of several devices. If `None` a new
+               `BoundedAsyncQueue` is created with `maxsize` and `policy`
+        maxsize: The most packages the queue holds before `policy` applies, 0 for no limit
+        policy: What happens with new packages when the queue is full, see `OverflowPolicy`
+        clock: Estimates the host time of the packages from when they arrive, see `DataPackage.host_time_ns`. A new
+               `ClockSync` if `None`
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        lazy: bool = False,
+        recorder: Optional[FrameRecorder] = None,
+        device: Optional[str] = None,
+        queue: Optional[asyncio.Queue] = None,
+        maxsize: int = 0,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        clock: Optional[ClockSync] = None,
+    ):
         super().__init__()
         get_or_create_event_loop()
-        self._queue = asyncio.Queue()
-
-    async def data_received(self, data: Union[bytearray, bytes]) -> None:
-        """Buffer received data, find TERMINATOR, call handle_packet"""
-        self.buffer.extend(data)
-        while self.TERMINATOR in self.buffer:
-            packet, self.buffer = self.buffer.split(self.TERMINATOR, 1)
-            await self.handle_packet(packet)
-
-    async def handle_packet(self, packet: Union[bytearray, bytes]) -> None:
-        data = _handle_packet(packet)
+        self._queue = BoundedAsyncQueue(maxsize, policy) if queue is None else queue
+        self._lazy = lazy
+        self._framer = FrameSplitter()
+        self._recorder = recorder
+        self.device = device
+        self.clock = ClockSync() if clock is None else clock
+
+    async def data_received(self, data: Union[bytearray, bytes], arrival_ns: Optional[int] = None) -> None:
+        """Buffer received data, split it into frames, call handle_packet
+
+        Args:
+            data: The bytes that were read
+            arrival_ns: When `data` arrived in nanoseconds since the epoch, e.g. from a recording. Now by default
+        """
+        arrival_ns = time.time_ns() if arrival_ns is None else arrival_ns
+        packets = self._framer.feed(data)
+        if self._recorder is not None:
+            self._recorder.record(packets, arrival_ns)
+        for packet in packets:
+            await self.handle_packet(packet, arrival_ns)
+
+    async def handle_packet(
+        self, packet: Union[bytearray, bytes, memoryview], arrival_ns: Optional[int] = None
+    ) -> None:
+        data = _handle_packet(packet, self._lazy, time.time_ns() if arrival_ns is None else arrival_ns, self.clock)
         if data is None:
             return
-        await self.queue.put(data)
+        await self.queue.put(data if self.device is None else TaggedPackage(self.device, data))
 
     @property
     def queue(self) -> asyncio.Queue:
@@ -114,25 +214,46 @@ class ProtocolAsyncio(ProtocolAbc, Packetizer):
 
 
 class ProtocolThread(ProtocolAbc, Packetizer):
-    def __init__(self):
+    """See `ProtocolAsyncio`, but uses a thread-safe queue"""
+
+    def __init__(
+        self,
+        lazy: bool = False,
+        recorder: Optional[FrameRecorder] = None,
+        maxsize: int = 0,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        clock: Optional[ClockSync] = None,
+    ):
         super().__init__()
-        self._queue = QueueWithPop()
-
-    def data_received(self, data: Union[bytearray, bytes]) -> None:
-        """Buffer received data, find TERMINATOR, call handle_packet"""
-        self.buffer.extend(data)
-        while self.TERMINATOR in self.buffer:
-            packet, self.buffer = self.buffer.split(self.TERMINATOR, 1)
-            self.handle_packet(packet)
-
-    def handle_packet(self, packet: Union[bytearray, bytes]) -> None:
-        data = _handle_packet(packet)
+        self._queue = QueueWithPop(maxsize, policy)
+        self._lazy = lazy
+        self._framer = FrameSplitter()
+        self._recorder = recorder
+        self.clock = ClockSync() if clock is None else clock
+
+    def data_received(self, data: Union[bytearray, bytes], arrival_ns: Optional[int] = None) -> None:
+        """Buffer received data, split it into frames and put all of the packages on the queue at once"""
+        arrival_ns = time.time_ns() if arrival_ns is None else arrival_ns
+        packets = self._framer.feed(data)
+        if self._recorder is not None:
+            self._recorder.record(packets, arrival_ns)
+
+        packages = []
+        for packet in packets:
+            package = _handle_packet(packet, self._lazy, arrival_ns, self.clock)
+            if package is not None:
+                packages.append(package)
+        # Takes the lock of the queue once per read instead of once per package
+        self.queue.put_many(packages)
+
+    def handle_packet(self, packet: Union[bytearray, bytes, memoryview], arrival_ns: Optional[int] = None) -> None:
+        data = _handle_packet(packet, self._lazy, time.time_ns() if arrival_ns is None else arrival_ns, self.clock)
         if data is None:
             return
         self.queue.put(data)
 
     @property
-    def queue(self) -> Queue:
+    def queue(self) -> QueueWithPop:
         return self._queue
 
 
@@ -161,6 +282,9 @@ async def bluetooth_task(
 
         print("Connected to Wave")
         comm.is_connected = True
+        # Wakes up the loop below when cancelled, even if the device isn't sending anything. A full queue is drained by
+        # the loop, so waiting for room with `OverflowPolicy.BLOCK` always ends
+        comm.on_cancel(lambda: asyncio.ensure_future(protocol.queue.put(END_OF_STREAM)))
         while True:
             package = await protocol.queue.get()
 
@@ -173,3 +297,9 @@ async def bluetooth_task(
                 callback(package)
 
         await client.stop_notify(API_CHAR_UUID)
+
+    for callback in callbacks:
+        # E.g. `WaveCallback.close`, plain functions don't have one
+        close = getattr(callback, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,489 @@
+import logging
+import os
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from cobs import cobs
+
+from genki_wave.clock import fit_host_time
+from genki_wave.compression import (
+    CompressedWriter,
+    is_compressed,
+    iter_compressed_chunks,
+    read_compressed,
+    read_compressed_from,
+    uncompressed_size,
+)
+from genki_wave.data.enums import PackageId
+from genki_wave.data.organization import PACKAGE_SCHEMAS, peek_timestamp_us
+from genki_wave.framing import DecodedFrames, cobs_decode_frames
+
+logger = logging.getLogger(__name__)
+
+# A recording is a header followed by one record per frame. A record is the host time the frame arrived at
+# (`time.time_ns()`) and the length of the frame, followed by the frame exactly as it was received, still COBS encoded
+# and without the zero terminator. Explanation for the formats: https://docs.python.org/3/library/struct.html
+MAGIC = b"GENKIWAV"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sH")
+_RECORD = struct.Struct("<QH")
+
+# The index of a recording is a sidecar file next to it, see `index_path`. It's a header followed by an entry for every
+# `index_interval`-th frame that has a `timestamp_us`: the timestamp and the offset of the frame's record in the
+# recording. The offset is into the decompressed recording if it's compressed
+INDEX_MAGIC = b"GENKIIDX"
+INDEX_FORMAT_VERSION = 1
+_INDEX_HEADER = struct.Struct("<8sH")
+_INDEX_ENTRY = struct.Struct("<QQ")
+INDEX_DTYPE = np.dtype([("timestamp_us", "<u8"), ("offset", "<u8")])
+
+
+def _check_header(header: bytes, path: Path) -> None:
+    if len(header) < _HEADER.size:
+        raise ValueError(f"{path} is too short to be a frame recording")
+    magic, version = _HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a frame recording, expected it to start with {MAGIC!r}, got {magic!r}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported recording format version {version} in {path}, expected {FORMAT_VERSION}")
+
+
+class FrameRecorder:
+    """Appends raw wire frames with their host arrival time to a binary log
+
+    The frames are written before they are decoded, so every package type is recorded losslessly, including frames that
+    later fail to decode. Recording a chunk is a few `struct.pack` calls and a single buffered write, which keeps the
+    cost on the receiving side to a minimum. If `path` is an existing recording the frames are appended to it.
+
+    With `compression` the recording is compressed in chunks on a background thread, see `CompressedWriter`. The
+    readers in this module detect compressed recordings on their own.
+
+    With `index_interval` a sparse index from `timestamp_us` to the position in the recording is written to a sidecar
+    file as well, see `read_time_range`. Indexing a frame means decoding it, which is only done for one in every
+    `index_interval` frames.
+
+    Args:
+        path: The file to record to
+        buffer_size: Size of the write buffer in bytes, the file is written to once it fills up
+        compression: "zlib" or "lzma" to compress the recording, `None` to not compress it
+        level: The compression level, see `CompressedWriter`
+        index_interval: Number of frames between entries in the index, `None` to not write an index
+
+    Example:
+        >>> with FrameRecorder(Path("session.gwrec")) as recorder:  # doctest: +SKIP
+        ...     run_asyncio_serial(callbacks, recorder=recorder)
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        buffer_size: int = 1 << 16,
+        compression: Optional[str] = None,
+        level: Optional[int] = None,
+        index_interval: Optional[int] = 256,
+    ):
+        if index_interval is not None and index_interval < 1:
+            raise ValueError(f"Expected a positive index interval, got index_interval={index_interval}")
+        self.path = Path(path)
+        self.num_frames = 0
+        self.index_interval = index_interval
+
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        if not is_new:
+            if is_compressed(self.path) != (compression is not None):
+                raise ValueError(f"Can't append to {self.path}, compression={compression} doesn't match the file")
+            header = _read_header(self.path)
+            # A compressed recording that was cut off before its first chunk was written doesn't have a header yet
+            is_new = header is None
+            if not is_new:
+                _check_header(header, self.path)
+
+        if compression is None:
+            self._file: BinaryIO = open(self.path, "ab", buffering=buffer_size)
+        else:
+            # Also removes a chunk that was cut off at the end of the recording
+            self._file = CompressedWriter(self.path, compression, level)
+        if is_new:
+            self._file.write(_HEADER.pack(MAGIC, FORMAT_VERSION))
+
+        # Offset of the next record in the (decompressed) recording, for the index
+        if is_new:
+            self._offset = _HEADER.size
+        elif compression is None:
+            self._offset = self.path.stat().st_size
+        else:
+            self._offset = uncompressed_size(self.path)
+
+        self._index: Optional[BinaryIO] = None
+        self._frames_since_index = index_interval
+        if index_interval is not None:
+            self._index = _open_index(index_path(self.path), is_new, self._offset)
+
+    def record(self, frames: List[Union[bytes, memoryview]], time_ns: Optional[int] = None) -> None:
+        """Records `frames`, that all arrived at `time_ns`. Defaults to the current time
+
+        Args:
+            frames: Frames without their terminator, e.g. as returned by `FrameSplitter.feed`
+            time_ns: Host arrival time of the frames in nanoseconds since the epoch
+        """
+        if not frames:
+            return
+        time_ns = time.time_ns() if time_ns is None else time_ns
+
+        buffer = bytearray()
+        pack = _RECORD.pack
+        for frame in frames:
+            if self._index is not None:
+                self._frames_since_index += 1
+                if self._frames_since_index >= self.index_interval:
+                    timestamp_us = _frame_timestamp_us(frame)
+                    if timestamp_us is not None:
+                        self._index.write(_INDEX_ENTRY.pack(timestamp_us, self._offset + len(buffer)))
+                        self._frames_since_index = 0
+            buffer += pack(time_ns, len(frame))
+            buffer += frame
+        self._file.write(buffer)
+        self._offset += len(buffer)
+        self.num_frames += len(frames)
+
+    def flush(self) -> None:
+        self._file.flush()
+        if self._index is not None:
+            self._index.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        if self._index is not None:
+            self._index.close()
+
+    def __enter__(self) -> "FrameRecorder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _read_header(path: Path) -> Optional[bytes]:
+    """The first bytes of the recording at `path`, decompressed if needed. `None` if there aren't any yet"""
+    if is_compressed(path):
+        first = next(iter_compressed_chunks(path), None)
+        return None if first is None else first[1][: _HEADER.size]
+    with open(path, "rb") as f:
+        return f.read(_HEADER.size)
+
+
+def index_path(path: Path) -> Path:
+    """The index sidecar of the recording at `path`, e.g. `session.gwrec.idx` for `session.gwrec`"""
+    path = Path(path)
+    return path.with_name(path.name + ".idx")
+
+
+def _open_index(path: Path, truncate: bool, end_offset: int) -> BinaryIO:
+    is_new = truncate or not path.exists() or path.stat().st_size < _INDEX_HEADER.size
+    if not is_new:
+        # Entries at or past `end_offset` point to frames that were lost when the recording was cut off, the offsets
+        # are reused by the frames appended now. A partial entry would shift every entry after it
+        data = path.read_bytes()
+        num_entries = (len(data) - _INDEX_HEADER.size) // _INDEX_ENTRY.size
+        offsets = np.frombuffer(data, dtype=INDEX_DTYPE, count=num_entries, offset=_INDEX_HEADER.size)["offset"]
+        num_kept = int(np.searchsorted(offsets, end_offset))
+        os.truncate(path, _INDEX_HEADER.size + num_kept * _INDEX_ENTRY.size)
+    f = open(path, "wb" if is_new else "ab")
+    if is_new:
+        f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION))
+    return f
+
+
+def _frame_timestamp_us(frame: Union[bytes, memoryview]) -> Optional[int]:
+    """The `timestamp_us` of the package in the COBS encoded `frame`, `None` if it doesn't have one or isn't valid"""
+    try:
+        return peek_timestamp_us(cobs.decode(bytes(frame)))
+    except cobs.DecodeError:
+        return None
+
+
+def _read_bytes(path: Path) -> bytes:
+    return read_compressed(path) if is_compressed(path) else path.read_bytes()
+
+
+def _iter_records(data: bytes, path: Path) -> Iterator[Tuple[int, int, int]]:
+    """Yields `(time_ns, start, stop)` for the frame of every record in `data`, which starts with the header"""
+    _check_header(data, path)
+    pos = _HEADER.size
+    unpack_from = _RECORD.unpack_from
+    while pos + _RECORD.size <= len(data):
+        time_ns, length = unpack_from(data, pos)
+        start = pos + _RECORD.size
+        pos = start + length
+        if pos > len(data):
+            break
+        yield time_ns, start, pos
+
+    if pos != len(data):
+        # Most likely the recording was interrupted halfway through writing a record
+        logger.warning(f"Ignoring a truncated record at the end of {path}")
+
+
+def _iter_blocks(path: Path, offset: int, block_size: int = 1 << 16) -> Iterator[bytes]:
+    """Yields the (decompressed) recording at `path` from `offset` on, in blocks"""
+    if is_compressed(path):
+        yield from read_compressed_from(path, offset)
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def _iter_records_from(path: Path, offset: int) -> Iterator[Tuple[int, int, bytes]]:
+    """Yields `(offset, time_ns, frame)` for every record in the recording at `path` from the one at `offset` on
+
+    Unlike `_iter_records` only a block of the recording is in memory at a time.
+    """
+    buffer, pos = bytearray(), 0
+    unpack_from = _RECORD.unpack_from
+    for block in _iter_blocks(path, offset):
+        del buffer[:pos]
+        offset += pos
+        buffer += block
+        pos = 0
+        while pos + _RECORD.size <= len(buffer):
+            time_ns, length = unpack_from(buffer, pos)
+            start = pos + _RECORD.size
+            if start + length > len(buffer):
+                break
+            yield offset + pos, time_ns, bytes(buffer[start : start + length])
+            pos = start + length
+
+    if pos != len(buffer):
+        logger.warning(f"Ignoring a truncated record at the end of {path}")
+
+
+def read_frames(path: Path) -> Iterator[Tuple[int, bytes]]:
+    """Yields `(time_ns, frame)` for every frame in the recording at `path`, in the order they were recorded
+
+    The recording is read a block at a time, so it doesn't have to fit in memory.
+    """
+    path = Path(path)
+    _check_header(_read_header(path) or b"", path)
+    for _, time_ns, frame in _iter_records_from(path, _HEADER.size):
+        yield time_ns, frame
+
+
+def iter_chunks(path: Path) -> Iterator[Tuple[int, bytes]]:
+    """Yields `(time_ns, chunk)` with all frames that arrived at the same time, terminated like they were on the wire
+
+    A chunk can be passed to `data_received` of a protocol as is. Frames that were split across reads when they were
+    recorded end up whole in the chunk of the read that completed them. Like `read_frames` the recording is read a block
+    at a time.
+    """
+    frames, last_time_ns = [], None
+    for time_ns, frame in read_frames(path):
+        if frames and time_ns != last_time_ns:
+            yield last_time_ns, b"\x00".join(frames) + b"\x00"
+            frames = []
+        frames.append(frame)
+        last_time_ns = time_ns
+
+    if frames:
+        yield last_time_ns, b"\x00".join(frames) + b"\x00"
+
+
+class ReplayClock:
+    """Maps the arrival times of a recording onto the host clock, to replay it at the speed it was recorded at
+
+    Args:
+        speed: How many times faster than real time to replay, e.g. 2.0 for twice as fast. `None` replays as fast as
+               possible
+    """
+
+    def __init__(self, speed: Optional[float] = 1.0):
+        if speed is not None and speed <= 0:
+            raise ValueError(f"Expected a positive replay speed, got speed={speed}")
+        self.speed = speed
+        self._start = None
+
+    def delay(self, time_ns: int) -> float:
+        """Seconds to wait before replaying something that was recorded at `time_ns`. The first call starts the clock"""
+        if self.speed is None:
+            return 0.0
+
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = (now, time_ns)
+            return 0.0
+
+        start_host, start_ns = self._start
+        return max(0.0, (time_ns - start_ns) / 1e9 / self.speed - (now - start_host))
+
+
+@dataclass(frozen=True, eq=False)
+class Recording:
+    """All frames of a recording, loaded at once for batch processing
+
+    Args:
+        time_ns: Host arrival time of every frame, in nanoseconds since the epoch
+        chunk: The frames back to back, each followed by a zero byte, exactly like they arrived on the wire
+    """
+
+    time_ns: np.ndarray
+    chunk: bytes
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.time_ns)
+
+    def decode(self) -> DecodedFrames:
+        """COBS decodes all frames at once, see `cobs_decode_frames`
+
+        Frames that fail to decode are dropped, so if `num_invalid` is not zero the decoded frames no longer line up
+        with `time_ns`.
+        """
+        return cobs_decode_frames(self.chunk)
+
+    def host_times(
+        self, package_id: PackageId = PackageId.DATASTREAM, block_us: int = 1_000_000
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The device and the estimated host time of every package of type `package_id`, see `fit_host_time`
+
+        Returns:
+            `(timestamp_us, host_time_ns)`, in the order of `decode().payloads(package_id)`
+        """
+        decoded = self.decode()
+        time_ns = self.time_ns
+        if decoded.num_frames != self.num_frames:
+            # Invalid frames are rare, so only then pay for finding them one at a time
+            valid = [_is_valid_frame(frame) for frame in self.chunk.split(b"\x00")[:-1]]
+            time_ns = time_ns[np.array(valid, dtype=bool)]
+
+        payloads = decoded.payloads(package_id)
+        timestamp_us = payloads.reshape(-1).view(PACKAGE_SCHEMAS[package_id].dtype)["timestamp_us"]
+        return timestamp_us, fit_host_time(timestamp_us, time_ns[decoded.indices(package_id)], block_us)
+
+
+def _is_valid_frame(frame: bytes) -> bool:
+    """Whether `cobs_decode_frames` keeps `frame`"""
+    try:
+        return bool(frame) and cobs.decode(frame) is not None
+    except cobs.DecodeError:
+        return False
+
+
+def load_recording(path: Path) -> Recording:
+    """Loads the recording at `path`, see `Recording`"""
+    path = Path(path)
+    data = _read_bytes(path)
+
+    times, parts = [], []
+    for time_ns, start, stop in _iter_records(data, path):
+        times.append(time_ns)
+        parts.append(data[start:stop])
+    parts.append(b"")
+
+    return Recording(time_ns=np.array(times, dtype=np.uint64), chunk=b"\x00".join(parts))
+
+
+def _recording_size(path: Path) -> int:
+    """Size of the recording at `path`, decompressed if needed"""
+    return uncompressed_size(path) if is_compressed(path) else path.stat().st_size
+
+
+def load_index(path: Path) -> Optional[np.ndarray]:
+    """The index of the recording at `path` as an array of `INDEX_DTYPE`, `None` if it doesn't have one
+
+    Entries that point past the end of the recording, e.g. to frames of a compressed recording that are still being
+    compressed, are left out.
+    """
+    sidecar = index_path(path)
+    if not sidecar.exists():
+        return None
+
+    data = sidecar.read_bytes()
+    if len(data) < _INDEX_HEADER.size:
+        return None
+    magic, version = _INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC:
+        raise ValueError(f"{sidecar} is not a recording index, expected {INDEX_MAGIC!r} at the start, got {magic!r}")
+    if version != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {version} in {sidecar}, expected {INDEX_FORMAT_VERSION}")
+
+    # A partial entry at the end is from an index that is still being written to
+    num_entries = (len(data) - _INDEX_HEADER.size) // _INDEX_ENTRY.size
+    index = np.frombuffer(data, dtype=INDEX_DTYPE, count=num_entries, offset=_INDEX_HEADER.size)
+    return index[index["offset"] < _recording_size(Path(path))]
+
+
+def build_index(path: Path, index_interval: int = 256) -> np.ndarray:
+    """Writes the index of the recording at `path`, e.g. for a recording made without one, and returns it
+
+    An existing index is replaced.
+    """
+    path = Path(path)
+    _check_header(_read_header(path) or b"", path)
+
+    entries = []
+    frames_since_index = index_interval
+    for offset, _, frame in _iter_records_from(path, _HEADER.size):
+        frames_since_index += 1
+        if frames_since_index >= index_interval:
+            timestamp_us = _frame_timestamp_us(frame)
+            if timestamp_us is not None:
+                entries.append((timestamp_us, offset))
+                frames_since_index = 0
+
+    with _open_index(index_path(path), True, 0) as f:
+        f.write(b"".join(_INDEX_ENTRY.pack(*entry) for entry in entries))
+    return np.array(entries, dtype=INDEX_DTYPE)
+
+
+def read_time_range(path: Path, start_us: int, stop_us: int) -> Iterator[Tuple[int, bytes]]:
+    """Yields `(time_ns, frame)` for the frames of the recording at `path` with `start_us <= timestamp_us < stop_us`
+
+    The first frame is found by a binary search in the index of the recording, followed by a scan of at most
+    `index_interval` frames, so only the part of the recording around the range is read. Frames without a timestamp,
+    e.g. button events, are included if the frame before them is in the range.
+
+    The index assumes `timestamp_us` increases throughout the recording, which doesn't hold if recordings of several
+    sessions of the device were appended to each other. Without an index, or with one that isn't in order, the whole
+    recording is scanned.
+
+    Args:
+        path: A recording made by `FrameRecorder`
+        start_us: The first device time to include, in microseconds
+        stop_us: The first device time to leave out, in microseconds
+    """
+    path = Path(path)
+    _check_header(_read_header(path) or b"", path)
+
+    offset, in_order = _HEADER.size, False
+    index = load_index(path)
+    if index is not None:
+        timestamps = index["timestamp_us"]
+        in_order = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+        if in_order:
+            # The last entry before the range, the frames in between are skipped by the scan
+            i = int(np.searchsorted(timestamps, start_us, side="left")) - 1
+            if i >= 0:
+                offset = int(index["offset"][i])
+
+    started = False
+    for _, time_ns, frame in _iter_records_from(path, offset):
+        timestamp_us = _frame_timestamp_us(frame)
+        if timestamp_us is None:
+            if started:
+                yield time_ns, frame
+            continue
+        if start_us <= timestamp_us < stop_us:
+            started = True
+            yield time_ns, frame
+        elif timestamp_us >= stop_us and in_order:
+            break
+        else:
+            started = False
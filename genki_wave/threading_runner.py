@@ -1,5 +1,8 @@
 import asyncio
 import threading
+import time
+from pathlib import Path
+from functools import partial
 from typing import Callable, Optional
 
 import serial
@@ -7,8 +10,10 @@ from serial import Serial
 from serial.threaded import ReaderThread
 
 from genki_wave.constants import BAUDRATE
+from genki_wave.data.enums import OverflowPolicy
 from genki_wave.data.writing import get_start_api_package
-from genki_wave.protocols import ProtocolThread, bluetooth_task, CommunicateCancel
+from genki_wave.protocols import END_OF_STREAM, ProtocolThread, bluetooth_task, CommunicateCancel
+from genki_wave.recording import ReplayClock, iter_chunks
 
 
 from genki_wave.utils import get_serial_port, get_or_create_event_loop
@@ -23,19 +28,23 @@ class ReaderThreadSerial(ReaderThread):
         self.write(get_start_api_package())
 
     @classmethod
-    def from_port(cls, serial_port: Optional[str] = None) -> "ReaderThreadSerial":
+    def from_port(
+        cls, serial_port: Optional[str] = None, maxsize: int = 0, policy: OverflowPolicy = OverflowPolicy.BLOCK
+    ) -> "ReaderThreadSerial":
         """Create a `ReaderThreadSerial` object from a serial port
 
         Args:
             serial_port: The serial port to read from. If `None` will automatically determine the port based on the
                 operating system.
+            maxsize: The most packages the queue holds before `policy` applies, 0 for no limit
+            policy: What happens with new packages when the queue is full, see `OverflowPolicy`
 
         Returns:
             An instance of `ReaderThreadSerial` with the specified port
         """
         port = get_serial_port() if serial_port is None else serial_port
         serial_instance = Serial(port, BAUDRATE, parity=serial.PARITY_EVEN)
-        return cls(serial_instance, ProtocolThread)
+        return cls(serial_instance, partial(ProtocolThread, maxsize=maxsize, policy=policy))
 
 
 class ReaderThreadBluetooth(threading.Thread):
@@ -57,8 +66,11 @@ class ReaderThreadBluetooth(threading.Thread):
         self._ble_address = ble_address
 
     @classmethod
-    def from_address(cls, ble_address: str) -> "ReaderThreadBluetooth":
-        return cls(ble_address, ProtocolThread)
+    def from_address(
+        cls, ble_address: str, maxsize: int = 0, policy: OverflowPolicy = OverflowPolicy.BLOCK
+    ) -> "ReaderThreadBluetooth":
+        """See `ReaderThreadSerial.from_port`"""
+        return cls(ble_address, partial(ProtocolThread, maxsize=maxsize, policy=policy))
 
     def stop(self):
         """Stop the reader thread"""
@@ -101,6 +113,73 @@ class ReaderThreadBluetooth(threading.Thread):
         self.close()
 
 
+class ReaderThreadReplay(threading.Thread):
+    """An imitation of `serial.threaded.ReaderThread` that replays a recording made with `FrameRecorder`
+
+    Once the recording ends `END_OF_STREAM` is put on the queue of the protocol and the thread exits. A `WaveCallback`
+    ignores it, so everything drained from the queue can be passed on as is. The packages get the host times of when
+    they were recorded, not of when they are replayed.
+
+    Args:
+        path: The recording to replay
+        protocol_factory: Creates the protocol the recording is passed to
+        speed: How many times faster than real time to replay, `None` replays as fast as possible
+    """
+
+    def __init__(self, path: Path, protocol_factory: Callable, speed: Optional[float] = 1.0):
+        super().__init__(daemon=True)
+        self.protocol_factory = protocol_factory
+        self.protocol = None
+        self.alive = True
+        self._path = path
+        self._speed = speed
+        self._protocol_created = threading.Event()
+
+    @classmethod
+    def from_path(
+        cls,
+        path: Path,
+        speed: Optional[float] = 1.0,
+        maxsize: int = 0,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    ) -> "ReaderThreadReplay":
+        """See `ReaderThreadSerial.from_port`"""
+        return cls(path, partial(ProtocolThread, maxsize=maxsize, policy=policy), speed)
+
+    def stop(self):
+        """Stop the reader thread"""
+        self.alive = False
+        self.join(2)
+
+    def run(self):
+        """Reader loop"""
+        self.protocol = self.protocol_factory()
+        self._protocol_created.set()
+
+        clock = ReplayClock(self._speed)
+        for time_ns, chunk in iter_chunks(self._path):
+            if not self.alive:
+                break
+            time.sleep(clock.delay(time_ns))
+            self.protocol.data_received(chunk, time_ns)
+
+        self.protocol.queue.put(END_OF_STREAM)
+        self.alive = False
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        """Enter context: Start replaying"""
+        self.start()
+        self._protocol_created.wait()
+        return self.protocol
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Leave context: Stop replaying"""
+        self.close()
+
+
 class WaveListener(threading.Thread):
     def __init__(self, ble_address, callbacks, enable_spectrogram=False):
         self.ble_address = ble_address
@@ -4,7 +4,8 @@ from setuptools import setup, find_packages
 with open("README.md") as f:
     readme = f.read()
 
-requires = ["bleak", "cobs", "pyserial", "pyserial-asyncio"]
+requires = ["bleak", "cobs", "numpy", "pyserial", "pyserial-asyncio"]
+extras = {"arrow": ["pyarrow"]}
 
 setup(
     name="genki-wave",
@@ -25,6 +26,7 @@ setup(
         "Programming Language :: Python :: 3.8",
     ],
     python_requires=">=3.8",
-    packages=find_packages(exclude=("tests", "docs")),
+    packages=find_packages(exclude=("tests", "docs", "benchmarks")),
     install_requires=requires,
+    extras_require=extras,
 )
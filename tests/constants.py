@@ -1,6 +1,10 @@
+from cobs import cobs
+
+from genki_wave.data.enums import PackageId
 from genki_wave.data.organization import (
     ButtonEvent,
     DataPackage,
+    PackageMetadata,
     Quaternion,
 )
 from genki_wave.data import ButtonAction, ButtonId, Euler3d, Point3d
@@ -275,3 +279,10 @@ BLUETOOH_EXPECTED = [
     ),
     ButtonEvent(button_id=ButtonId.MIDDLE, action=ButtonAction.DOWN),
 ]
+
+
+def data_payloads() -> list:
+    """The payloads of the data packages in `SERIAL_DATA`, without their metadata"""
+    frames = b"".join(SERIAL_DATA).split(b"\x00")[1:-1]  # The first and last frames are cut off
+    decoded = [cobs.decode(frame) for frame in frames]
+    return [d[4:] for d in decoded if PackageMetadata.from_raw_bytes(d).id == PackageId.DATASTREAM]
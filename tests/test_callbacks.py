@@ -0,0 +1,192 @@
+import csv
+import io
+import time
+
+import numpy as np
+import pytest
+
+from genki_wave.callbacks import ArrowOutput, CsvOutput, NpyOutput, _columns
+from genki_wave.compression import read_compressed
+from genki_wave.data import DataPackage, DataPackageView, Point3d, RawDataPackage, SpectrogramDataPackage
+from genki_wave.data.organization import DATA_PACKAGE_SCHEMA, RAW_DATA_PACKAGE_SCHEMA
+from tests.constants import SERIAL_EXPECTED
+
+DATA_PACKAGES = [p for p in SERIAL_EXPECTED if isinstance(p, DataPackage)]
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def _as_row(package):
+    return [str(v) for v in package.as_flat_dict().values()]
+
+
+@pytest.mark.parametrize("flush_len", [1, 4, 1000])
+def test_csv_output(tmp_path, flush_len):
+    path = tmp_path / "data.csv"
+    csv_output = CsvOutput(path, flush_len=flush_len)
+    for package in SERIAL_EXPECTED:
+        csv_output(package)
+    csv_output.close()
+
+    header, *rows = _read_csv(path)
+    assert tuple(header) == DataPackage.flat_keys()
+    assert rows == [_as_row(p) for p in DATA_PACKAGES]
+    assert not csv_output.path(RawDataPackage).exists(), "Expected no file for a package type that never arrived"
+
+
+def test_csv_output_appends(tmp_path):
+    path = tmp_path / "data.csv"
+    package = DATA_PACKAGES[0]
+    for _ in range(2):
+        csv_output = CsvOutput(path)
+        csv_output(package)
+        csv_output(DataPackageView(DATA_PACKAGE_SCHEMA.encode(package)))
+        csv_output.close()
+
+    header, *rows = _read_csv(path)
+    assert tuple(header) == DataPackage.flat_keys()
+    assert rows == [_as_row(package)] * 4
+
+
+def test_csv_output_compressed(tmp_path):
+    path = tmp_path / "data.csv.z"
+    for _ in range(2):
+        csv_output = CsvOutput(path, flush_len=4, compression="zlib")
+        for package in SERIAL_EXPECTED:
+            csv_output(package)
+        csv_output.close()
+
+    header, *rows = csv.reader(io.StringIO(read_compressed(path).decode(), newline=""))
+    assert tuple(header) == DataPackage.flat_keys()
+    assert rows == [_as_row(p) for p in DATA_PACKAGES] * 2
+
+
+def test_csv_output_package_types(tmp_path):
+    raw = RawDataPackage(gyro=Point3d(-4.5, 24.0, -12.25), acc=Point3d(0.0, 0.5, 0.75), timestamp_us=10)
+    data = np.arange(SpectrogramDataPackage._num_floats, dtype=np.float32).reshape(6, 16)
+    spectrogram = SpectrogramDataPackage(data=data, timestamp_us=20)
+
+    csv_output = CsvOutput(tmp_path / "data.csv")
+    for package in [raw, spectrogram, DATA_PACKAGES[0], raw]:
+        csv_output(package)
+    csv_output.close()
+
+    assert _read_csv(tmp_path / "data_raw.csv") == [list(RawDataPackage.flat_keys())] + [_as_row(raw)] * 2
+    header, row = _read_csv(tmp_path / "data_spectrogram.csv")
+    assert header[:2] == ["acc_x_0", "acc_x_1"] and header[-1] == "timestamp_us"
+    assert row == [str(float(v)) for v in data.ravel()] + ["20"]
+    assert len(_read_csv(tmp_path / "data.csv")) == 2
+
+
+def test_csv_output_flushes_on_time(tmp_path):
+    path = tmp_path / "data.csv"
+    csv_output = CsvOutput(path, flush_len=1000, flush_interval=0.01)
+    csv_output(DATA_PACKAGES[0])
+
+    deadline = time.perf_counter() + 5
+    while not path.exists() or len(_read_csv(path)) < 2:
+        assert time.perf_counter() < deadline, "Expected the buffered row to be written without closing"
+        time.sleep(0.01)
+    csv_output.close()
+
+
+def test_csv_output_write_fails(tmp_path):
+    # The directory doesn't exist, so opening the file fails on the writer thread
+    csv_output = CsvOutput(tmp_path / "missing" / "data.csv", flush_len=1)
+    csv_output(DATA_PACKAGES[0])
+    csv_output._thread.join(5)
+
+    with pytest.raises(RuntimeError) as e:
+        csv_output(DATA_PACKAGES[1])
+    assert isinstance(e.value.__cause__, FileNotFoundError)
+    with pytest.raises(RuntimeError):
+        csv_output.close()
+
+
+def _spectrogram(timestamp_us):
+    data = np.arange(SpectrogramDataPackage._num_floats, dtype=np.float32).reshape(6, 16) + timestamp_us
+    return SpectrogramDataPackage(data=data, timestamp_us=timestamp_us)
+
+
+RAW = RawDataPackage(gyro=Point3d(-4.5, 24.0, -12.25), acc=Point3d(0.0, 0.5, 0.75), timestamp_us=10)
+
+
+@pytest.mark.parametrize(
+    "package_type, packages",
+    [
+        (DataPackage, DATA_PACKAGES),
+        (RawDataPackage, [RAW, RAW]),
+        (SpectrogramDataPackage, [_spectrogram(10), _spectrogram(20)]),
+    ],
+)
+def test_columns(package_type, packages, monkeypatch):
+    # The columns are built from the fields of the packages, not by encoding and decoding them again
+    for schema in (DATA_PACKAGE_SCHEMA, RAW_DATA_PACKAGE_SCHEMA):
+        monkeypatch.setattr(schema, "encode", None)
+    columns = _columns(package_type, packages)
+
+    assert tuple(columns) == package_type.flat_keys()
+    assert columns["timestamp_us"].dtype == np.uint64
+    for i, package in enumerate(packages):
+        assert [c[i] for c in columns.values()] == pytest.approx(list(package.as_flat_tuple()), abs=1e-5)
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_arrow_output(tmp_path, file_format):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    filename = tmp_path / f"data.{file_format}"
+    arrow_output = ArrowOutput(filename, row_group_size=4, file_format=file_format)
+    for package in SERIAL_EXPECTED + [RAW]:
+        arrow_output(package)
+    arrow_output.close()
+
+    def read(path):
+        if file_format == "parquet":
+            return pyarrow.parquet.read_table(path)
+        with pa.OSFile(str(path)) as f:
+            return pyarrow.ipc.open_stream(f).read_all()
+
+    table = read(filename)
+    assert tuple(table.column_names) == DataPackage.flat_keys()
+    assert table.schema.field("gyro_x").type == pa.float32()
+    assert table.schema.field("timestamp_us").type == pa.uint64()
+    assert table.column("timestamp_us").to_pylist() == [p.timestamp_us for p in DATA_PACKAGES]
+    if file_format == "parquet":
+        assert pyarrow.parquet.ParquetFile(filename).num_row_groups == -(-len(DATA_PACKAGES) // 4)
+
+    raw_table = read(arrow_output.path(RawDataPackage))
+    assert tuple(raw_table.column_names) == RawDataPackage.flat_keys()
+    assert raw_table.num_rows == 1
+
+
+def test_npy_output(tmp_path):
+    filename = tmp_path / "data.npy"
+    npy_output = NpyOutput(filename, flush_len=4, extent_rows=5)
+    for package in SERIAL_EXPECTED[:6]:
+        npy_output(package)
+
+    # Can be read while it's being written, up to the last flush
+    num_flushed = len([p for p in SERIAL_EXPECTED[:6] if isinstance(p, DataPackage)]) // 4 * 4
+    assert len(np.load(filename, mmap_mode="r")) == num_flushed
+
+    for package in SERIAL_EXPECTED[6:] + [RAW]:
+        npy_output(package)
+    npy_output.close()
+
+    data = np.load(filename, mmap_mode="r")
+    assert data.dtype.names == DataPackage.flat_keys()
+    assert data["gyro_x"].dtype == np.float32 and data["timestamp_us"].dtype == np.uint64
+    assert len(data) == len(DATA_PACKAGES)
+    for row, package in zip(data, DATA_PACKAGES):
+        assert list(row.item()) == pytest.approx(list(package.as_flat_tuple()), abs=1e-5)
+    # The unused part of the last extent is dropped
+    assert filename.stat().st_size == data.offset + data.nbytes
+
+    raw = np.load(npy_output.path(RawDataPackage))
+    assert raw.dtype.names == RawDataPackage.flat_keys() and len(raw) == 1
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from genki_wave.clock import ClockSync, fit_host_time
+
+HOST_START_NS = 1_700_000_000_000_000_000
+MIN_LATENCY_NS = 2_000_000
+
+
+def _stream(seconds, rate_hz=400.0, drift_ppm=50.0, device_start_us=0, seed=0):
+    """`(device_us, arrival_ns, sampled_ns)` of a device whose clock runs `drift_ppm` fast, with jittery transport"""
+    rng = np.random.default_rng(seed)
+    elapsed_ns = np.arange(int(seconds * rate_hz), dtype=np.int64) * int(1e9 / rate_hz)
+    device_us = device_start_us + np.round(elapsed_ns / 1000 * (1 + drift_ppm * 1e-6)).astype(np.int64)
+    latency_ns = MIN_LATENCY_NS + rng.exponential(2e6, len(elapsed_ns)).astype(np.int64)
+    # Now and then the link stalls and a few packages arrive much later
+    latency_ns[rng.random(len(elapsed_ns)) < 0.01] += 100_000_000
+    sampled_ns = HOST_START_NS + elapsed_ns
+    return device_us, sampled_ns + latency_ns, sampled_ns
+
+
+def test_clock_sync():
+    device_us, arrival_ns, sampled_ns = _stream(120)
+    clock = ClockSync(num_blocks=30)
+    assert clock.host_time_ns(0) is None
+
+    estimates = np.array([clock.stamp(int(d), int(a)) for d, a in zip(device_us, arrival_ns)])
+    # The estimate includes the minimum latency, which can't be told apart from the clock offset
+    errors = estimates - sampled_ns - MIN_LATENCY_NS
+    assert np.abs(errors[len(errors) // 10 :]).max() < 100_000
+    assert clock.drift_ppm == pytest.approx(50, abs=5)
+    assert clock.num_resets == 0
+
+
+def test_clock_sync_restart():
+    first, second = _stream(5), _stream(5, device_start_us=20_000_000_000, seed=1)
+    device_us, arrival_ns, _ = (np.r_[a, b] for a, b in zip(second, first))
+
+    clock = ClockSync()
+    for d, a in zip(device_us, arrival_ns):
+        clock.update(int(d), int(a))
+    assert clock.num_resets == 1
+    assert clock.host_time_ns(int(device_us[-1])) - arrival_ns[-1] < 10_000_000
+
+
+def test_fit_host_time():
+    device_us, arrival_ns, sampled_ns = _stream(120)
+    errors = fit_host_time(device_us, arrival_ns) - sampled_ns - MIN_LATENCY_NS
+    assert np.abs(errors).max() < 100_000
+
+    # A restart of the device, each part is fitted on its own
+    second = _stream(60, device_start_us=0, seed=1)
+    device_us = np.r_[device_us + 10**9, second[0]]
+    arrival_ns = np.r_[arrival_ns, second[1] + 200 * 10**9]
+    sampled_ns = np.r_[sampled_ns, second[2] + 200 * 10**9]
+    errors = fit_host_time(device_us, arrival_ns) - sampled_ns - MIN_LATENCY_NS
+    assert np.abs(errors).max() < 100_000
+
+
+def test_fit_host_time_short():
+    assert len(fit_host_time(np.array([], dtype=np.uint64), np.array([], dtype=np.uint64))) == 0
+    # Too short for a line, the smallest offset is used for all of them
+    estimates = fit_host_time([100, 200], [HOST_START_NS + 5, HOST_START_NS])
+    assert estimates.tolist() == [HOST_START_NS - 100_000, HOST_START_NS]
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from genki_wave.compression import (
+    CompressedWriter,
+    chunk_offsets,
+    chunk_table,
+    is_compressed,
+    iter_compressed_chunks,
+    read_compressed,
+    read_compressed_from,
+    uncompressed_size,
+)
+
+DATA = b"".join(f"{i},{i * 0.5},{i % 7}\n".encode() for i in range(5000))
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_roundtrip(tmp_path, codec):
+    path = tmp_path / "data.z"
+    with CompressedWriter(path, codec, chunk_size=4096) as f:
+        for i in range(0, len(DATA), 1000):
+            f.write(DATA[i : i + 1000])
+
+    assert is_compressed(path)
+    assert read_compressed(path) == DATA
+    assert path.stat().st_size < len(DATA) / 2
+    assert len(chunk_offsets(path)) == f.num_chunks > 1
+
+
+def test_start_at_any_chunk(tmp_path):
+    path = tmp_path / "data.z"
+    with CompressedWriter(path, chunk_size=4096) as f:
+        f.write(DATA)
+        f.end_chunk()
+        f.write(b"last")
+
+    offsets = chunk_offsets(path)
+    chunks = [data for _, data in iter_compressed_chunks(path)]
+    assert chunks[-1] == b"last"
+    for i, offset in enumerate(offsets):
+        assert [data for _, data in iter_compressed_chunks(path, offset)] == chunks[i:]
+
+
+def test_read_from(tmp_path):
+    path = tmp_path / "data.z"
+    with CompressedWriter(path, chunk_size=4096) as f:
+        for i in range(0, len(DATA), 4096):
+            f.write(DATA[i : i + 4096])
+
+    table = chunk_table(path)
+    assert [offset for offset, _, _ in table] == chunk_offsets(path)
+    assert [start for _, start, _ in table] == list(range(0, len(DATA), 4096))
+    assert uncompressed_size(path) == len(DATA)
+    for offset in (0, 1, 4095, 4096, 10000, len(DATA) - 1, len(DATA)):
+        assert b"".join(read_compressed_from(path, offset)) == DATA[offset:]
+
+
+def test_append(tmp_path):
+    path = tmp_path / "data.z"
+    for part in (DATA[:100], DATA[100:]):
+        with CompressedWriter(path, "lzma") as f:
+            f.write(part)
+    assert read_compressed(path) == DATA
+
+    with pytest.raises(ValueError):
+        CompressedWriter(path, "zlib")
+
+
+def test_truncated(tmp_path):
+    path = tmp_path / "data.z"
+    with CompressedWriter(path, chunk_size=4096) as f:
+        f.write(DATA)
+    offsets = chunk_offsets(path)
+
+    # As if the program was killed halfway through writing the last chunk
+    os.truncate(path, offsets[-1] + 20)
+    assert chunk_offsets(path) == offsets[:-1]
+    assert DATA.startswith(read_compressed(path))
+    assert len(read_compressed(path)) == 4096 * (len(offsets) - 1)
+
+
+def test_append_to_truncated(tmp_path):
+    path = tmp_path / "data.z"
+    with CompressedWriter(path) as f:
+        f.write(DATA[:1000])
+    os.truncate(path, path.stat().st_size - 20)
+
+    with CompressedWriter(path) as f:
+        f.write(DATA[1000:2000])
+    # The cut off chunk is gone, the appended one is readable
+    assert read_compressed(path) == DATA[1000:2000]
+    assert chunk_table(path) == [(chunk_offsets(path)[0], 0, 1000)]
+
+
+def test_not_compressed(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(DATA)
+    assert not is_compressed(path)
+    with pytest.raises(ValueError):
+        read_compressed(path)
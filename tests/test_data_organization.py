@@ -1,10 +1,32 @@
-from dataclasses import asdict, dataclass
+import pickle
+import struct
+from dataclasses import asdict, dataclass, replace
 from typing import Optional
 
+import numpy as np
 import pytest
+from cobs import cobs
 
 from genki_wave.data import Point3d, Quaternion, Euler3d
-from genki_wave.data.organization import PackageMetadata, flatten_nested_dataclass_fields, DataPackage, RawDataPackage
+from genki_wave.data.enums import PackageId, PackageType
+from genki_wave.data.organization import (
+    PackageMetadata,
+    flatten_nested_dataclass_fields,
+    DataPackage,
+    DataPackageView,
+    RawDataPackage,
+    SpectrogramDataPackage,
+    decode_data_packages,
+    columnar_batch,
+    decode_raw_data_packages,
+    flat_columns,
+    process_byte_data,
+    DATA_PACKAGE_SCHEMA,
+    SPECTROGRAM_DATA_PACKAGE_SCHEMA,
+    DeviceInfo,
+)
+from genki_wave.data.writing import encode_package
+from tests.constants import SERIAL_EXPECTED, data_payloads
 
 
 def flatten_nested_dicts(d: dict, name: Optional[str]) -> dict:
@@ -112,5 +134,130 @@ def test_package_metadata_to_bytes_sanity_check(input_and_expected):
     ],
 )
 def test_datapackage_as_dict(dp):
-    assert dp.as_dict() == asdict(dp)
-    assert dp.as_flat_dict() == flatten_nested_dicts(asdict(dp), None)
+    expected = {k: v for k, v in asdict(dp).items() if k not in ("arrival_time_ns", "host_time_ns")}
+    assert dp.as_dict() == expected
+    assert dp.as_flat_dict() == flatten_nested_dicts(expected, None)
+
+
+@pytest.mark.parametrize("contiguous", [True, False])
+def test_decode_data_packages(contiguous):
+    payloads = data_payloads()
+    batch = decode_data_packages(b"".join(payloads) if contiguous else payloads)
+
+    assert len(batch) == len(payloads)
+    columns = flat_columns(batch)
+    for i, payload in enumerate(payloads):
+        expected = DataPackage.from_raw_bytes(payload).as_flat_dict()
+        for k, v in columns.items():
+            assert v[i] == pytest.approx(expected[k])
+
+
+def test_columnar_batch():
+    payloads = data_payloads()
+    packages = [DataPackage.from_raw_bytes(p) for p in payloads]
+    packages[1] = process_byte_data(bytes([PackageType.STREAM, PackageId.DATASTREAM, 0, 0]) + payloads[1], lazy=True)
+    columns = columnar_batch(packages + [RawDataPackage(Point3d(0, 0, 0), Point3d(0, 0, 0), 0)])
+
+    assert tuple(columns) == DataPackage.flat_keys()
+    for i, payload in enumerate(payloads):
+        expected = DataPackage.from_raw_bytes(payload).as_flat_dict()
+        for k, v in columns.items():
+            assert v[i] == pytest.approx(expected[k], abs=1e-5)
+
+
+def test_columnar_batch_without_views(monkeypatch):
+    packages = [DataPackage.from_raw_bytes(p) for p in data_payloads()]
+    # The columns are built from the fields of the packages, not by encoding and decoding them again
+    monkeypatch.setattr(DATA_PACKAGE_SCHEMA, "encode", None)
+    columns = columnar_batch(packages)
+
+    for i, package in enumerate(packages):
+        for k, v in package.as_flat_dict().items():
+            assert columns[k][i] == pytest.approx(v, abs=1e-5)
+    assert all(len(v) == 0 for v in columnar_batch([]).values())
+
+
+def test_decode_raw_data_packages():
+    dp = RawDataPackage(gyro=Point3d(x=-4.5, y=24.0, z=-12.25), acc=Point3d(x=0.0, y=0.5, z=0.75), timestamp_us=10)
+    payload = struct.pack("<6fQ", -4.5, 24.0, -12.25, 0.0, 0.5, 0.75, 10)
+    batch = decode_raw_data_packages(payload * 3)
+
+    assert list(flat_columns(batch)) == list(RawDataPackage.flat_keys())
+    for k, v in flat_columns(batch).items():
+        assert (v == dp.as_flat_dict()[k]).all()
+
+
+def test_decode_data_packages_wrong_len():
+    with pytest.raises(ValueError):
+        decode_data_packages(b"\x00" * (DataPackage._raw_len + 1))
+
+
+def test_data_package_view():
+    for payload in data_payloads():
+        view = DataPackageView(memoryview(payload))
+        assert view.timestamp_us == DataPackage.from_raw_bytes(payload).timestamp_us
+        assert "grav" not in vars(view) and "gyro" not in vars(view), "Expected only the accessed fields to be decoded"
+
+        assert view == DataPackage.from_raw_bytes(payload)
+        assert view.as_dict() == DataPackage.from_raw_bytes(payload).as_dict()
+        assert view.as_flat_dict() == DataPackage.from_raw_bytes(payload).as_flat_dict()
+        assert view.to_package() == DataPackage.from_raw_bytes(payload)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_process_byte_data_host_times(lazy):
+    header = PackageMetadata(type=3, id=PackageId.DATASTREAM, payload_size=DataPackage._raw_len).to_bytes()
+    payload = data_payloads()[0]
+    package = process_byte_data(header + payload, lazy=lazy, arrival_time_ns=20, host_time_ns=10)
+    assert (package.arrival_time_ns, package.host_time_ns) == (20, 10)
+    assert package == DataPackage.from_raw_bytes(payload), "Expected the host times to not take part in comparisons"
+
+    package = package.to_package() if lazy else package
+    for copy in [replace(package), pickle.loads(pickle.dumps(package))]:
+        assert (copy.arrival_time_ns, copy.host_time_ns) == (20, 10)
+    assert "host_time_ns" not in DataPackage.flat_keys() and "host_time_ns" not in package.as_flat_dict()
+
+
+def test_process_byte_data_lazy():
+    header = PackageMetadata(type=3, id=PackageId.DATASTREAM, payload_size=DataPackage._raw_len).to_bytes()
+    for payload in data_payloads():
+        view = process_byte_data(header + payload, lazy=True)
+        assert isinstance(view, DataPackageView)
+        assert view == process_byte_data(header + payload)
+
+
+def test_spectrogram_data_package():
+    bins = np.arange(96, dtype=np.float32)
+    payload = bins.tobytes() + struct.pack("<Q", 10)
+    package = SpectrogramDataPackage.from_raw_bytes(payload)
+
+    assert package.data.shape == (6, 16) and package.data.dtype == np.float32
+    assert not package.data.flags.writeable
+    assert package.channel("gyro_x").tolist() == bins[48:64].tolist()
+    assert np.shares_memory(package.channel("gyro_x"), package.data)
+
+    d = package.as_dict()
+    assert list(d) == [*SpectrogramDataPackage.channel_names, "timestamp_us"]
+    assert d["acc_y"].tolist() == bins[16:32].tolist() and d["timestamp_us"] == 10
+
+    assert package == SpectrogramDataPackage.from_raw_bytes(payload)
+    assert package != SpectrogramDataPackage.from_raw_bytes(payload[:-8] + struct.pack("<Q", 11))
+    assert SPECTROGRAM_DATA_PACKAGE_SCHEMA.dtype.itemsize == len(payload)
+
+
+@pytest.mark.parametrize(
+    "package",
+    [
+        RawDataPackage(gyro=Point3d(x=-4.5, y=24.0, z=-12.25), acc=Point3d(x=0.0, y=0.5, z=0.75), timestamp_us=10),
+        DeviceInfo(version="1.7.4", board_version="wave", mac_address="AA:BB:CC:DD:EE:0F", serial_number="1234"),
+        SpectrogramDataPackage(data=np.ones((6, 16), dtype=np.float32), timestamp_us=10),
+    ],
+    ids=lambda p: type(p).__name__,
+)
+def test_encode_package(package):
+    assert process_byte_data(cobs.decode(encode_package(package)[:-1])) == package
+
+
+def test_encode_package_fixtures():
+    for package in SERIAL_EXPECTED:
+        assert process_byte_data(cobs.decode(encode_package(package)[:-1])) == package
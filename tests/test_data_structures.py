@@ -1,6 +1,21 @@
+import asyncio
+import queue
+import threading
+
+import numpy as np
 import pytest
 
-from genki_wave.data.structures import QueueWithPop
+from genki_wave.data import DataPackage
+from genki_wave.data.organization import RAW_DATA_PACKAGE_DTYPE
+from genki_wave.data.enums import OverflowPolicy
+from genki_wave.data.structures import (
+    END_OF_STREAM,
+    BoundedAsyncQueue,
+    ColumnarRingBuffer,
+    QueueWithPop,
+    TaggedPackage,
+)
+from tests.constants import SERIAL_EXPECTED
 
 
 @pytest.mark.parametrize("insert", [[1, 2, 3], []])
@@ -10,8 +25,159 @@ def test_queue_with_pop_pop_all(insert):
         q.put(val)
 
     assert q.pop_all() == insert
+    assert q.unfinished_tasks == 0
+
+
+def test_queue_with_pop_pop_all_wakes_join():
+    q = QueueWithPop()
+    q.put_many([1, 2, 3])
+    joined = threading.Event()
+    threading.Thread(target=lambda: (q.join(), joined.set()), daemon=True).start()
+
+    assert not joined.wait(0.05)
+    q.pop_all()
+    assert joined.wait(5)
 
 
 def test_queue_with_pop_none():
     q = QueueWithPop()
     assert q.pop() is None
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        (OverflowPolicy.DROP_OLDEST, [3, 4, 5]),
+        (OverflowPolicy.DROP_NEWEST, [1, 2, 3]),
+        (OverflowPolicy.KEEP_LATEST_PER_TYPE, ["a", 4, 5]),
+    ],
+)
+def test_queue_with_pop_overflow(policy, expected):
+    q = QueueWithPop(maxsize=3, policy=policy)
+    items = ["a", 1, 2, 3, 4, 5] if policy == OverflowPolicy.KEEP_LATEST_PER_TYPE else [1, 2, 3, 4, 5]
+    for val in items:
+        q.put(val)
+
+    assert q.pop_all() == expected
+    assert q.num_dropped == len(items) - 3
+    assert q.high_water_mark == 3
+
+
+def test_queue_with_pop_block():
+    q = QueueWithPop(maxsize=2)
+    q.put(1)
+    q.put(2)
+    with pytest.raises(queue.Full):
+        q.put(3, timeout=0.01)
+    assert q.num_dropped == 0 and q.high_water_mark == 2
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [(OverflowPolicy.BLOCK, [1, 2, 3, 4, 5]), (OverflowPolicy.DROP_OLDEST, [3, 4, 5])],
+)
+def test_queue_with_pop_put_many(policy, expected):
+    q = QueueWithPop(maxsize=0 if policy == OverflowPolicy.BLOCK else 3, policy=policy)
+    q.put_many([1, 2])
+    q.put_many([3, 4, 5])
+
+    assert q.pop_all() == expected
+    assert q.pop_all() == []
+    assert q.high_water_mark == len(expected)
+
+
+def test_queue_with_pop_put_many_blocks_until_drained():
+    q = QueueWithPop(maxsize=2)
+    popped = []
+    producer = threading.Thread(target=q.put_many, args=([1, 2, 3, 4, 5],))
+    producer.start()
+    while producer.is_alive() or q.qsize():
+        popped.extend(q.pop_all())
+        producer.join(0.001)
+
+    assert popped == [1, 2, 3, 4, 5]
+    assert q.num_dropped == 0 and q.high_water_mark == 2
+
+
+def test_overflow_keeps_end_of_stream():
+    q = QueueWithPop(maxsize=2, policy=OverflowPolicy.DROP_NEWEST)
+    for val in [1, 2, END_OF_STREAM]:
+        q.put(val)
+    assert q.pop_all() == [2, END_OF_STREAM]
+
+
+def test_keep_latest_per_type_per_device():
+    q = QueueWithPop(maxsize=2, policy=OverflowPolicy.KEEP_LATEST_PER_TYPE)
+    for val in [TaggedPackage("a", 1), TaggedPackage("b", 2), TaggedPackage("a", 3)]:
+        q.put(val)
+    assert q.pop_all() == [TaggedPackage("b", 2), TaggedPackage("a", 3)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "policy, expected",
+    [(OverflowPolicy.DROP_OLDEST, [3, 4, 5]), (OverflowPolicy.DROP_NEWEST, [1, 2, 3])],
+)
+async def test_bounded_async_queue(policy, expected):
+    q = BoundedAsyncQueue(maxsize=3, policy=policy)
+    for val in [1, 2, 3, 4]:
+        await q.put(val)
+    q.put_nowait(5)
+
+    assert [q.get_nowait() for _ in range(q.qsize())] == expected
+    assert q.num_dropped == 2 and q.high_water_mark == 3
+
+
+@pytest.mark.asyncio
+async def test_bounded_async_queue_block():
+    q = BoundedAsyncQueue(maxsize=1)
+    await q.put(1)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(q.put(2), timeout=0.01)
+
+
+def _raw_batch(timestamps) -> np.ndarray:
+    batch = np.zeros(len(timestamps), dtype=RAW_DATA_PACKAGE_DTYPE)
+    batch["gyro"]["x"] = np.arange(len(timestamps))
+    batch["timestamp_us"] = timestamps
+    return batch
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 20])
+def test_columnar_ring_buffer_last(chunk_size):
+    buffer = ColumnarRingBuffer(7, dtype=RAW_DATA_PACKAGE_DTYPE)
+    batch = _raw_batch(np.arange(20) * 2500)
+    for start in range(0, len(batch), chunk_size):
+        buffer.extend(batch[start : start + chunk_size])
+
+    assert len(buffer) == 7
+    assert buffer.channels == ("gyro_x", "gyro_y", "gyro_z", "acc_x", "acc_y", "acc_z")
+
+    last = buffer.last(5)
+    np.testing.assert_array_equal(last["gyro_x"], np.arange(15, 20, dtype=np.float32))
+    np.testing.assert_array_equal(last["timestamp_us"], np.arange(15, 20) * 2500)
+    assert last["gyro_x"].base is not None, "Expected a view, not a copy"
+    assert len(buffer.last(100)["gyro_x"]) == 7
+
+
+def test_columnar_ring_buffer_since():
+    buffer = ColumnarRingBuffer(8, dtype=RAW_DATA_PACKAGE_DTYPE)
+    buffer.extend(_raw_batch(np.arange(10) * 2500))
+
+    np.testing.assert_array_equal(buffer.since(17500)["timestamp_us"], [17500, 20000, 22500])
+    np.testing.assert_array_equal(buffer.since(17400)["gyro_x"], [7, 8, 9])
+    assert len(buffer.since(0)["timestamp_us"]) == 8
+    assert len(buffer.since(10**9)["timestamp_us"]) == 0
+
+
+def test_columnar_ring_buffer_append():
+    buffer = ColumnarRingBuffer(2)
+    for package in SERIAL_EXPECTED:
+        if isinstance(package, DataPackage):
+            buffer.append(package)
+
+    expected = [p for p in SERIAL_EXPECTED if isinstance(p, DataPackage)][-2:]
+    last = buffer.last(2)
+    assert last["timestamp_us"].tolist() == [p.timestamp_us for p in expected]
+    assert last["euler_yaw"].tolist() == pytest.approx([p.euler.yaw for p in expected])
+    assert "grav_x" not in last
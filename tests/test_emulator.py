@@ -0,0 +1,115 @@
+import termios
+import threading
+import time
+from collections import Counter
+
+import pytest
+import serial
+
+from genki_wave.asyncio_runner import run_asyncio_devices
+from genki_wave.callbacks import WaveCallback
+from genki_wave.constants import BAUDRATE
+from genki_wave.data import (
+    ButtonAction,
+    ButtonEvent,
+    ButtonId,
+    DataPackage,
+    DeviceInfo,
+    RawDataPackage,
+    SpectrogramDataPackage,
+)
+from genki_wave.data.writing import get_device_info_request, get_start_spectrogram_package
+from genki_wave.emulator import WaveEmulator
+from genki_wave.protocols import TaggedPackage
+from genki_wave.data.enums import DatastreamType
+from genki_wave.threading_runner import ReaderThreadSerial
+
+
+def _receive(emulator: WaveEmulator, seconds: float, requests=(), actions=()) -> list:
+    reader_thread = ReaderThreadSerial.from_port(emulator.port)
+    with reader_thread as protocol:
+        for request in requests:
+            reader_thread.write(request)
+        for action in actions:
+            time.sleep(seconds / (len(actions) + 1))
+            action()
+        time.sleep(seconds / (len(actions) + 1))
+        return protocol.queue.pop_all()
+
+
+def test_emulator_stream():
+    with WaveEmulator(rate_hz=200) as emulator:
+        packages = _receive(emulator, 0.5, [get_device_info_request()], [lambda: emulator.press(ButtonId.MIDDLE)])
+
+    data = [p for p in packages if isinstance(p, DataPackage)]
+    assert len(data) > 20
+    assert all(b.timestamp_us - a.timestamp_us == 5000 for a, b in zip(data, data[1:]))
+    assert any(isinstance(p, DeviceInfo) and p == emulator.device_info for p in packages)
+    assert any(isinstance(p, ButtonEvent) and p.button_id == ButtonId.MIDDLE for p in packages)
+
+
+def test_emulator_raw_data():
+    with WaveEmulator(rate_hz=400, datastream_type=DatastreamType.RAW_DATA) as emulator:
+        packages = _receive(emulator, 0.3)
+
+    assert packages and all(isinstance(p, RawDataPackage) for p in packages)
+
+
+def test_emulator_api_config():
+    with WaveEmulator(rate_hz=400) as emulator:
+        packages = _receive(emulator, 0.3, [get_start_spectrogram_package()])
+
+    assert emulator.rate_hz == 2000
+    assert any(isinstance(p, SpectrogramDataPackage) for p in packages)
+
+
+def test_emulator_faults():
+    with WaveEmulator(rate_hz=200, seed=0) as emulator:
+        packages = _receive(
+            emulator,
+            0.8,
+            actions=[lambda: emulator.corrupt(3), lambda: emulator.stall(0.1, drop=True), lambda: emulator.burst(20)],
+        )
+
+    timestamps = [p.timestamp_us for p in packages if isinstance(p, DataPackage)]
+    assert sorted(timestamps) == timestamps
+    # The corrupted frames are skipped
+    assert len(timestamps) < emulator.num_samples
+
+
+class DeviceCountCallback(WaveCallback):
+    def __init__(self):
+        self.counts = Counter()
+
+    def _tagged_handler(self, data: TaggedPackage) -> None:
+        self.counts[data.device] += 1
+        super()._tagged_handler(data)
+
+    def _button_handler(self, data):
+        pass
+
+    def _data_handler(self, data):
+        pass
+
+
+def _pty_supports_reconfiguring() -> bool:
+    # `serial_asyncio` changes the settings of a port after opening it, which some kernels reject for ptys with parity
+    with WaveEmulator() as emulator:
+        try:
+            with serial.Serial(emulator.port, BAUDRATE, parity=serial.PARITY_EVEN) as port:
+                port.timeout = 0
+        except termios.error:
+            return False
+    return True
+
+
+@pytest.mark.skipif(not _pty_supports_reconfiguring(), reason="Needs a pty that accepts the serial settings")
+def test_run_asyncio_devices():
+    callback = DeviceCountCallback()
+    with WaveEmulator(rate_hz=200) as first, WaveEmulator(rate_hz=100) as second:
+        # Holding the top button is the cancel event, which stops the whole session
+        threading.Timer(0.5, second.press, (ButtonId.TOP, ButtonAction.EXTRALONG)).start()
+        run_asyncio_devices([callback], serial_ports=[first.port, second.port])
+
+    assert set(callback.counts) == {first.port, second.port}
+    assert callback.counts[first.port] > callback.counts[second.port] > 10
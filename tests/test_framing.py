@@ -0,0 +1,95 @@
+import random
+
+import pytest
+from cobs import cobs
+
+from genki_wave.data import DataPackage
+from genki_wave.data.enums import PackageId
+from genki_wave.data.organization import decode_data_packages
+from genki_wave.framing import FrameSplitter, cobs_decode_frames
+from tests.constants import BLUETOOTH_DATA, SERIAL_DATA, SERIAL_EXPECTED
+
+
+@pytest.mark.parametrize("data", (BLUETOOTH_DATA, SERIAL_DATA), ids=["bluetooth", "serial"])
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 100_000])
+def test_frame_splitter(data, chunk_size):
+    stream = b"".join(data)
+    # Everything up to the last terminator, with empty frames skipped
+    expected = [frame for frame in stream.split(b"\x00")[:-1] if frame]
+
+    framer = FrameSplitter()
+    actual = []
+    for start in range(0, len(stream), chunk_size):
+        actual.extend(frame.tobytes() for frame in framer.feed(stream[start : start + chunk_size]))
+
+    assert actual == expected
+    assert framer.buffer == stream.split(b"\x00")[-1]
+
+
+def test_frame_splitter_returns_views():
+    frames = FrameSplitter().feed(b"ab\x00cd\x00e")
+    assert all(isinstance(frame, memoryview) for frame in frames)
+    assert [frame.tobytes() for frame in frames] == [b"ab", b"cd"]
+
+
+def test_frame_splitter_max_frame_size():
+    framer = FrameSplitter(max_frame_size=8)
+    for _ in range(100):
+        assert framer.feed(b"\x01" * 5) == []
+        assert len(framer.buffer) <= 8
+
+    assert framer.num_dropped_bytes > 0
+
+    framer = FrameSplitter(max_frame_size=8)
+    frames = framer.feed(b"\x02" * 9 + b"\x00" + b"\x03" * 8 + b"\x00")
+    assert [frame.tobytes() for frame in frames] == [b"\x03" * 8]
+    assert framer.num_dropped_bytes == 9
+
+
+def _encoded_frames(payloads) -> bytes:
+    return b"".join(cobs.encode(p) + b"\x00" for p in payloads)
+
+
+def test_cobs_decode_frames():
+    rng = random.Random(0)
+    payloads = [bytes(rng.choice([0, 0, rng.randrange(256)]) for _ in range(rng.randrange(1, 120))) for _ in range(200)]
+    # Long runs without zeros are encoded with 0xFF code bytes
+    payloads += [bytes(range(1, 256)) * 2, bytes(254), b"\x01" * 254, b"\x01" * 253 + b"\x00", b"\x00"]
+    chunk = b"\x00\x00" + _encoded_frames(payloads) + b"\x05\x01"
+
+    frames = cobs_decode_frames(chunk)
+    assert frames.num_invalid == 0
+    assert [frames.frame(i).tobytes() for i in range(frames.num_frames)] == payloads
+
+
+def test_cobs_decode_frames_invalid():
+    chunk = _encoded_frames([b"abc"]) + b"\x05ab\x00" + _encoded_frames([b"d\x00e"])
+    frames = cobs_decode_frames(chunk)
+
+    assert frames.num_invalid == 1
+    assert [frames.frame(i).tobytes() for i in range(frames.num_frames)] == [b"abc", b"d\x00e"]
+
+
+def test_cobs_decode_frames_payloads():
+    stream = b"".join(SERIAL_DATA)
+    frames = cobs_decode_frames(stream[stream.index(b"\x00") + 1 :])
+    batch = decode_data_packages(frames.payloads(PackageId.DATASTREAM))
+
+    expected = [p for p in SERIAL_EXPECTED if isinstance(p, DataPackage)]
+    assert batch["timestamp_us"].tolist() == [p.timestamp_us for p in expected]
+    assert batch["gyro"]["x"].tolist() == [p.gyro.x for p in expected]
+    assert len(frames.payloads(PackageId.BUTTON_EVENT)) == 3
+
+
+def test_cobs_decode_frames_payloads_short_frames():
+    # Frames that decode to nothing or to less than the metadata
+    frames = cobs_decode_frames(b"\x01\x00")
+    assert frames.num_frames == 1
+    assert frames.payloads(PackageId.DATASTREAM).shape == (0, DataPackage._raw_len)
+    assert len(frames.indices(PackageId.DATASTREAM)) == 0
+
+    stream = b"".join(SERIAL_DATA)
+    chunk = b"\x01\x00\x02\x01\x00" + stream[stream.index(b"\x00") + 1 :]
+    frames = cobs_decode_frames(chunk)
+    assert len(frames.payloads(PackageId.DATASTREAM)) == len([p for p in SERIAL_EXPECTED if isinstance(p, DataPackage)])
+    assert frames.indices(PackageId.DATASTREAM)[0] > 1
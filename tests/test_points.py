@@ -1,6 +1,9 @@
+import pickle
+from dataclasses import FrozenInstanceError
+
 import pytest
 
-from genki_wave.data import Point3d
+from genki_wave.data import Euler3d, Point3d
 from genki_wave.data.points import Quaternion, rotate_vector
 
 
@@ -49,3 +52,14 @@ def test_quaternion_to_and_from_point():
     q = Quaternion.from_point3d(p)
     assert q == Quaternion(0.0, -0.556, -3.0, -0.002)
     assert p == q.to_point3d()
+
+
+@pytest.mark.parametrize("p", [Point3d(1.0, 2.0, 3.0), Euler3d(0.1, 0.2, 0.3), Quaternion(1.0, 0.0, -1.0, 0.5)])
+def test_points_are_slotted_and_frozen(p):
+    assert not hasattr(p, "__dict__")
+    assert pickle.loads(pickle.dumps(p)) == p
+    # Assigns an existing field, a missing one would fail for not being a slot even if the class weren't frozen
+    field = p.__slots__[0]
+    with pytest.raises(FrozenInstanceError):
+        setattr(p, field, 5.0)
+    assert getattr(p, field) != 5.0
@@ -1,6 +1,11 @@
+import asyncio
+import threading
+
 import pytest
 
-from genki_wave.protocols import ProtocolAsyncio, ProtocolThread
+from genki_wave.data import DataPackageView
+from genki_wave.data.enums import OverflowPolicy
+from genki_wave.protocols import CommunicateCancel, ProtocolAsyncio, ProtocolThread
 from tests.constants import BLUETOOTH_DATA, BLUETOOH_EXPECTED, SERIAL_DATA, SERIAL_EXPECTED
 
 
@@ -42,3 +47,68 @@ async def test_protocol_asyncio(data, expected):
 
     # Still good to finally make sure everything matches (number of elements etc)
     assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "data, expected", ((BLUETOOTH_DATA, BLUETOOH_EXPECTED), (SERIAL_DATA, SERIAL_EXPECTED)), ids=["bluetooth", "serial"]
+)
+def test_protocol_thread_lazy(data, expected):
+    protocol = ProtocolThread(lazy=True)
+    for input_raw in data:
+        protocol.data_received(input_raw)
+    actual = protocol.queue.pop_all()
+
+    assert any(isinstance(p, DataPackageView) for p in actual)
+    assert actual == expected
+
+
+def test_protocol_thread_bounded():
+    protocol = ProtocolThread(maxsize=3, policy=OverflowPolicy.DROP_OLDEST)
+    for input_raw in SERIAL_DATA:
+        protocol.data_received(input_raw)
+
+    assert protocol.queue.pop_all() == SERIAL_EXPECTED[-3:]
+    assert protocol.queue.num_dropped == len(SERIAL_EXPECTED) - 3
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_protocol_thread_host_time(lazy):
+    protocol = ProtocolThread(lazy=lazy)
+    for i, input_raw in enumerate(SERIAL_DATA):
+        protocol.data_received(input_raw, arrival_ns=10**18 + i * 10**6)
+    actual = protocol.queue.pop_all()
+
+    assert actual == SERIAL_EXPECTED, "Expected the host times to not change what packages compare equal to"
+    for package in actual:
+        assert package.arrival_time_ns >= 10**18
+        if hasattr(package, "timestamp_us"):
+            # Within the first second the estimate uses the smallest offset so far, which is never after the arrival
+            assert package.host_time_ns <= package.arrival_time_ns
+        else:
+            assert package.host_time_ns == package.arrival_time_ns
+    assert SERIAL_EXPECTED[0].host_time_ns is None, "Expected the host times to be set per package"
+
+
+def test_communicate_cancel_is_per_instance():
+    comm, other = CommunicateCancel(), CommunicateCancel()
+    comm.cancel = True
+    assert comm.cancel and not other.cancel
+
+    comm.cancel = False
+    assert not comm.cancel
+
+
+@pytest.mark.asyncio
+async def test_communicate_cancel_wait():
+    comm = CommunicateCancel()
+    called = []
+    comm.on_cancel(lambda: called.append(True))
+
+    # Cancelled from another thread, like a reader thread being closed
+    threading.Timer(0.01, setattr, (comm, "cancel", True)).start()
+    await asyncio.wait_for(comm.wait(), timeout=5)
+    await asyncio.sleep(0)
+    assert called == [True]
+
+    # Already cancelled, returns right away
+    await asyncio.wait_for(comm.wait(), timeout=1)
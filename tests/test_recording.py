@@ -0,0 +1,267 @@
+import os
+
+import numpy as np
+import pytest
+from cobs import cobs
+
+from genki_wave.callbacks import CsvOutput
+from genki_wave.data.enums import ButtonId, DatastreamType, PackageId
+from genki_wave.data.organization import (
+    ButtonEvent,
+    DataPackage,
+    decode_data_packages,
+    flat_columns,
+    process_byte_data,
+)
+from genki_wave.data.writing import encode_package
+from genki_wave.emulator import _motion_sample
+from genki_wave.protocols import END_OF_STREAM, ProtocolThread
+from genki_wave.recording import (
+    FrameRecorder,
+    ReplayClock,
+    _iter_records_from,
+    build_index,
+    index_path,
+    iter_chunks,
+    load_index,
+    load_recording,
+    read_frames,
+    read_time_range,
+)
+from genki_wave.threading_runner import ReaderThreadReplay
+from tests.constants import SERIAL_DATA, SERIAL_EXPECTED
+
+
+def _record(path, data, lazy=False):
+    with FrameRecorder(path) as recorder:
+        protocol = ProtocolThread(lazy, recorder)
+        for input_raw in data:
+            protocol.data_received(input_raw)
+    return protocol, recorder
+
+
+def test_record_and_load(tmp_path):
+    path = tmp_path / "session.gwrec"
+    protocol, recorder = _record(path, SERIAL_DATA)
+    assert protocol.queue.pop_all() == SERIAL_EXPECTED, "Expected recording to not change what is decoded"
+
+    recording = load_recording(path)
+    assert recording.num_frames == recorder.num_frames > len(SERIAL_EXPECTED)
+    assert (recording.time_ns[1:] >= recording.time_ns[:-1]).all()
+
+    decoded = recording.decode()
+    batch = decode_data_packages(decoded.payloads(PackageId.DATASTREAM))
+    expected = [p for p in SERIAL_EXPECTED if isinstance(p, DataPackage)]
+    assert flat_columns(batch)["timestamp_us"].tolist() == [p.timestamp_us for p in expected]
+
+
+def test_read_frames(tmp_path):
+    path = tmp_path / "session.gwrec"
+    with FrameRecorder(path) as recorder:
+        recorder.record([b"\x01\x02", memoryview(b"\x03")], time_ns=10)
+    with FrameRecorder(path) as recorder:
+        recorder.record([b"\x04"], time_ns=20)
+
+    assert list(read_frames(path)) == [(10, b"\x01\x02"), (10, b"\x03"), (20, b"\x04")]
+    assert load_recording(path).chunk == b"\x01\x02\x00\x03\x00\x04\x00"
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma"])
+def test_compressed_recording(tmp_path, compression):
+    path, plain_path = tmp_path / "session.gwrec", tmp_path / "plain.gwrec"
+    for p, c in ((path, compression), (plain_path, None)):
+        with FrameRecorder(p, compression=c) as recorder:
+            recorder.record([b"\x01\x02", memoryview(b"\x03")], time_ns=10)
+        with FrameRecorder(p, compression=c) as recorder:
+            recorder.record([b"\x04"], time_ns=20)
+
+    assert list(read_frames(path)) == list(read_frames(plain_path))
+    assert load_recording(path).chunk == load_recording(plain_path).chunk
+    with pytest.raises(ValueError):
+        FrameRecorder(path)
+
+
+def _timestamped_frames(num_samples):
+    """`(timestamp_us, frame)` for motion data at 1 kHz, with a button event without a timestamp every 10th sample"""
+    frames = []
+    for i in range(num_samples):
+        p = _motion_sample(i / 1000, i * 1000, DatastreamType.MOTION_DATA)
+        frames.append((p.timestamp_us, encode_package(p)[:-1]))
+        if i % 10 == 5:
+            frames.append((None, encode_package(ButtonEvent(button_id=ButtonId.TOP, action=1))[:-1]))
+    return frames
+
+
+def _expected_range(frames, start_us, stop_us):
+    expected, started = [], False
+    for i, (timestamp_us, frame) in enumerate(frames):
+        if timestamp_us is not None:
+            started = start_us <= timestamp_us < stop_us
+        if started:
+            expected.append((i, frame))
+    return expected
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+@pytest.mark.parametrize("index_interval", [None, 1, 16])
+def test_read_time_range(tmp_path, compression, index_interval):
+    path = tmp_path / "session.gwrec"
+    frames = _timestamped_frames(1000)
+    # Appended in two parts, so the index has to carry on where the first part left off
+    for part in (frames[:300], frames[300:]):
+        with FrameRecorder(path, compression=compression, index_interval=index_interval) as recorder:
+            for i in range(0, len(part), 7):
+                recorder.record([frame for _, frame in part[i : i + 7]], time_ns=i)
+
+    index = load_index(path)
+    if index_interval is None:
+        assert index is None
+    else:
+        assert len(index) >= 1000 // index_interval
+    for start_us, stop_us in [
+        (0, 10**9),
+        (0, 1),
+        (5000, 5001),
+        (123456, 654321),
+        (990500, 10**9),
+        (10**9, 10**10),
+    ]:
+        expected = [frame for _, frame in _expected_range(frames, start_us, stop_us)]
+        assert [frame for _, frame in read_time_range(path, start_us, stop_us)] == expected
+
+
+def test_append_to_truncated_compressed_recording(tmp_path):
+    path = tmp_path / "session.gwrec"
+    frames = _timestamped_frames(900)
+    for part in (frames[:300], frames[300:600], frames[600:]):
+        with FrameRecorder(path, compression="zlib", index_interval=16) as recorder:
+            recorder.record([frame for _, frame in part], time_ns=0)
+        if part[0] is frames[300]:
+            # As if the program was killed while writing the second part, it's lost
+            os.truncate(path, path.stat().st_size - 20)
+
+    kept = frames[:300] + frames[600:]
+    assert [frame for _, frame in read_frames(path)] == [frame for _, frame in kept]
+    assert (np.diff(load_index(path)["offset"].astype(np.int64)) > 0).all()
+    for start_us, stop_us in [(0, 10**9), (250_000, 700_000), (400_000, 500_000)]:
+        expected = [frame for _, frame in _expected_range(kept, start_us, stop_us)]
+        assert [frame for _, frame in read_time_range(path, start_us, stop_us)] == expected
+
+
+def test_build_index(tmp_path):
+    path = tmp_path / "session.gwrec"
+    with FrameRecorder(path, index_interval=16) as recorder:
+        recorder.record([frame for _, frame in _timestamped_frames(500)])
+    index = load_index(path)
+
+    index_path(path).unlink()
+    assert (build_index(path, index_interval=16) == index).all()
+    assert (load_index(path) == index).all()
+    # Every entry points at the record of the frame with its timestamp
+    for timestamp_us, offset in index.tolist():
+        _, _, frame = next(_iter_records_from(path, offset))
+        assert process_byte_data(cobs.decode(frame)).timestamp_us == timestamp_us
+
+
+def test_recording_host_times(tmp_path):
+    path = tmp_path / "session.gwrec"
+    frames = _timestamped_frames(3000)
+    with FrameRecorder(path) as recorder:
+        recorder.record([b"\x05\x01"], time_ns=10**18)
+        for i in range(0, len(frames), 4):
+            # The host reads 4 frames at a time, 1 ms after the device sent the last of them
+            last_us = max(t for t, _ in frames[: i + 4] if t is not None)
+            recorder.record([frame for _, frame in frames[i : i + 4]], time_ns=10**18 + last_us * 1000 + 10**6)
+
+    recording = load_recording(path)
+    assert recording.decode().num_invalid == 1
+    timestamp_us, host_time_ns = recording.host_times()
+    assert timestamp_us.tolist() == [t for t, _ in frames if t is not None]
+    # The smallest latency is in the estimate
+    expected = 10**18 + timestamp_us.astype(np.int64) * 1000 + 10**6
+    assert np.abs(host_time_ns - expected).max() <= 1
+
+
+def test_recording_roundtrip_all_frames(tmp_path):
+    path = tmp_path / "session.gwrec"
+    _record(path, SERIAL_DATA)
+
+    packages = []
+    for _, frame in read_frames(path):
+        try:
+            packages.append(process_byte_data(cobs.decode(frame)))
+        except (cobs.DecodeError, ValueError):
+            pass
+    assert packages == SERIAL_EXPECTED
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_read_frames_in_blocks(tmp_path, compression):
+    path = tmp_path / "session.gwrec"
+    frames = [frame for _, frame in _timestamped_frames(2000)]
+    with FrameRecorder(path, compression=compression) as recorder:
+        for i in range(0, len(frames), 3):
+            recorder.record(frames[i : i + 3], time_ns=i)
+
+    # Much larger than a block, so records are split between blocks
+    assert len(b"".join(frames)) > 3 * (1 << 16)
+    assert list(read_frames(path)) == [(i // 3 * 3, frame) for i, frame in enumerate(frames)]
+    assert b"".join(chunk for _, chunk in iter_chunks(path)) == load_recording(path).chunk
+
+
+def test_truncated_recording(tmp_path):
+    path = tmp_path / "session.gwrec"
+    with FrameRecorder(path) as recorder:
+        recorder.record([b"\x01\x02", b"\x03\x04"], time_ns=10)
+    path.write_bytes(path.read_bytes()[:-1])
+
+    assert list(read_frames(path)) == [(10, b"\x01\x02")]
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("acc_x,acc_y,acc_z\n")
+
+    with pytest.raises(ValueError):
+        FrameRecorder(path)
+    with pytest.raises(ValueError):
+        load_recording(path)
+
+
+def test_iter_chunks(tmp_path):
+    path = tmp_path / "session.gwrec"
+    with FrameRecorder(path) as recorder:
+        recorder.record([b"\x01\x02", b"\x03"], time_ns=10)
+        recorder.record([b"\x04"], time_ns=20)
+
+    assert list(iter_chunks(path)) == [(10, b"\x01\x02\x00\x03\x00"), (20, b"\x04\x00")]
+
+
+def test_replay_clock():
+    assert ReplayClock(None).delay(10**12) == 0.0
+
+    clock = ReplayClock(2.0)
+    assert clock.delay(0) == 0.0
+    assert 0.4 < clock.delay(1_000_000_000) <= 0.5
+
+    with pytest.raises(ValueError):
+        ReplayClock(0)
+
+
+def test_reader_thread_replay(tmp_path):
+    path = tmp_path / "session.gwrec"
+    _record(path, SERIAL_DATA)
+
+    with ReaderThreadReplay.from_path(path, speed=None) as protocol:
+        packages = []
+        while not packages or packages[-1] is not END_OF_STREAM:
+            packages.append(protocol.queue.get(timeout=5))
+
+    assert packages[:-1] == SERIAL_EXPECTED
+
+    # Everything drained from the queue can be passed to a callback, including the end of the stream
+    callback = CsvOutput(tmp_path / "data.csv")
+    callback(packages)
+    for package in packages:
+        callback(package)
+    callback.close()
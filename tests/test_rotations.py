@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from genki_wave.data import DataPackage, Point3d, Quaternion
+from genki_wave.data.organization import decode_data_packages
+from genki_wave.data.points import rotate_vector
+from genki_wave.data.rotations import (
+    as_array,
+    conjugate,
+    derived_motion,
+    multiply,
+    normalize,
+    rotate_vectors,
+    slerp,
+    to_euler,
+)
+from tests.constants import BLUETOOH_EXPECTED, SERIAL_EXPECTED, data_payloads
+
+DATA_PACKAGES = [p for p in SERIAL_EXPECTED + BLUETOOH_EXPECTED if isinstance(p, DataPackage)]
+
+
+def _quaternions(n: int = 50) -> np.ndarray:
+    return np.random.default_rng(0).normal(size=(n, 4))
+
+
+def test_multiply_conjugate_normalize():
+    q1, q2 = _quaternions(), _quaternions()[::-1]
+    for a, b, product in zip(q1, q2, multiply(q1, q2)):
+        expected = Quaternion(*a) * Quaternion(*b)
+        assert product == pytest.approx([expected.w, expected.x, expected.y, expected.z])
+
+    assert conjugate(q1)[0].tolist() == [q1[0, 0], -q1[0, 1], -q1[0, 2], -q1[0, 3]]
+    assert np.linalg.norm(normalize(q1), axis=1) == pytest.approx(np.ones(len(q1)))
+
+
+def test_rotate_vectors():
+    q, v = _quaternions(), np.random.default_rng(1).normal(size=(50, 3))
+    for vector, quat, rotated in zip(v, q, rotate_vectors(v, q)):
+        expected = rotate_vector(Point3d(*vector), Quaternion(*quat))
+        assert rotated == pytest.approx([expected.x, expected.y, expected.z])
+
+
+def test_to_euler():
+    angle = 0.3
+    roll_only = np.array([math.cos(angle / 2), math.sin(angle / 2), 0, 0])
+    assert to_euler(roll_only) == pytest.approx([angle, 0, 0])
+
+    poses = np.array([[p.current_pose.w, p.current_pose.x, p.current_pose.y, p.current_pose.z] for p in DATA_PACKAGES])
+    expected = np.array([[p.euler.roll, p.euler.pitch, p.euler.yaw] for p in DATA_PACKAGES])
+    np.testing.assert_allclose(to_euler(poses), expected, atol=1e-5)
+
+
+def test_slerp():
+    q0, q1 = np.array([1.0, 0, 0, 0]), np.array([0.0, 0, 0, 1])
+    assert slerp(q0, q1, 0.0) == pytest.approx(q0)
+    assert slerp(q0, q1, 1.0) == pytest.approx(q1)
+    assert slerp(q0, q1, 0.5) == pytest.approx([math.sqrt(0.5), 0, 0, math.sqrt(0.5)])
+    # Takes the short way around when the quaternions are in opposite hemispheres
+    assert slerp(q0, -q1, 0.5) == pytest.approx([math.sqrt(0.5), 0, 0, -math.sqrt(0.5)])
+    assert slerp(q0, q0, np.linspace(0, 1, 5)) == pytest.approx(np.tile(q0, (5, 1)))
+
+
+def test_derived_motion():
+    payloads = data_payloads()
+    batch = decode_data_packages(payloads)
+    derived = derived_motion(batch)
+
+    packages = [DataPackage.from_raw_bytes(p) for p in payloads]
+    for name in ("grav", "acc_glob", "linacc_glob"):
+        expected = np.array([[getattr(p, name).x, getattr(p, name).y, getattr(p, name).z] for p in packages])
+        np.testing.assert_allclose(derived[name], expected, rtol=1e-5, atol=1e-5)
+
+    assert derived["acc_glob"].dtype == np.float32
+    assert as_array(batch["acc"]).shape == (len(payloads), 3)
@@ -1,12 +1,24 @@
 import asyncio
+import threading
+import time
 from functools import partial
 
 import pytest
 
-from genki_wave.callbacks import ButtonAndDataPrint
-from genki_wave.protocols import ProtocolAsyncio
-from genki_wave.asyncio_runner import _run_asyncio
-from tests.constants import BLUETOOTH_DATA, SERIAL_DATA
+from genki_wave.callbacks import ButtonAndDataPrint, CallbackRunner, CsvOutput, WaveCallback
+from genki_wave.data.enums import ExecutionMode, OverflowPolicy
+from genki_wave.framing import FrameSplitter
+from genki_wave.protocols import END_OF_STREAM, CommunicateCancel, ProtocolAsyncio, TaggedPackage
+from genki_wave import asyncio_runner
+from genki_wave.asyncio_runner import (
+    _run_asyncio,
+    _run_asyncio_many,
+    producer_bluetooth,
+    producer_replay,
+    run_asyncio_replay,
+)
+from genki_wave.recording import FrameRecorder
+from tests.constants import BLUETOOTH_DATA, BLUETOOH_EXPECTED, SERIAL_DATA, SERIAL_EXPECTED
 
 
 async def producer_mock(protocol, comm, data):
@@ -24,3 +36,289 @@ async def producer_mock(protocol, comm, data):
 def test_run_asyncio(data):
     # An 'integration' test
     _run_asyncio([ButtonAndDataPrint(5)], partial(producer_mock, data=data), ProtocolAsyncio())
+
+
+class CollectCallback(WaveCallback):
+    def __init__(self):
+        self.packages = []
+
+    def _button_handler(self, data):
+        self.packages.append(data)
+
+    def _data_handler(self, data):
+        self.packages.append(data)
+
+
+async def idle_producer_mock(protocol, comm, data):
+    for packet in data:
+        await protocol.data_received(packet)
+
+    # A connected device that stops sending data, only a cancel from outside ends the session
+    threading.Timer(0.05, setattr, (comm, "cancel", True)).start()
+    await comm.wait()
+
+
+def test_run_asyncio_cancel_while_idle():
+    callback = CollectCallback()
+    start = time.perf_counter()
+    _run_asyncio([callback], partial(idle_producer_mock, data=SERIAL_DATA), ProtocolAsyncio())
+
+    assert callback.packages == SERIAL_EXPECTED
+    # Without waiting for the consumer to time out
+    assert time.perf_counter() - start < 5
+
+
+def _record_serial_data(path):
+    framer = FrameSplitter()
+    with FrameRecorder(path) as recorder:
+        for i, input_raw in enumerate(SERIAL_DATA):
+            recorder.record(framer.feed(input_raw), time_ns=i * 10_000_000)
+
+
+@pytest.mark.parametrize("speed", (None, 10.0), ids=["as_fast_as_possible", "scaled"])
+def test_run_asyncio_replay(tmp_path, speed):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    callback = CollectCallback()
+    run_asyncio_replay([callback], path, speed)
+    assert callback.packages == SERIAL_EXPECTED
+
+
+@pytest.mark.parametrize("speed", (None, 0.001), ids=["waiting_on_queue", "waiting_on_sleep"])
+def test_producer_replay_cancel(tmp_path, speed):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    async def _main():
+        # Without a consumer the queue fills up, and replaying slowly sleeps for seconds between the chunks
+        comm, protocol = CommunicateCancel(), ProtocolAsyncio(maxsize=1)
+        asyncio.get_running_loop().call_later(0.05, setattr, comm, "cancel", True)
+        await asyncio.wait_for(producer_replay(protocol, comm, path, speed), timeout=5)
+
+    start = time.perf_counter()
+    asyncio.run(_main())
+    assert time.perf_counter() - start < 1
+
+
+class BatchCollectCallback(CollectCallback):
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def _batch_handler(self, data):
+        self.batch_sizes.append(len(data))
+        super()._batch_handler(data)
+
+
+def test_run_asyncio_replay_batched(tmp_path):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    callback, per_package = BatchCollectCallback(), []
+    run_asyncio_replay([callback, per_package.append], path, speed=None, max_batch_size=8)
+    assert callback.packages == SERIAL_EXPECTED
+    assert per_package == SERIAL_EXPECTED
+    assert max(callback.batch_sizes) <= 8
+    assert len(callback.batch_sizes) < len(SERIAL_EXPECTED)
+
+
+class TaggedCollectCallback(CollectCallback):
+    def __init__(self):
+        super().__init__()
+        self.devices = []
+
+    def _tagged_handler(self, data: TaggedPackage) -> None:
+        self.devices.append(data.device)
+        super()._tagged_handler(data)
+
+
+async def tagged_producer_mock(protocol, comm, data, last):
+    for packet in data:
+        await asyncio.sleep(0.001)
+        await protocol.data_received(packet)
+
+    if last:
+        # Give the other producers time to finish before ending the session
+        await asyncio.sleep(0.05)
+        await protocol.queue.put(END_OF_STREAM)
+
+
+def test_run_asyncio_many():
+    queue = asyncio.Queue()
+    callback = TaggedCollectCallback()
+    producers = [
+        (partial(tagged_producer_mock, data=SERIAL_DATA, last=False), ProtocolAsyncio(device="a", queue=queue)),
+        (partial(tagged_producer_mock, data=BLUETOOTH_DATA, last=True), ProtocolAsyncio(device="b", queue=queue)),
+    ]
+    _run_asyncio_many([callback], producers)
+
+    # The packages of both devices are interleaved, but in order per device
+    per_device = {"a": [], "b": []}
+    for device, package in zip(callback.devices, callback.packages):
+        per_device[device].append(package)
+    assert per_device == {"a": SERIAL_EXPECTED, "b": BLUETOOH_EXPECTED}
+    assert callback.devices != sorted(callback.devices)
+
+
+async def failing_producer_mock(protocol, comm, data):
+    for packet in data:
+        await asyncio.sleep(0.001)
+        await protocol.data_received(packet)
+    raise ConnectionError("Lost the device")
+
+
+def test_run_asyncio_many_producer_fails(caplog):
+    queue = asyncio.Queue()
+    callback = TaggedCollectCallback()
+    producers = [
+        (partial(failing_producer_mock, data=SERIAL_DATA[:2]), ProtocolAsyncio(device="a", queue=queue)),
+        (partial(tagged_producer_mock, data=BLUETOOTH_DATA, last=True), ProtocolAsyncio(device="b", queue=queue)),
+    ]
+    _run_asyncio_many([callback], producers)
+
+    assert set(callback.devices) == {"a", "b"}
+    assert [p for d, p in zip(callback.devices, callback.packages) if d == "b"] == BLUETOOH_EXPECTED
+    assert "The producer of a failed" in caplog.text
+
+
+class DisconnectingClientMock:
+    """Stands in for `BleakClient`, sends `data` once notifications start and then disconnects"""
+
+    def __init__(self, address, disconnected_callback, data):
+        self.address = address
+        self.disconnected_callback = disconnected_callback
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def start_notify(self, uuid, callback):
+        async def _send():
+            for packet in self.data:
+                await asyncio.sleep(0.001)
+                await callback(uuid, packet)
+            self.disconnected_callback(self)
+
+        asyncio.ensure_future(_send())
+
+    async def write_gatt_char(self, uuid, data, response):
+        pass
+
+
+def test_run_asyncio_many_bluetooth_disconnects(monkeypatch, caplog):
+    monkeypatch.setattr(asyncio_runner, "BleakClient", partial(DisconnectingClientMock, data=BLUETOOTH_DATA))
+    queue = asyncio.Queue()
+    callback = TaggedCollectCallback()
+    producers = [
+        (partial(producer_bluetooth, ble_address="a"), ProtocolAsyncio(device="a", queue=queue)),
+        (partial(tagged_producer_mock, data=SERIAL_DATA, last=True), ProtocolAsyncio(device="b", queue=queue)),
+    ]
+    _run_asyncio_many([callback], producers)
+
+    per_device = {"a": [], "b": []}
+    for device, package in zip(callback.devices, callback.packages):
+        per_device[device].append(package)
+    assert per_device == {"a": BLUETOOH_EXPECTED, "b": SERIAL_EXPECTED}
+    assert "ConnectionError" in caplog.text
+
+
+def test_run_asyncio_many_all_producers_fail():
+    queue = asyncio.Queue()
+    producers = [
+        (partial(failing_producer_mock, data=SERIAL_DATA[:2]), ProtocolAsyncio(device="a", queue=queue)),
+        (partial(failing_producer_mock, data=BLUETOOTH_DATA[:2]), ProtocolAsyncio(device="b", queue=queue)),
+    ]
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError):
+        _run_asyncio_many([], producers)
+    # The consumer stops once the streams of both devices ended, without waiting to time out
+    assert time.perf_counter() - start < 5
+
+
+def test_run_asyncio_many_requires_shared_queue():
+    producers = [(producer_mock, ProtocolAsyncio()), (producer_mock, ProtocolAsyncio())]
+    with pytest.raises(ValueError):
+        _run_asyncio_many([], producers)
+
+
+class SlowCollectCallback(CollectCallback):
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path
+
+    def _data_handler(self, data):
+        time.sleep(0.001)
+        super()._data_handler(data)
+
+    def close(self):
+        if self.path is not None:
+            self.path.write_text(str(len(self.packages)))
+
+
+@pytest.mark.parametrize("mode", [ExecutionMode.INLINE, ExecutionMode.THREAD])
+def test_callback_runner(tmp_path, mode):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    fast, slow = CollectCallback(), SlowCollectCallback()
+    runner = CallbackRunner(slow, mode)
+    run_asyncio_replay([fast, runner], path, speed=None)
+
+    assert fast.packages == SERIAL_EXPECTED
+    # `close` waits for the worker to catch up
+    assert slow.packages == SERIAL_EXPECTED
+    assert runner.lag.count == len(SERIAL_EXPECTED)
+    assert runner.lag.max >= 0.001
+
+
+@pytest.mark.parametrize("mode", [ExecutionMode.INLINE, ExecutionMode.THREAD])
+def test_callback_runner_function_batched(tmp_path, mode):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    packages = []
+    run_asyncio_replay([CallbackRunner(packages.append, mode)], path, speed=None, max_batch_size=4)
+    assert packages == SERIAL_EXPECTED, "Expected a plain function to get one package at a time"
+
+
+@pytest.mark.parametrize("lazy, max_batch_size", [(False, None), (True, None), (True, 4)])
+def test_callback_runner_process(tmp_path, lazy, max_batch_size):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    # The callback runs in another process, so its packages are only visible through what it writes
+    count_path = tmp_path / "count.txt"
+    runner = CallbackRunner(SlowCollectCallback(count_path), ExecutionMode.PROCESS)
+    run_asyncio_replay([runner], path, speed=None, lazy=lazy, max_batch_size=max_batch_size)
+
+    assert count_path.read_text() == str(len(SERIAL_EXPECTED))
+    if max_batch_size is None:
+        assert runner.lag.count == len(SERIAL_EXPECTED)
+
+
+def test_callback_runner_process_not_picklable(tmp_path):
+    csv_output = CsvOutput(tmp_path / "data.csv")
+    with pytest.raises(ValueError):
+        CallbackRunner(csv_output, ExecutionMode.PROCESS)
+    csv_output.close()
+
+    runner = CallbackRunner(CollectCallback(), ExecutionMode.PROCESS)
+    runner(threading.Lock())
+    with pytest.raises(RuntimeError):
+        runner.close()
+
+
+def test_callback_runner_drops_when_full(tmp_path):
+    path = tmp_path / "session.gwrec"
+    _record_serial_data(path)
+
+    slow = SlowCollectCallback()
+    runner = CallbackRunner(slow, ExecutionMode.THREAD, maxsize=1, policy=OverflowPolicy.DROP_NEWEST)
+    run_asyncio_replay([runner], path, speed=None)
+
+    assert runner.num_dropped > 0
+    assert len(slow.packages) + runner.num_dropped == len(SERIAL_EXPECTED)